@@ -11,9 +11,13 @@ setup(
     long_description = open('README.md').read(),
     license = 'LICENSE',
     packages = ['votecounter', 'votecounter.test' ],
+    python_requires = '>=3.11',
     install_requires = [
-        'numpy', 'pandas', 'requests', 'pathlib', 'wget', 'asn1tools', 'ratelimiter', 'tqdm'
+        'numpy', 'pandas', 'requests', 'aiohttp', 'pathlib', 'wget', 'asn1tools', 'tqdm'
     ],
+    extras_require = {
+        'parquet': [ 'pyarrow' ],
+    },
 
     classifiers = [
         'Development Status :: 3 - Alpha',
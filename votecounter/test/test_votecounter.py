@@ -9,6 +9,18 @@ from .. import votecounter as vc
 from urllib.error import URLError
 from asn1tools.codecs.ber import DecodeTagError
 
+import asyncio
+import gc
+import asn1tools
+import http.client
+import concurrent.futures
+import types
+import copy
+import dataclasses
+from aiohttp import web
+import aiohttp
+import pandas as pd
+
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -27,6 +39,67 @@ def rmtree(f: vc.Path):
 def does_not_raise():
     yield
 
+# instantes das requisições liberadas por um orçamento (executado em outro processo ou thread)
+def reserva_requisicoes(orcamento, n = 10):
+    instantes = []
+    for _ in range(n):
+        vc.time.sleep(orcamento.reserva())
+        instantes.append(vc.time.time())
+    return instantes
+
+def maximo_por_janela(instantes, janela):
+    instantes = sorted(instantes)
+    return max(sum(1 for t in instantes[i:] if t < inicio + janela - 1e-3) for i, inicio in enumerate(instantes))
+
+# boletim de urna sintético (mesmo layout dos arquivos do TSE), para testes sem acesso à rede
+def gera_bu_sintetico(conv, municipio = 58017, zona = 116, secao = 1, aptos = 300):
+    cabecalho = {'dataGeracao': '20221002T170000', 'idEleitoral': ('idPleito', 406)}
+    carga = {'numeroInternoUrna': 1234567, 'numeroSerieFC': b'\x00\x01\x02\x03', 'dataHoraCarga': '20220920T100000', 'codigoCarga': '123.456.789'}
+    identificacao = {'municipioZona': {'municipio': municipio, 'zona': zona}, 'local': 1015, 'secao': secao}
+    urna = {
+        'tipoUrna': 'secao', 'versaoVotacao': '8.26.0.0 - onça-pintada',
+        'correspondenciaResultado': {'identificacao': ('identificacaoSecaoEleitoral', identificacao), 'carga': carga},
+        'tipoArquivo': 'votacaoUE', 'numeroSerieFV': b'\x0a\x0b\x0c\x0d',
+    }
+    def voto(tipo, qtd, partido = None, codigo = None):
+        v = {'tipoVoto': tipo, 'quantidadeVotos': qtd, 'assinatura': bytes(range(64))}
+        if partido is not None:
+            v['identificacaoVotavel'] = {'partido': partido, 'codigo': codigo}
+        return v
+    def cargo(codigo, votos):
+        return {'codigoCargo': ('cargoConstitucional', codigo), 'ordemImpressao': 1, 'votosVotaveis': votos}
+    bu = {
+        'cabecalho': cabecalho, 'fase': 'oficial', 'urna': urna,
+        'identificacaoSecao': identificacao, 'dataHoraEmissao': '20221002T170512',
+        'dadosSecaoSA': ('dadosSecao', {'dataHoraAbertura': '20221002T080000', 'dataHoraEncerramento': '20221002T170000'}),
+        'qtdEleitoresLibCodigo': 3, 'qtdEleitoresCompBiometrico': 200,
+        'resultadosVotacaoPorEleicao': [
+            {'idEleicao': 544, 'qtdEleitoresAptos': aptos, 'resultadosVotacao': [
+                {'tipoCargo': 'majoritario', 'qtdComparecimento': 250, 'totaisVotosCargo': [
+                    cargo('presidente', [voto('nominal', 120, 13, 13), voto('nominal', 110, 22, 22), voto('branco', 8), voto('nulo', 12)]),
+                ]},
+            ]},
+            {'idEleicao': 546, 'qtdEleitoresAptos': aptos, 'resultadosVotacao': [
+                {'tipoCargo': 'majoritario', 'qtdComparecimento': 250, 'totaisVotosCargo': [
+                    cargo('governador', [voto('nominal', 100, 22, 22), voto('nominal', 90, 40, 40), voto('branco', 30), voto('nulo', 30)]),
+                    cargo('senador', [voto('nominal', 150, 22, 222), voto('nulo', 100)]),
+                ]},
+                {'tipoCargo': 'proporcional', 'qtdComparecimento': 250, 'totaisVotosCargo': [
+                    cargo('deputadoFederal', [voto('nominal', 100, 22, 2222), voto('legenda', 50, 13, 13), voto('branco', 100)]),
+                    cargo('deputadoEstadual', [voto('nominal', 200, 50, 50123), voto('nulo', 50)]),
+                ]},
+            ]},
+        ],
+        'chaveAssinaturaVotosVotavel': bytes(range(32)),
+    }
+    conteudo = conv.encode('EntidadeBoletimUrna', bu)
+    envelope = {
+        'cabecalho': cabecalho, 'fase': 'oficial',
+        'identificacao': ('identificacaoSecaoEleitoral', identificacao),
+        'tipoEnvelope': 'envelopeBoletimUrna', 'conteudo': conteudo,
+    }
+    return conv.encode('EntidadeEnvelopeGenerico', envelope)
+
 @pytest.fixture(scope = 'session')
 def get_regions():
     brasil = vc.Country(name = 'Brasil')
@@ -157,6 +230,41 @@ def remove_vm_files(get_urna):
     yield
     rmtree(BU_ROOTDIR_TEST)
 
+@pytest.fixture
+def remove_test_files():
+    yield
+    if BU_ROOTDIR_TEST.exists():
+        rmtree(BU_ROOTDIR_TEST)
+
+# controlador de requisições sem limite de taxa, para os testes com servidor local
+@pytest.fixture
+def controlador_local(monkeypatch):
+    controlador = vc.ControladorTaxa(taxa_inicial = 10_000, taxa_max = 10_000, espera_base = 0.01)
+    monkeypatch.setattr(vc, 'controlador_taxa', controlador)
+    return controlador
+
+@pytest.fixture(scope = 'function')
+def get_urnas_sinteticas(get_states, get_election, remove_test_files):
+    contest = get_election.contest
+    conv = vc.get_asn1_spec()
+    
+    municipio_obj = vc.City(id = 58017, name = 'Niterói', state = get_states['RJ'])
+    zona_obj = vc.ElectionZone(id = 116, city = municipio_obj)
+
+    urnas = []
+    for id_secao in range(1, 81):
+        secao_obj = vc.ElectionSection(id = id_secao, zone = zona_obj, contest = contest)
+        urna_obj = vc.VotingMachine(section = secao_obj)
+
+        caminho_dl = urna_obj.get_info_download_path(BU_ROOTDIR_TEST)
+        caminho_dl.mkdir(parents = True, exist_ok = True)
+        urna_obj.caminho_bu = caminho_dl.joinpath(f'o00406-5801701160{id_secao:0>3d}.bu')
+        urna_obj.caminho_bu.write_bytes(gera_bu_sintetico(conv, secao = id_secao, aptos = 300 + id_secao))
+
+        urnas.append(urna_obj)
+    
+    return urnas
+
 
 class TestState:
     def test_states_url_resultados_parciais(self, get_regions, get_states, get_election):
@@ -289,7 +397,7 @@ class TestState:
             pleito = contest.contest_id,
         )
 
-        assert isinstance(secoes, dict)
+        assert isinstance(secoes, vc.IndiceGeografico)
         assert len(vc.VotingMachine.all_vms) == len(secoes.keys())
 
 
@@ -401,12 +509,1604 @@ class TestVotingMachine:
         assert isinstance(urna.envelope_urna, dict)
         assert isinstance(urna.boletim_urna, dict)
     
+    def test_url_download_urna_hash_api_async(self, get_urna):
+        urna = get_urna
+
+        url = asyncio.run(urna.get_url_download_urna_async(info = 'bu'))
+        restapi = vc.get_rl(url)
+        assert 200 <= restapi.status_code < 300
+        assert urna.hash_urna is not None
+        assert urna.hash_dt.year == urna.section.contest.year
+
+    def test_download_bu_async(self, get_urna, remove_vm_files):
+        urna = get_urna
+
+        arq = asyncio.run(urna.download_bu_async(caminho_dl_root = BU_ROOTDIR_TEST))
+
+        assert arq.exists()
+        assert arq == urna.get_info_download_path(BU_ROOTDIR_TEST).joinpath(urna.hash_urna, arq.name)
+
     def test_download_multiple(self, get_urnas):
         pass
 
     def test_df_votes(self):
         pass
 
+class TestAsn1Spec:
+
+    def test_spec_compilada_uma_vez(self, remove_test_files):
+        cache_dir = BU_ROOTDIR_TEST.joinpath('asn1')
+
+        spec1 = vc.get_asn1_spec(cache_dir = cache_dir)
+        spec2 = vc.get_asn1_spec(cache_dir = cache_dir)
+
+        assert spec1 is spec2
+
+    def test_spec_cache_disco(self, remove_test_files):
+        cache_dir = BU_ROOTDIR_TEST.joinpath('asn1')
+        vc._asn1_specs.clear()
+
+        vc.get_asn1_spec(cache_dir = cache_dir)
+        arqs_cache = list(cache_dir.glob('*.pickle'))
+        assert len(arqs_cache) == 1
+
+        # novo 'processo': cache em memória vazio, especificação lida do disco
+        vc._asn1_specs.clear()
+        spec = vc.get_asn1_spec(cache_dir = cache_dir)
+        assert 'EntidadeBoletimUrna' in spec.types
+
+
+class TestProcessaMultiple:
+
+    def test_processa_multiple_paralelo(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas
+
+        vc.VotingMachine.processa_multiple_bu(urnas, workers = 2, min_batch = 1, progressbar = False)
+
+        for urna in urnas:
+            assert urna.stale_data is False
+            assert urna.boletim_urna['identificacaoSecao']['secao'] == urna.section.id
+            assert urna.boletim_urna['resultadosVotacaoPorEleicao'][0]['qtdEleitoresAptos'] == 300 + urna.section.id
+            assert 'conteudo' not in urna.envelope_urna
+
+    def test_processa_multiple_serial(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas
+
+        # lote pequeno: decodificação em série
+        vc.VotingMachine.processa_multiple_bu(urnas[:3], workers = 2, progressbar = False)
+
+        assert all(isinstance(urna.boletim_urna, dict) for urna in urnas[:3])
+        assert all(urna.boletim_urna is None for urna in urnas[3:])
+
+
+class TestDownloadJobs:
+
+    def test_download_jobs_limitado(self, monkeypatch, remove_test_files, controlador_local):
+        BU_ROOTDIR_TEST.mkdir(parents = True, exist_ok = True)
+        tentativas = {}
+        threads_ativas = set()
+
+        def wget_download_falso(url, out):
+            threads_ativas.add(vc.threading.get_ident())
+            tentativas[url] = tentativas.get(url, 0) + 1
+            # urls pares falham na primeira tentativa; 'x29' falha sempre
+            if url.endswith('x29') or (int(url[-2:]) % 2 == 0 and tentativas[url] == 1):
+                raise URLError('falha simulada')
+            vc.Path(out).write_bytes(b'bu')
+
+        monkeypatch.setattr(vc.wget, 'download', wget_download_falso)
+
+        jobs = (
+            vc.DownloadJob(url = f'https://example.invalid/x{i:0>2d}', bu_path = BU_ROOTDIR_TEST.joinpath(f'{i}.bu'))
+            for i in range(30)
+        )
+        concluidos = vc.download_jobs(jobs, workers = 4, max_retries = 2)
+
+        assert len(concluidos) == 30
+        assert len(threads_ativas) <= 4
+
+        falhas = [ job for job in concluidos if not job.done ]
+        assert [ job.url for job in falhas ] == ['https://example.invalid/x29']
+        assert falhas[0].attempts == 2
+        assert isinstance(falhas[0].error, URLError)
+        assert all(job.bu_path.exists() for job in concluidos if job.done)
+
+    def test_download_jobs_erros_inesperados(self, monkeypatch, remove_test_files, controlador_local):
+        BU_ROOTDIR_TEST.mkdir(parents = True, exist_ok = True)
+
+        def wget_download_falso(url, out):
+            if url.endswith('x03'):
+                raise http.client.IncompleteRead(b'bu')
+            vc.Path(out).write_bytes(b'bu')
+
+        monkeypatch.setattr(vc.wget, 'download', wget_download_falso)
+
+        jobs = [ vc.DownloadJob(url = f'https://example.invalid/x{i:0>2d}', bu_path = BU_ROOTDIR_TEST.joinpath(f'{i}.bu')) for i in range(8) ]
+        concluidos = vc.download_jobs(jobs, workers = 2, max_retries = 2)
+
+        # erro fora de (URLError, OSError): registrado no trabalho, sem travar as demais threads
+        falhas = [ job for job in concluidos if not job.done ]
+        assert len(concluidos) == 8 and [ job.url for job in falhas ] == ['https://example.invalid/x03']
+        assert isinstance(falhas[0].error, http.client.IncompleteRead) and falhas[0].attempts == 2
+
+        # erro no iterador de trabalhos: levantado depois dos trabalhos já gerados
+        def gera_jobs():
+            yield from jobs[:3]
+            raise ValueError('falha simulada')
+
+        with pytest.raises(ValueError):
+            vc.download_jobs(gera_jobs(), workers = 2)
+
+
+class TestControladorTaxa:
+
+    @staticmethod
+    def resposta(status, headers = None):
+        return types.SimpleNamespace(status_code = status, headers = headers or {})
+
+    def test_aimd(self):
+        controlador = vc.ControladorTaxa(taxa_inicial = 10, taxa_max = 12, latencia_alvo = 60)
+
+        for _ in range(100):
+            controlador.registra(True, latencia = 0.1)
+        assert controlador.taxa == 12
+
+        # falhas simultâneas: uma única redução
+        controlador.registra(False)
+        controlador.registra(False, limitada = True)
+        assert controlador.taxa == 6
+        # resposta lenta também é sinal de congestionamento
+        controlador._ultima_reducao = float('-inf')
+        controlador.registra(True, latencia = 120)
+        assert controlador.taxa == 3
+
+        stats = controlador.stats()
+        assert (stats['errors'], stats['throttled'], stats['circuit']) == (2, 1, 'fechado')
+
+    def test_retentativas(self):
+        controlador = vc.ControladorTaxa(taxa_inicial = 1000, espera_base = 0.01)
+        respostas = iter([ self.resposta(503), self.resposta(429, {'Retry-After': '0.05'}), self.resposta(200) ])
+
+        inicio = vc.time.monotonic()
+        assert controlador.requisita(lambda: next(respostas), max_tentativas = 3).status_code == 200
+        assert vc.time.monotonic() - inicio >= 0.05
+        assert controlador.stats()['retries'] == 2 and controlador.stats()['errors'] == 2
+
+        # erros do cliente (4xx) não são repetidos
+        chamadas = []
+        resposta_404 = controlador.requisita(lambda: chamadas.append(1) or self.resposta(404))
+        assert resposta_404.status_code == 404 and len(chamadas) == 1
+
+        # 5xx em todas as tentativas: retorna a última resposta
+        assert controlador.requisita(lambda: self.resposta(502), max_tentativas = 2).status_code == 502
+
+    def test_circuito(self):
+        controlador = vc.ControladorTaxa(taxa_inicial = 1000, espera_base = 0.001, limite_falhas = 3, espera_circuito = 0.2)
+
+        def fora_do_ar():
+            raise vc.requests.ConnectionError('fora do ar')
+
+        with pytest.raises(vc.requests.ConnectionError):
+            controlador.requisita(fora_do_ar, max_tentativas = 3)
+        
+        # circuito aberto: requisições recusadas sem chegar ao servidor
+        with pytest.raises(vc.CircuitoAberto):
+            controlador.requisita(lambda: self.resposta(200))
+        assert controlador.stats()['circuit'] == 'aberto' and controlador.stats()['rejected'] == 1
+
+        # após a espera, uma requisição de teste fecha o circuito
+        vc.time.sleep(0.2)
+        assert controlador.requisita(lambda: self.resposta(200)).status_code == 200
+        assert controlador.stats()['circuit'] == 'fechado'
+
+    def test_circuito_requisicao_de_teste(self):
+        controlador = vc.ControladorTaxa(taxa_inicial = 1000, limite_falhas = 1, espera_circuito = 0)
+
+        _, teste_anterior = controlador._reserva_local()  # em andamento quando o circuito abre
+        controlador.registra(False)
+        assert controlador.circuito == 'aberto' and not teste_anterior
+
+        _, teste = controlador._reserva_local()
+        assert teste and controlador.circuito == 'meio-aberto'
+
+        # requisições anteriores não fecham nem reabrem o circuito, e não liberam outra requisição de teste
+        controlador.registra(True, teste = teste_anterior)
+        controlador.registra(False, teste = teste_anterior)
+        assert controlador.circuito == 'meio-aberto'
+        with pytest.raises(vc.CircuitoAberto):
+            controlador._reserva_local()
+
+        controlador.registra(True, teste = teste)
+        assert controlador.circuito == 'fechado'
+
+        with pytest.raises(ValueError):
+            controlador.requisita(lambda: self.resposta(200), max_tentativas = 0)
+
+    def test_limites_padrao(self):
+        # o teto global e o cliente assíncrono não limitam a taxa adaptativa abaixo de `taxa_max`
+        controlador = vc.ControladorTaxa()
+        assert vc.OrcamentoRequisicoes().max_calls / vc.REQ_PERIOD >= controlador.taxa_max > controlador.taxa
+        assert not isinstance(vc.TSEClient().rate_limiter, vc.AsyncRateLimiter)
+        assert isinstance(vc.TSEClient(max_calls = 5).rate_limiter, vc.AsyncRateLimiter)
+
+        for _ in range(2000):
+            controlador.registra(True, latencia = 0.1)
+        assert controlador.taxa == controlador.taxa_max
+
+    def test_erro_local_neutro(self):
+        controlador = vc.ControladorTaxa(taxa_inicial = 10, espera_circuito = 0)
+
+        def disco_cheio():
+            raise OSError('disco cheio')
+
+        # erros locais não são repetidos, e não alteram taxa, contadores nem circuito
+        for _ in range(3):
+            with pytest.raises(OSError):
+                controlador.requisita(disco_cheio)
+        stats = controlador.stats()
+        assert (stats['rate'], stats['errors'], stats['retries'], stats['circuit']) == (10, 0, 0, 'fechado')
+
+        # requisição de teste com erro local: o circuito continua meio-aberto e aceita outra requisição de teste
+        controlador.circuito = 'aberto'
+        with pytest.raises(OSError):
+            controlador.requisita(disco_cheio)
+        assert controlador.stats()['circuit'] == 'meio-aberto'
+        assert controlador.requisita(lambda: self.resposta(200)).status_code == 200
+        assert controlador.stats()['circuit'] == 'fechado'
+
+
+class TestOrcamentoRequisicoes:
+
+    def test_orcamento_arquivo_processos(self, tmp_path):
+        orcamento = vc.OrcamentoArquivo(tmp_path / 'orcamento', max_calls = 5, period = 0.1)
+
+        with vc.multiprocessing.Pool(3) as pool:
+            instantes = sum(pool.map(reserva_requisicoes, [orcamento] * 3), [])
+
+        # 30 requisições de 3 processos: 5 a cada 0.1s no total
+        assert len(instantes) == 30
+        assert max(instantes) - min(instantes) >= 29 * 0.1 / 5 - 0.01
+        assert maximo_por_janela(instantes, 0.1) <= 5 + 1
+
+    def test_coordenador(self):
+        with vc.CoordenadorOrcamento(vc.OrcamentoRequisicoes(max_calls = 5, period = 0.1), porta = 0) as coordenador:
+            orcamento = vc.OrcamentoRemoto(coordenador.endereco)
+            with concurrent.futures.ThreadPoolExecutor(3) as executor:
+                instantes = sum(executor.map(reserva_requisicoes, [orcamento] * 3), [])
+
+        assert len(instantes) == 30
+        assert max(instantes) - min(instantes) >= 29 * 0.1 / 5 - 0.01
+        assert maximo_por_janela(instantes, 0.1) <= 5 + 1
+
+    def test_controlador_com_orcamento(self, tmp_path):
+        orcamento = vc.OrcamentoArquivo(tmp_path / 'orcamento', max_calls = 5, period = 0.1)
+        # dois controladores (ex.: dois processos) com taxa local alta dividem o mesmo orçamento
+        controladores = [ vc.ControladorTaxa(taxa_inicial = 1000, orcamento = orcamento) for _ in range(2) ]
+
+        instantes = []
+        for _ in range(10):
+            for controlador in controladores:
+                controlador.requisita(lambda: instantes.append(vc.time.time()))
+        
+        assert max(instantes) - min(instantes) >= 19 * 0.1 / 5 - 0.01
+        assert maximo_por_janela(instantes, 0.1) <= 5 + 1
+
+    def test_configura_orcamento(self, tmp_path, monkeypatch):
+        monkeypatch.delenv(vc.ORCAMENTO_ENV, raising = False)
+        monkeypatch.setattr(vc.controlador_taxa, 'orcamento', None)
+
+        # o orçamento entre processos é opcional: sem configuração, nenhum arquivo de trava é usado
+        assert vc.ControladorTaxa().orcamento is None
+
+        monkeypatch.chdir(tmp_path)
+        orcamento = vc.configura_orcamento(caminho = vc.Path('orcamento'))
+        assert vc.controlador_taxa.orcamento is orcamento
+        assert orcamento.caminho == tmp_path / 'orcamento' and orcamento.caminho.is_absolute()
+        assert orcamento.reserva() == 0.0 and orcamento.caminho.exists()
+
+    def test_controlador_async_orcamento_bloqueante(self):
+        threads_reserva = []
+
+        class OrcamentoLento:
+            def reserva(self):
+                # ex.: espera pela trava do arquivo de orçamento
+                threads_reserva.append(vc.threading.get_ident())
+                vc.time.sleep(0.2)
+                return 0.0
+
+        controlador = vc.ControladorTaxa(taxa_inicial = 1000, orcamento = OrcamentoLento())
+
+        async def resposta():
+            return types.SimpleNamespace(status_code = 200, headers = {})
+
+        async def cenario():
+            ticks = []
+
+            async def relogio():
+                for _ in range(10):
+                    ticks.append(vc.time.monotonic())
+                    await asyncio.sleep(0.02)
+
+            await asyncio.gather(controlador.requisita_async(resposta), controlador.requisita_async(resposta), relogio())
+            return ticks
+
+        ticks = asyncio.run(cenario())
+
+        # a reserva no orçamento não bloqueia o event loop
+        assert vc.threading.get_ident() not in threads_reserva and len(threads_reserva) == 2
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.15
+
+
+class TestCacheRequisicoes:
+
+    def test_coalescencia_threads(self, monkeypatch):
+        chamadas = []
+
+        def get_rl_falso(url):
+            chamadas.append(url)
+            vc.time.sleep(0.1)
+            return types.SimpleNamespace(json = lambda: {'url': url})
+
+        monkeypatch.setattr(vc, 'get_rl', get_rl_falso)
+        cache = vc.CacheRequisicoes(ttl = 0.3)
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            respostas = list(executor.map(cache.get_json, ['u1'] * 8 + ['u2'] * 4))
+        
+        # uma requisição por url; os demais chamadores recebem a mesma resposta
+        assert sorted(chamadas) == ['u1', 'u2']
+        assert all(r is respostas[0] for r in respostas[:8])
+        assert cache.get_json('u1') is respostas[0]
+        stats = cache.stats()
+        assert stats['misses'] == 2 and stats['hits'] + stats['coalesced'] == 11
+
+        # resposta expirada: nova requisição
+        vc.time.sleep(0.3)
+        cache.get_json('u1')
+        assert chamadas.count('u1') == 2
+
+    def test_coalescencia_async(self):
+        chamadas = []
+
+        class ClienteFalso:
+            async def get_json(self, url):
+                chamadas.append(url)
+                await asyncio.sleep(0.05)
+                if url == 'erro':
+                    raise aiohttp.ClientError('falha simulada')
+                return {'url': url}
+
+        cache = vc.CacheRequisicoes(ttl = 60)
+
+        async def cenario():
+            cliente = ClienteFalso()
+            respostas = await asyncio.gather(*[ cache.get_json_async('u1', cliente) for _ in range(10) ])
+            erros = await asyncio.gather(*[ cache.get_json_async('erro', cliente) for _ in range(3) ], return_exceptions = True)
+            return respostas, erros
+
+        respostas, erros = asyncio.run(cenario())
+
+        assert chamadas == ['u1', 'erro']
+        assert all(r is respostas[0] for r in respostas)
+        # erros não ficam guardados: todos os chamadores recebem a exceção
+        assert all(isinstance(e, aiohttp.ClientError) for e in erros)
+        assert cache.stats()['entries'] == 1
+
+
+class TestTSEClient:
+
+    def test_async_rate_limiter(self):
+        limiter = vc.AsyncRateLimiter(max_calls = 10, period = 0.2)
+
+        async def chamadas():
+            async def chamada():
+                async with limiter:
+                    return vc.time.monotonic()
+            
+            return await asyncio.gather(*[ chamada() for _ in range(25) ])
+        
+        instantes = sorted(asyncio.run(chamadas()))
+
+        # 25 chamadas, 10 a cada 0.2s: ao menos duas janelas de espera
+        assert instantes[-1] - instantes[0] >= 0.4 - 1e-3
+        # nenhuma janela de 0.2s contém mais de 10 chamadas
+        assert all(instantes[i + 10] - instantes[i] >= 0.2 - 1e-3 for i in range(len(instantes) - 10))
+
+    def test_client_servidor_local(self, remove_test_files, controlador_local):
+        BU_ROOTDIR_TEST.mkdir(parents = True, exist_ok = True)
+
+        async def handler_json(request):
+            return web.json_response({'hashes': [{'hash': 'abc', 'dr': '02/10/2022', 'hr': '17:00:00'}]})
+        
+        async def handler_bu(request):
+            return web.Response(body = b'\x00' * 100_000)
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/aux.json', handler_json)
+            app.router.add_get('/arq.bu', handler_bu)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            try:
+                async with vc.TSEClient(max_connections = 4) as client:
+                    jsons = await asyncio.gather(*[ 
+                        client.get_json(f'http://127.0.0.1:{porta}/aux.json') for _ in range(20) 
+                    ])
+                    arq = await client.download(f'http://127.0.0.1:{porta}/arq.bu', BU_ROOTDIR_TEST.joinpath('arq.bu'))
+            finally:
+                await runner.cleanup()
+            
+            return jsons, arq
+        
+        jsons, arq = asyncio.run(cenario())
+
+        assert all(jsondata['hashes'][0]['hash'] == 'abc' for jsondata in jsons)
+        assert arq.stat().st_size == 100_000
+
+
+class TestPipeline:
+
+    def test_pipeline_servidor_local(self, get_urnas_sinteticas, monkeypatch, controlador_local):
+        urnas = get_urnas_sinteticas[:20]
+        conteudos = { urna.section.id: urna.caminho_bu.read_bytes() for urna in urnas }
+        for urna in urnas:
+            urna.caminho_bu.unlink()
+            urna.caminho_bu = None
+
+        async def handler_bu(request):
+            id_secao = int(request.match_info['secao'])
+            if id_secao == 13:
+                return web.Response(status = 404)
+            return web.Response(body = conteudos[id_secao])
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/bu/{secao}/{nome}', handler_bu)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            async def url_local(self, info, hash_urna = None, client = None, **kwargs):
+                return f'http://127.0.0.1:{porta}/bu/{self.section.id}/o00406-{self.section.id:0>4d}.bu'
+            
+            monkeypatch.setattr(vc.VotingMachine, 'get_url_download_urna_async', url_local)
+
+            try:
+                async with vc.TSEClient(max_calls = 1000) as client:
+                    results = [ 
+                        result async for result in vc.VotingMachine.pipeline_bu_async(
+                            urnas, caminho_dl_root = BU_ROOTDIR_TEST, client = client, 
+                            download_workers = 4, decode_workers = 2, queue_size = 4
+                        ) 
+                    ]
+            finally:
+                await runner.cleanup()
+            
+            return results
+        
+        results = asyncio.run(cenario())
+
+        assert len(results) == len(urnas)
+        
+        falhas = [ result for result in results if result.error is not None ]
+        assert [ result.vm.section.id for result in falhas ] == [13]
+
+        for result in results:
+            if result.error is None:
+                assert result.vm.boletim_urna['identificacaoSecao']['secao'] == result.vm.section.id
+                assert (result.totalizacao['secao'] == result.vm.section.id).all()
+                assert result.stats_df['eleitores_aptos'].iloc[0] == 300 + result.vm.section.id
+
+    def test_pipeline_projecao_apos_despejo(self, get_urnas_sinteticas, tmp_path, monkeypatch):
+        urnas = get_urnas_sinteticas[:3]
+
+        async def url_local(self, info, hash_urna = None, client = None, **kwargs):
+            return f'https://example.invalid/bu/{self.section.id}'
+
+        async def obtem_local(vm, url, client, caminho_dl_root = None):
+            return vm.caminho_bu
+
+        monkeypatch.setattr(vc.VotingMachine, 'get_url_download_urna_async', url_local)
+        monkeypatch.setattr(vc.VotingMachine, 'bu_store', types.SimpleNamespace(obtem_async = obtem_local))
+
+        async def cenario():
+            async with vc.TSEClient() as client:
+                return [ 
+                    result async for result in vc.VotingMachine.pipeline_bu_async(
+                        urnas, client = client, decode_workers = 1, tabula = False, projecao = vc.PROJECAO_TOTAIS
+                    ) 
+                ]
+
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = vc.MemoriaBoletins(limite_entradas = 1, diretorio = tmp_path)
+        try:
+            results = asyncio.run(cenario())
+            assert all(result.error is None for result in results)
+
+            # um boletim despejado da memória é recarregado com a projeção usada no pipeline
+            for urna in urnas:
+                assert urna.boletim_urna == urna.processa_bu(projecao = vc.PROJECAO_TOTAIS)[1]
+                assert urna.envelope_urna == {}
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+
+class TestStaleness:
+
+    def test_staleness_condicional(self, get_urnas_sinteticas, monkeypatch, controlador_local):
+        urnas = get_urnas_sinteticas[:30]
+        hashes = { urna.section.id: ('h0', '02/10/2022', '17:00:00') for urna in urnas }
+        respostas_completas = []
+        secoes_com_erro = set()
+
+        async def handler_aux(request):
+            id_secao = int(request.match_info['secao'])
+            if id_secao in secoes_com_erro:
+                return web.Response(status = 404)
+
+            hash_urna, data, hora = hashes[id_secao]
+            etag = f'"{id_secao}-{hash_urna}"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status = 304)
+            
+            respostas_completas.append(id_secao)
+            return web.json_response(
+                {'hashes': [{'hash': hash_urna, 'dr': data, 'hr': hora}]}, 
+                headers = {'ETag': etag}
+            )
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/aux/{secao}', handler_aux)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            monkeypatch.setattr(
+                vc.VotingMachine, 'get_url_info_urna', 
+                lambda self: f'http://127.0.0.1:{porta}/aux/{self.section.id}'
+            )
+
+            try:
+                async with vc.TSEClient(max_calls = 1000) as client:
+                    varredura = lambda: vc.VotingMachine.check_multiple_staleness_async(urnas, client = client)
+                    
+                    mudou_1, falhas_1 = await varredura()
+                    mudou_2, falhas_2 = await varredura()
+                    hashes[7] = ('h1', '02/10/2022', '19:00:00')
+                    mudou_3, falhas_3 = await varredura()
+
+                    # falhas em algumas seções não impedem a verificação das demais
+                    hashes[8] = hashes[9] = ('h1', '02/10/2022', '20:00:00')
+                    secoes_com_erro.update((3, 9))
+                    mudou_4, falhas_4 = await varredura()
+            finally:
+                await runner.cleanup()
+            
+            assert falhas_1 == falhas_2 == falhas_3 == {}
+            return mudou_1, mudou_2, mudou_3, mudou_4, falhas_4
+        
+        mudou_1, mudou_2, mudou_3, mudou_4, falhas_4 = asyncio.run(cenario())
+
+        # primeira varredura: nenhuma hash conhecida
+        assert len(mudou_1) == len(urnas)
+        # segunda varredura: tudo 304, nada mudou
+        assert mudou_2 == []
+        # terceira varredura: só a seção 7
+        assert [ urna.section.id for urna in mudou_3 ] == [7]
+        assert mudou_3[0].hash_urna == 'h1' and mudou_3[0].stale_data is True
+        assert len(respostas_completas) == len(urnas) + 2
+        # quarta varredura: a seção 8 mudou; as seções 3 e 9 falharam
+        assert [ urna.section.id for urna in mudou_4 ] == [8]
+        assert sorted(urna.section.id for urna in falhas_4) == [3, 9]
+        assert all(isinstance(erro, aiohttp.ClientResponseError) for erro in falhas_4.values())
+
+
+class TestHashIndex:
+
+    def test_hash_index_persistente(self, get_urnas_sinteticas, monkeypatch):
+        urnas = get_urnas_sinteticas[:10]
+        index = vc.HashIndex(BU_ROOTDIR_TEST.joinpath('hash_index.sqlite'))
+        monkeypatch.setattr(vc.VotingMachine, 'hash_index', index)
+
+        jsondata = {'hashes': [{'hash': 'abc123', 'dr': '02/10/2022', 'hr': '17:00:00', 'nmarq': ['a.bu', 'a.rdv']}]}
+        for urna in urnas:
+            urna.aux_etag = f'"{urna.section.id}"'
+            urna._registra_info_urna(jsondata)
+        
+        info = index.consulta(urnas[0])
+        assert info['hash'] == 'abc123'
+        assert info['hash_dt'] == dt(2022, 10, 2, 17, 0, 0)
+        assert info['arquivos'] == ['a.bu', 'a.rdv']
+        index.close()
+
+        # 'reinício': novas urnas para as mesmas seções, hashes lidas do índice sem requisições
+        monkeypatch.setattr(vc, 'get_rl', None)
+        index = vc.HashIndex(BU_ROOTDIR_TEST.joinpath('hash_index.sqlite'))
+        monkeypatch.setattr(vc.VotingMachine, 'hash_index', index)
+
+        novas = [ vc.VotingMachine(section = urna.section) for urna in urnas ]
+        assert index.carrega(novas) == len(novas)
+        assert all(urna.hash_urna == 'abc123' and urna.aux_etag == f'"{urna.section.id}"' for urna in novas)
+
+        outra = vc.VotingMachine(section = urnas[3].section)
+        url = outra.get_url_download_urna(info = 'bu')
+        assert '/abc123/' in url
+        index.close()
+
+
+class TestBUStore:
+
+    def test_store_reaproveita_arquivos(self, get_urnas_sinteticas, monkeypatch, controlador_local):
+        urnas = get_urnas_sinteticas[:5]
+        downloads = []
+
+        def wget_download_falso(url, out):
+            downloads.append(url)
+            vc.Path(out).write_bytes(b'\x04\x02bu')
+        
+        monkeypatch.setattr(vc.wget, 'download', wget_download_falso)
+
+        store = vc.BUStore()
+        url = lambda urna: f'https://example.invalid/hash{urna.section.id}/o00406-{urna.section.id:0>4d}.bu'
+
+        caminhos = [ store.obtem(urna, url(urna), BU_ROOTDIR_TEST) for urna in urnas ]
+        assert store.stats() == {'hits': 0, 'misses': 5}
+        assert all(caminho.parent.name == f'hash{urna.section.id}' for caminho, urna in zip(caminhos, urnas))
+        assert not any(caminho.with_name(caminho.name + '.part').exists() for caminho in caminhos)
+
+        # segunda execução: nada é baixado
+        caminhos_2 = [ store.obtem(urna, url(urna), BU_ROOTDIR_TEST) for urna in urnas ]
+        assert caminhos_2 == caminhos
+        assert store.stats() == {'hits': 5, 'misses': 5}
+        assert len(downloads) == 5
+
+        # arquivo menor (ou maior) que o tamanho declarado no cabeçalho BER: baixado novamente
+        caminhos[0].write_bytes(b'\x04\x02b')
+        caminhos[1].write_bytes(b'\x04\x02bu\x00')
+        caminhos[2].write_bytes(b'')
+        caminhos_3 = [ store.obtem(urna, url(urna), BU_ROOTDIR_TEST) for urna in urnas ]
+        assert caminhos_3 == caminhos
+        assert store.stats() == {'hits': 7, 'misses': 8}
+        assert len(downloads) == 8 and caminhos[0].read_bytes() == b'\x04\x02bu'
+
+    def test_download_multiple_url_por_urna(self, get_urnas_sinteticas, monkeypatch, controlador_local):
+        urnas = get_urnas_sinteticas[:6]
+        conteudos = { urna.section.id: urna.caminho_bu.read_bytes() for urna in urnas }
+        downloads = []
+
+        def url_urna(vm, url_dl = None):
+            if vm.section.id == 3:
+                raise vc.requests.ConnectionError('JSON auxiliar indisponível')
+            return f'https://example.invalid/hash{vm.section.id}/o00406-{vm.section.id:0>4d}.bu'
+
+        def wget_download_falso(url, out):
+            downloads.append(url)
+            vc.Path(out).write_bytes(conteudos[int(url.split('hash')[1].split('/')[0])])
+
+        monkeypatch.setattr(vc.VotingMachine, 'get_info_download_url', url_urna)
+        monkeypatch.setattr(vc.wget, 'download', wget_download_falso)
+        monkeypatch.setattr(vc.VotingMachine, 'bu_store', store := vc.BUStore())
+
+        # arquivo da seção 2 já presente no armazenamento
+        presente = store.caminho(urnas[1], url_urna(urnas[1]), BU_ROOTDIR_TEST)
+        presente.parent.mkdir(parents = True, exist_ok = True)
+        presente.write_bytes(conteudos[2])
+
+        falhas = vc.VotingMachine.download_multiple_bu(
+            urnas, caminho_dl_root = BU_ROOTDIR_TEST, progressbar = False, download_workers = 3, max_retries = 2
+        )
+
+        # a falha ao obter a URL de uma urna é informada no seu trabalho, sem interromper as demais
+        assert [ job.vm for job in falhas ] == [urnas[2]]
+        assert isinstance(falhas[0].error, vc.requests.ConnectionError) and falhas[0].attempts == 2
+        assert len(downloads) == 4 and urnas[1].caminho_bu == presente
+        assert all(urna.caminho_bu.parent.name == f'hash{urna.section.id}' for urna in urnas if urna is not urnas[2])
+
+    def test_download_retomado(self, remove_test_files, controlador_local):
+        BU_ROOTDIR_TEST.mkdir(parents = True, exist_ok = True)
+        conteudo = bytes(range(256)) * 400
+        ranges = []
+
+        async def handler_bu(request):
+            faixa = request.headers.get('Range')
+            ranges.append(faixa)
+            if faixa is None:
+                return web.Response(body = conteudo)
+            inicio = int(faixa.split('=')[1].rstrip('-'))
+            return web.Response(status = 206, body = conteudo[inicio:])
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/arq.bu', handler_bu)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            try:
+                async with vc.TSEClient() as client:
+                    return await client.download(f'http://127.0.0.1:{porta}/arq.bu', BU_ROOTDIR_TEST.joinpath('arq.bu'))
+            finally:
+                await runner.cleanup()
+        
+        # download interrompido anteriormente
+        BU_ROOTDIR_TEST.joinpath('arq.bu.part').write_bytes(conteudo[:1000])
+
+        arq = asyncio.run(cenario())
+
+        assert ranges == ['bytes=1000-']
+        assert arq.read_bytes() == conteudo
+        assert not BU_ROOTDIR_TEST.joinpath('arq.bu.part').exists()
+
+
+def _grava_segmentos(root, processo: int, n: int) -> list:
+    # grava `n` arquivos em um SegmentStore aberto neste processo
+    store = vc.SegmentStore(root, segment_max_bytes = 20_000)
+    try:
+        return [ 
+            (conteudo, store.grava(f'p{processo}/{i}', conteudo))
+            for i in range(n) 
+            for conteudo in [bytes([processo * 16 + i % 16]) * (500 + 37 * i)]
+        ]
+    finally:
+        store.close()
+
+
+class TestSegmentStore:
+
+    def test_segment_store(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas
+        store = vc.SegmentStore(BU_ROOTDIR_TEST, segment_max_bytes = 50_000)
+
+        for urna in urnas:
+            conteudo = urna.caminho_bu.read_bytes()
+            chave = store.caminho(urna, f'https://example.invalid/hash/{urna.caminho_bu.name}')
+            assert not store.consulta(chave)
+            
+            urna.caminho_bu = store.grava(chave, conteudo)
+            assert bytes(vc.le_segmento(urna.caminho_bu)) == conteudo
+        
+        # vários segmentos, e nenhum maior que o limite
+        segmentos = sorted(store.root.glob('seg-*.bin'))
+        assert len(segmentos) > 1
+        assert all(segmento.stat().st_size <= 50_000 for segmento in segmentos)
+
+        # decodificação direto dos segmentos, em paralelo
+        vc.VotingMachine.processa_multiple_bu(urnas, workers = 2, min_batch = 1, progressbar = False)
+        assert all(urna.boletim_urna['identificacaoSecao']['secao'] == urna.section.id for urna in urnas)
+        store.close()
+
+        # índice persistente
+        store = vc.SegmentStore(BU_ROOTDIR_TEST, segment_max_bytes = 50_000)
+        assert store.consulta(store.caminho(urnas[10], 'https://example.invalid/hash/o00406-5801701160011.bu'))
+        assert store.stats() == {'hits': 1, 'misses': 0}
+        store.close()
+
+    def test_segment_store_processos(self, tmp_path):
+        with concurrent.futures.ProcessPoolExecutor(4) as executor:
+            gravados = [ 
+                item 
+                for itens in executor.map(_grava_segmentos, [tmp_path] * 4, range(4), [40] * 4) 
+                for item in itens 
+            ]
+
+        # nenhuma gravação sobrepõe outra, e o índice aponta para o conteúdo gravado
+        assert all(bytes(vc.le_segmento(ref)) == conteudo for conteudo, ref in gravados)
+        store = vc.SegmentStore(tmp_path, segment_max_bytes = 20_000)
+        try:
+            assert all(store.referencia(f'p{p}/{i}') is not None for p in range(4) for i in range(40))
+        finally:
+            store.close()
+
+
+class TestDecodificaBU:
+
+    def test_decodifica_bu_equivalente(self, get_urnas_sinteticas):
+        conv = vc.get_asn1_spec()
+
+        for urna in get_urnas_sinteticas[:5]:
+            envelope_completo = conv.decode('EntidadeEnvelopeGenerico', urna.caminho_bu.read_bytes())
+            bu_completo = conv.decode('EntidadeBoletimUrna', envelope_completo.pop('conteudo'))
+
+            envelope, bu = vc.decodifica_bu(urna.caminho_bu)
+
+            assert envelope == envelope_completo
+            assert bu == bu_completo
+
+    def test_decodifica_bu_projecao(self, get_urnas_sinteticas):
+        urna = get_urnas_sinteticas[0]
+        envelope_completo, bu_completo = vc.decodifica_bu(urna.caminho_bu)
+
+        componentes_bu = [ c[0] for c in vc.COMPONENTES_BU ]
+        for componentes in ([], ['urna', 'dataHoraEmissao'], ['qtdEleitoresCompBiometrico'], componentes_bu):
+            projecao = vc.ProjecaoBU(envelope = ['identificacao'], boletim = componentes)
+            envelope, bu = urna.processa_bu(projecao = projecao)
+
+            assert envelope == { 'identificacao': envelope_completo['identificacao'] }
+            assert bu == { k: v for k, v in bu_completo.items() if k in componentes }
+        
+        _, bu = urna.processa_bu(projecao = vc.PROJECAO_TOTAIS)
+        assert list(bu) == ['identificacaoSecao', 'resultadosVotacaoPorEleicao']
+        
+        # em lote
+        vc.VotingMachine.processa_multiple_bu(
+            get_urnas_sinteticas[:4], workers = 2, min_batch = 1, progressbar = False, projecao = vc.PROJECAO_TOTAIS
+        )
+        assert all(list(urna.boletim_urna) == list(bu) for urna in get_urnas_sinteticas[:4])
+        
+        with pytest.raises(ValueError):
+            vc.ProjecaoBU(boletim = ['votos'])
+
+    def test_decodifica_envelope_projecao(self, get_urnas_sinteticas, tmp_path):
+        dados = bytearray(get_urnas_sinteticas[0].caminho_bu.read_bytes())
+        _, bu_completo = vc.decodifica_bu(get_urnas_sinteticas[0].caminho_bu)
+
+        # cabeçalho do envelope corrompido (mantendo tag e comprimento do TLV)
+        _, inicio, _ = vc._ber_tlv(dados, 0)
+        tag, conteudo_inicio, conteudo_fim = vc._ber_tlv(dados, inicio)
+        assert tag == 0x30
+        dados[conteudo_inicio:conteudo_fim] = b'\xff' * (conteudo_fim - conteudo_inicio)
+        arq = tmp_path / 'cabecalho_corrompido.bu'
+        arq.write_bytes(bytes(dados))
+
+        with pytest.raises(asn1tools.DecodeError):
+            vc.decodifica_bu(arq)
+
+        # componentes do envelope fora da projeção não são decodificados
+        envelope, bu = vc.decodifica_bu(arq, projecao = vc.ProjecaoBU(envelope = ['fase', 'tipoEnvelope']))
+        assert envelope == {'fase': 'oficial', 'tipoEnvelope': 'envelopeBoletimUrna'}
+        assert bu == bu_completo
+
+    def test_decodifica_bu_corrompido(self, get_urnas_sinteticas, tmp_path):
+        conv = vc.get_asn1_spec()
+        envelope = conv.decode('EntidadeEnvelopeGenerico', get_urnas_sinteticas[0].caminho_bu.read_bytes())
+        
+        # envelope válido com boletim interno corrompido (truncado)
+        envelope['conteudo'] = envelope['conteudo'][:len(envelope['conteudo']) // 2]
+        bu_path = tmp_path / 'corrompido.bu'
+        bu_path.write_bytes(conv.encode('EntidadeEnvelopeGenerico', envelope))
+
+        # o erro da decodificação é mantido (e não um BufferError ao fechar o mapeamento do arquivo)
+        for projecao in (None, vc.PROJECAO_TOTAIS):
+            with pytest.raises(asn1tools.DecodeError):
+                vc.decodifica_bu(bu_path, projecao = projecao)
+
+    def test_decodifica_totais_equivalente(self, get_urnas_sinteticas):
+        conv = vc.get_asn1_spec()
+
+        # boletim com muitos votáveis (e códigos/quantidades de vários tamanhos)
+        urna = get_urnas_sinteticas[0]
+        envelope = conv.decode('EntidadeEnvelopeGenerico', urna.caminho_bu.read_bytes())
+        bu = conv.decode('EntidadeBoletimUrna', envelope['conteudo'])
+        bu['resultadosVotacaoPorEleicao'][1]['resultadosVotacao'][1]['totaisVotosCargo'][1]['votosVotaveis'] = [
+            {
+                'tipoVoto': 'nominal', 'quantidadeVotos': (i * 37) % 1200,
+                'identificacaoVotavel': {'partido': i % 90 + 10, 'codigo': (i * 997) % 99999},
+                'assinatura': bytes(64)
+            } for i in range(300)
+        ]
+        envelope['conteudo'] = conv.encode('EntidadeBoletimUrna', bu)
+        urna.caminho_bu.write_bytes(conv.encode('EntidadeEnvelopeGenerico', envelope))
+
+        for urna in get_urnas_sinteticas[:5]:
+            _, bu = vc.decodifica_bu(urna.caminho_bu)
+            totais = urna.processa_totais_bu()
+
+            identificacao = bu['identificacaoSecao']
+            assert (totais.municipio, totais.zona, totais.local, totais.secao) == (
+                identificacao['municipioZona']['municipio'], identificacao['municipioZona']['zona'],
+                identificacao['local'], identificacao['secao']
+            )
+
+            stats = []
+            votos = []
+            for resultado in bu['resultadosVotacaoPorEleicao']:
+                for resultado_votacao in resultado['resultadosVotacao']:
+                    stats.append((
+                        resultado['idEleicao'], resultado_votacao['tipoCargo'],
+                        resultado['qtdEleitoresAptos'], resultado_votacao['qtdComparecimento']
+                    ))
+                    for total_cargo in resultado_votacao['totaisVotosCargo']:
+                        for voto in total_cargo['votosVotaveis']:
+                            id_votavel = voto.get('identificacaoVotavel', {'partido': -1, 'codigo': -1})
+                            votos.append((
+                                resultado['idEleicao'], resultado_votacao['tipoCargo'], total_cargo['codigoCargo'][1],
+                                voto['tipoVoto'], voto['quantidadeVotos'], id_votavel['partido'], id_votavel['codigo']
+                            ))
+
+            assert stats == list(zip(
+                totais.stats_id_eleicao.tolist(), [ vc.TIPOS_CARGO[t] for t in totais.stats_tipo_cargo.tolist() ],
+                totais.stats_eleitores_aptos.tolist(), totais.stats_comparecimento.tolist()
+            ))
+            assert votos == list(zip(
+                totais.id_eleicao.tolist(), [ vc.TIPOS_CARGO[t] for t in totais.tipo_cargo.tolist() ],
+                [ vc.CARGOS_CONSTITUCIONAIS[c] for c in totais.cargo.tolist() ],
+                [ vc.TIPOS_VOTO[t] for t in totais.tipo_voto.tolist() ],
+                totais.qtd_votos.tolist(), totais.partido.tolist(), totais.codigo.tolist()
+            ))
+
+    def test_decodifica_bu_vazio(self, remove_test_files):
+        BU_ROOTDIR_TEST.mkdir(parents = True, exist_ok = True)
+        arq = BU_ROOTDIR_TEST.joinpath('vazio.bu')
+        arq.write_bytes(b'')
+
+        with pytest.raises(vc.asn1tools.DecodeError):
+            vc.decodifica_bu(arq)
+
+
+class TestVotosUrnaDf:
+
+    def test_votos_urna_df(self, get_urnas_sinteticas):
+        urna = get_urnas_sinteticas[0]
+        urna.envelope_urna, urna.boletim_urna = urna.processa_bu()
+        
+        totalizacao, stats_df = urna.votos_urna_df()
+
+        assert list(totalizacao.columns) == [
+            'tipo_voto', 'qtd_votos', 'partido', 'codigo', 'cargo', 'tipo_cargo', 'e_valido', 
+            'id_eleicao', 'id_municipio', 'zona', 'secao', 'dominio', 'dominio_local'
+        ]
+        assert list(stats_df.columns) == [
+            'id_eleicao', 'tipo_cargo', 'eleitores_aptos', 'comparecimento', 'estado', 'id_municipio', 'zona', 'secao'
+        ]
+        assert totalizacao.dtypes.astype(str).to_dict() == vc.ESQUEMA_TOTALIZACAO
+        assert stats_df.dtypes.astype(str).to_dict() == vc.ESQUEMA_STATS
+
+        assert len(totalizacao) == 15 and len(stats_df) == 3
+        assert totalizacao['qtd_votos'].sum() == 1250
+        assert stats_df['eleitores_aptos'].tolist() == [301, 301, 301]
+        assert (stats_df['estado'] == 'RJ').all() and (totalizacao['secao'] == 1).all()
+
+        # brancos e nulos não têm partido nem código
+        brancos_nulos = totalizacao['tipo_voto'].isin(['branco', 'nulo'])
+        assert totalizacao.loc[brancos_nulos, 'partido'].isna().all()
+        assert totalizacao.loc[brancos_nulos, 'codigo'].isna().all()
+        assert (totalizacao['e_valido'] == ~brancos_nulos).all()
+
+        dominios = totalizacao.groupby('cargo', observed = True)[['dominio', 'dominio_local']].first()
+        assert dominios.loc['presidente'].tolist() == ['pais', 'br']
+        assert dominios.loc['senador'].tolist() == ['estado', 'RJ']
+        assert dominios.loc['deputadoEstadual'].tolist() == ['estado', 'RJ']
+        assert dominios.loc['governador'].tolist() == ['municipio', '58017']
+
+    def test_votos_urna_df_consulta_livre(self, get_urnas_sinteticas):
+        urna = get_urnas_sinteticas[0]
+        _, bu = urna.processa_bu()
+
+        # consulta livre: o cargo é um número (numeroCargoConsultaLivre), e não um texto
+        bu['resultadosVotacaoPorEleicao'][1]['resultadosVotacao'].append({
+            'tipoCargo': 'consulta', 'qtdComparecimento': 250, 'totaisVotosCargo': [{
+                'codigoCargo': ('numeroCargoConsultaLivre', 25), 'ordemImpressao': 1, 
+                'votosVotaveis': [{'tipoVoto': 'nominal', 'quantidadeVotos': 70, 'identificacaoVotavel': {'partido': 1, 'codigo': 1}}]
+            }]
+        })
+
+        totalizacao, stats_df = urna.votos_urna_df(bu)
+
+        assert len(totalizacao) == 16 and len(stats_df) == 4
+        assert set(totalizacao['cargo'].cat.categories) == {'presidente', 'governador', 'senador', 'deputadoFederal', 'deputadoEstadual', 25}
+        consulta = totalizacao[totalizacao['cargo'] == 25]
+        assert consulta['qtd_votos'].tolist() == [70] and consulta['tipo_cargo'].tolist() == ['consulta']
+        assert consulta['dominio'].tolist() == ['municipio']
+
+    def test_colunas_multiple_boletins_alterados(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas[:4]
+        urnas[0].envelope_urna, urnas[0].boletim_urna = urnas[0].processa_bu()
+        for urna in urnas[1:]:
+            urna.processa_bu_sob_demanda()
+
+        colunas = vc.VotingMachine._colunas_multiple(urnas, workers = 1)
+        primeira = next(colunas)
+
+        # boletins decodificados e despejados durante a tabulação
+        assert urnas[2].boletim_urna is not None
+        urnas[0].processa_bu_sob_demanda()
+
+        resultado = [primeira] + list(colunas)
+        assert [ vm for vm, _ in resultado ] == urnas
+        assert [ stats['secao'][0] for _, (_, stats, _) in resultado ] == [ urna.section.id for urna in urnas ]
+
+    def test_votos_multiple_df(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas[:20]
+        
+        tabelas_secoes = []
+        for urna in urnas:
+            _, bu = urna.processa_bu()
+            tabelas_secoes.append(urna.votos_urna_df(bu))
+        
+        # parte das urnas já decodificadas, parte decodificada nos processos
+        for urna in urnas[:5]:
+            urna.envelope_urna, urna.boletim_urna = urna.processa_bu()
+        
+        totalizacao, stats_df = vc.VotingMachine.votos_multiple_df(urnas, workers = 2, min_batch = 1, progressbar = False)
+
+        assert all(urna.boletim_urna is None for urna in urnas[5:])
+        assert totalizacao['tipo_voto'].dtype == 'category' and totalizacao['partido'].dtype == pd.Int8Dtype()
+        
+        totalizacao_secoes = pd.concat([ t for t, _ in tabelas_secoes ], ignore_index = True)
+        stats_secoes = pd.concat([ s for _, s in tabelas_secoes ], ignore_index = True)
+        pd.testing.assert_frame_equal(totalizacao.astype(object), totalizacao_secoes.astype(object))
+        pd.testing.assert_frame_equal(stats_df.astype(object), stats_secoes.astype(object))
+
+
+    def test_esquema_compacto_memoria(self, get_urnas_sinteticas):
+        urna = get_urnas_sinteticas[0]
+        _, bu = urna.processa_bu()
+        
+        # ~1000 seções (15 mil linhas de votos)
+        tabulacao = vc.TabulacaoVotos()
+        colunas = vc.colunas_votos_bu(bu, 'RJ')
+        for _ in range(1000):
+            tabulacao.adiciona(*colunas)
+        totalizacao, stats_df = tabulacao.tabelas()
+
+        # mesmas tabelas sem o esquema compacto (int64, object)
+        totalizacao_larga = totalizacao.astype({
+            'qtd_votos': 'int64', 'partido': 'Int64', 'codigo': 'object', 'id_eleicao': 'int64', 
+            'id_municipio': 'int64', 'zona': 'int64', 'secao': 'int64', 'dominio_local': 'object'
+        })
+        stats_larga = stats_df.astype({
+            'id_eleicao': 'int64', 'tipo_cargo': 'object', 'eleitores_aptos': 'int64', 'comparecimento': 'int64', 
+            'estado': 'object', 'id_municipio': 'int64', 'zona': 'int64', 'secao': 'int64'
+        })
+
+        memoria = lambda df: df.memory_usage(deep = True).sum()
+        assert memoria(totalizacao) * 3 < memoria(totalizacao_larga)
+        assert memoria(stats_df) * 3 < memoria(stats_larga)
+        
+        # agregações não estouram os tipos compactos
+        assert totalizacao['qtd_votos'].sum() == 1250 * 1000
+
+
+class TestResultadosParquet:
+
+    def test_grava_le_particoes(self, get_urnas_sinteticas, tmp_path):
+        pytest.importorskip('pyarrow')
+
+        urnas = get_urnas_sinteticas[:10]
+        totalizacao, stats_df = vc.VotingMachine.votos_multiple_df(urnas, workers = 1, progressbar = False)
+
+        # row groups pequenos: várias gravações por partição
+        with vc.ResultadosParquet(tmp_path, por_cargo = True, linhas_por_grupo = 40) as escritor:
+            escritor.adiciona_multiple(urnas, progressbar = False, workers = 1)
+        
+        assert escritor.secoes == 10
+        assert (tmp_path / 'votos' / 'ano=2022' / 'pleito=406' / 'estado=RJ' / 'cargo=presidente').is_dir()
+
+        votos = vc.le_resultados_parquet(tmp_path, 'votos', filtros = {'ano': 2022, 'estado': 'RJ'})
+        assert len(votos) == len(totalizacao)
+        assert votos['qtd_votos'].sum() == totalizacao['qtd_votos'].sum()
+        assert votos['codigo'].dtype == pd.Int32Dtype() and votos['cargo'].dtype == 'category'
+        assert votos['codigo'].isna().sum() == totalizacao['codigo'].isna().sum()
+
+        # apenas algumas partições e colunas
+        senador = vc.le_resultados_parquet(
+            tmp_path, 'votos', filtros = {'cargo': ['senador']}, colunas = ['secao', 'qtd_votos']
+        )
+        assert list(senador.columns) == ['secao', 'qtd_votos']
+        assert senador['qtd_votos'].sum() == totalizacao.loc[totalizacao['cargo'] == 'senador', 'qtd_votos'].sum()
+
+        stats = vc.le_resultados_parquet(tmp_path, 'stats')
+        assert len(stats) == len(stats_df) and (stats['estado'] == 'RJ').all()
+        assert stats.dtypes.astype(str)[list(vc.ESQUEMA_STATS)].to_dict() == vc.ESQUEMA_STATS
+
+
+class TestMemoriaUrnas:
+
+    def test_registro_escopo(self, get_urnas_sinteticas):
+        secao = get_urnas_sinteticas[0].section
+        # urnas de outros testes que ainda aguardam o coletor de lixo não contam
+        gc.collect()
+        antes = len(vc.VotingMachine.all_vms)
+
+        with vc.VotingMachine.all_vms.escopo():
+            urnas = [ vc.VotingMachine(section = secao) for _ in range(50) ]
+            assert len(vc.VotingMachine.all_vms) == antes + 50
+
+            mantida = urnas[0]
+            del urnas
+        
+        # só a urna referenciada fora do escopo continua registrada
+        gc.collect()
+        assert len(vc.VotingMachine.all_vms) == antes + 1
+        assert mantida in list(vc.VotingMachine.all_vms)
+
+    def test_registro_sem_escopo(self, get_states, get_election):
+        state = get_states['RJ']
+        jsondata = {'abr': [{'mu': [{'cd': '58017', 'nm': 'Niterói', 'zon': [
+            {'cd': '0116', 'sec': [ {'ns': f'{id_secao:0>4d}'} for id_secao in range(1, 21) ]}
+        ]}]}]}
+        gc.collect()
+        antes = len(vc.VotingMachine.all_vms)
+
+        # fora de um escopo, as urnas não ficam presas no registro
+        vc.VotingMachine(section = vc.ElectionSection(id = 999, zone = None, contest = get_election.contest))
+        gc.collect()
+        assert len(vc.VotingMachine.all_vms) == antes
+
+        # as urnas das seções são mantidas pelo índice de seções
+        _, _, secoes = state._processa_json_mun_zona_secao(jsondata, get_election.contest)
+        gc.collect()
+        assert len(vc.VotingMachine.all_vms) == antes + 20
+        assert { urna.section for urna in vc.VotingMachine.all_vms } >= set(secoes.values())
+
+        del secoes
+        gc.collect()
+        assert len(vc.VotingMachine.all_vms) == antes
+
+    def test_memoria_boletins(self, get_urnas_sinteticas, tmp_path):
+        urnas = get_urnas_sinteticas[:10]
+        tamanho = urnas[0].caminho_bu.stat().st_size * vc.FATOR_MEMORIA_BOLETIM
+
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = memoria = vc.MemoriaBoletins(limite_bytes = 3 * tamanho, diretorio = tmp_path)
+        try:
+            for urna in urnas:
+                urna.envelope_urna, urna.boletim_urna = urna.processa_bu()
+            
+            assert len(memoria) == 3 and memoria.bytes <= memoria.limite_bytes
+            assert memoria.evictions == 7
+            assert urnas[0]._boletim_urna is None
+
+            # recarregado do arquivo no acesso
+            assert urnas[0].boletim_urna == urnas[0].processa_bu()[1]
+            assert urnas[0]._boletim_urna is not None and len(memoria) == 3
+
+            # boletim sem arquivo: despejado em disco
+            sem_arquivo = vc.VotingMachine(section = urnas[0].section)
+            sem_arquivo.envelope_urna, sem_arquivo.boletim_urna = urnas[1].processa_bu()
+            for urna in urnas[2:6]:
+                urna.boletim_urna
+            
+            assert sem_arquivo._boletim_urna is None and len(list(tmp_path.glob('*.pkl'))) == 1
+            assert sem_arquivo.boletim_urna == urnas[1].processa_bu()[1]
+            assert len(list(tmp_path.glob('*.pkl'))) == 0
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+    def test_decodificacao_sob_demanda(self, get_urnas_sinteticas, tmp_path, monkeypatch):
+        urnas = get_urnas_sinteticas[:30]
+
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = memoria = vc.MemoriaBoletins(limite_entradas = 5, diretorio = tmp_path)
+        try:
+            for urna in urnas:
+                urna.processa_bu_sob_demanda()
+            
+            # tabulação de todas as urnas sem decodificar os boletins nas urnas
+            totalizacao, _ = vc.VotingMachine.votos_multiple_df(urnas, workers = 1, progressbar = False)
+            assert len(totalizacao) == 30 * 15
+            assert memoria.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'bytes': 0}
+
+            # só os boletins acessados são decodificados
+            for urna in urnas[:8]:
+                assert urna.boletim_urna['identificacaoSecao']['secao'] == urna.section.id
+            assert urnas[7].envelope_urna is not None
+            
+            stats = memoria.stats()
+            assert (stats['misses'], stats['evictions'], stats['entries'], stats['hits']) == (8, 3, 5, 1)
+            assert all(urna._boletim_urna is None for urna in urnas[8:])
+
+            # verificação de atualização sem decodificar o boletim pendente
+            jsondata = {'hashes': [{'hash': 'h0', 'dr': '02/10/2022', 'hr': '17:00:00'}]}
+            monkeypatch.setattr(vc.cache_aux, 'get_json', lambda url: jsondata)
+            urnas[8].hash_dt = dt(2022, 10, 2, 18, 0, 0)
+            assert urnas[8].check_data_staleness() is False
+            assert urnas[8]._boletim_urna is None and urnas[8]._boletim_pendente is not None
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+    def test_decodificacao_sob_demanda_atribuicao_parcial(self, get_urnas_sinteticas):
+        urna = get_urnas_sinteticas[0]
+        envelope, bu = urna.processa_bu()
+        urna.processa_bu_sob_demanda()
+
+        # atribuir só o envelope não descarta o boletim pendente
+        urna.envelope_urna = {'tipoEnvelope': 'outro'}
+        assert urna._boletim_pendente is not None
+        assert urna.boletim_urna == bu
+        assert urna.envelope_urna == {'tipoEnvelope': 'outro'} and urna._boletim_pendente is None
+
+    def test_decodificacao_sob_demanda_concorrente(self, get_urnas_sinteticas, tmp_path, monkeypatch):
+        urna = get_urnas_sinteticas[0]
+        decodificacoes = []
+        decodifica_bu = vc.decodifica_bu
+
+        def decodifica_bu_lento(*args, **kwargs):
+            decodificacoes.append(1)
+            vc.time.sleep(0.1)
+            return decodifica_bu(*args, **kwargs)
+
+        monkeypatch.setattr(vc, 'decodifica_bu', decodifica_bu_lento)
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = memoria = vc.MemoriaBoletins(diretorio = tmp_path)
+        try:
+            urna.processa_bu_sob_demanda()
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                boletins = list(executor.map(lambda _: urna.boletim_urna, range(8)))
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+        # o primeiro acesso decodifica; os demais aguardam e recebem o mesmo boletim
+        assert len(decodificacoes) == 1 and memoria.stats()['misses'] == 1
+        assert all(boletim is boletins[0] for boletim in boletins)
+
+    def test_decodificacao_sob_demanda_projecao(self, get_urnas_sinteticas, tmp_path):
+        urnas = get_urnas_sinteticas[:3]
+
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = vc.MemoriaBoletins(limite_entradas = 1, diretorio = tmp_path)
+        try:
+            for urna in urnas:
+                urna.processa_bu_sob_demanda(projecao = vc.PROJECAO_TOTAIS)
+
+            # a projeção é usada na primeira decodificação e também depois de um despejo
+            for _ in range(2):
+                for urna in urnas:
+                    assert urna.boletim_urna == urna.processa_bu(projecao = vc.PROJECAO_TOTAIS)[1]
+                    assert urna.envelope_urna == {}
+            assert urnas[0].processa_bu()[1] != urnas[0].boletim_urna
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+    def test_tamanho_sem_arquivo(self, get_urnas_sinteticas, monkeypatch):
+        urna = get_urnas_sinteticas[0]
+        envelope, boletim = urna.processa_bu()
+        urna.caminho_bu = None
+
+        serializacoes = []
+        dumps = vc.pickle.dumps
+        monkeypatch.setattr(vc.pickle, 'dumps', lambda *args, **kwargs: serializacoes.append(1) or dumps(*args, **kwargs))
+
+        # sem limite de tamanho, o boletim não é serializado para ser medido a cada atribuição
+        memoria_anterior = vc.VotingMachine.memoria_boletins
+        vc.VotingMachine.memoria_boletins = memoria = vc.MemoriaBoletins()
+        try:
+            urna.envelope_urna, urna.boletim_urna = envelope, boletim
+            assert serializacoes == [] and memoria.stats()['entries'] == 1
+        finally:
+            vc.VotingMachine.memoria_boletins = memoria_anterior
+
+        assert vc.MemoriaBoletins(limite_bytes = 10**9)._tamanho(urna) > 0 and serializacoes == [1]
+
+
+class TestGeografia:
+
+    def test_hashable_slots(self, get_urnas_sinteticas):
+        urnas = get_urnas_sinteticas[:5]
+        secao = urnas[0].section
+
+        for obj in (secao, secao.zone, secao.zone.city, secao.contest, urnas[0]):
+            assert not hasattr(obj, '__dict__')
+            assert hash(obj) == hash(copy.copy(obj))
+
+        # seções e urnas como chaves
+        por_secao = { urna.section: urna for urna in urnas }
+        assert por_secao[vc.ElectionSection(id = secao.id, zone = secao.zone, contest = secao.contest)] is urnas[0]
+        assert len(set(urnas) | { vc.VotingMachine(section = secao) }) == 5
+
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            secao.id = 2
+
+    def test_interna(self, get_states):
+        municipio = vc.City.interna(id = 58017, name = 'Niterói', state = get_states['RJ'])
+        assert vc.City.interna(id = 58017, name = 'Niterói', state = get_states['RJ']) is municipio
+        assert vc.ElectionZone.interna(id = 116, city = municipio) is vc.ElectionZone.interna(id = 116, city = municipio)
+        assert vc.ElectionZone.interna(id = 117, city = municipio) is not vc.ElectionZone.interna(id = 116, city = municipio)
+        assert vc.Contest.interna(year = 2022, contest_id = 406) is vc.Contest.interna(year = 2022, contest_id = 406)
+
+        # instâncias sem uso são descartadas
+        vc.City.interna(id = 99999, name = 'Inexistente', state = get_states['RJ'])
+        gc.collect()
+        assert 99999 not in vc.City._internados
+
+
+class TestIndiceGeografico:
+
+    def test_indice_secoes(self, get_states, get_election):
+        jsondata = {'abr': [{'cd': 'RJ', 'mu': [
+            {'cd': '58017', 'nm': 'Niterói', 'zon': [
+                {'cd': '0116', 'sec': [{'ns': '0001'}, {'ns': '0002'}]},
+                {'cd': '0071', 'sec': [{'ns': '0010'}]},
+            ]},
+            {'cd': '60011', 'nm': 'Rio de Janeiro', 'zon': [
+                {'cd': '0004', 'sec': [{'ns': '0003'}]},
+            ]},
+        ]}]}
+
+        with vc.VotingMachine.all_vms.escopo():
+            municipios, zonas, secoes = get_states['RJ']._processa_json_mun_zona_secao(jsondata, get_election.contest)
+
+            assert len(municipios) == 2 and len(zonas) == 3 and len(secoes) == 4
+            assert list(secoes) == sorted(secoes)
+
+            # chave inteira, tupla ou texto (formato antigo)
+            secao = secoes[(58017, 116, 2)]
+            assert secao.id == 2 and secao.zone.id == 116
+            assert secoes[5801701160002] is secao and secoes['5801701160002'] is secao
+            assert zonas['580170116'] is secao.zone
+            assert secoes.decompoe(5801701160002) == (58017, 116, 2)
+            assert secoes.como_dict()['6001100040003'].zone.city.name == 'Rio de Janeiro'
+            assert (58017, 116, 3) not in secoes and '58017' not in secoes
+            with pytest.raises(KeyError):
+                secoes[(58017, 116, 3)]
+
+            # fatias por município e por zona
+            assert [ s.id for s in secoes.faixa(58017) ] == [10, 1, 2]
+            assert [ s.id for s in secoes.faixa(58017, 116) ] == [1, 2]
+            assert len(secoes.faixa(60011)) == 1 and len(secoes.faixa(12345)) == 0
+            assert [ z.id for z in zonas.faixa(58017) ] == [71, 116]
+
+
+class TestCacheConfig:
+
+    def test_carrega_estados_cache(self, get_states, get_election, monkeypatch, tmp_path, controlador_local):
+        contest = get_election.contest
+        configs = {
+            'rj': {'abr': [{'cd': 'RJ', 'mu': [{'cd': '58017', 'nm': 'Niterói', 'zon': [{'cd': '0116', 'sec': [{'ns': '0001'}, {'ns': '0002'}]}]}]}]},
+            'sp': {'abr': [{'cd': 'SP', 'mu': [{'cd': '71072', 'nm': 'São Paulo', 'zon': [{'cd': '0001', 'sec': [{'ns': '0005'}]}]}]}]},
+        }
+        requisicoes = []
+
+        async def handler_config(request):
+            estado = request.match_info['estado']
+            requisicoes.append((estado, request.headers.get('If-None-Match')))
+            etag = f'"{estado}-1"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status = 304)
+            return web.json_response(configs[estado], headers = {'ETag': etag})
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/config/{estado}', handler_config)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            monkeypatch.setattr(
+                vc.State, 'get_url_info_mun_zona_secao', 
+                lambda self, ano, pleito, estado = None: f'http://127.0.0.1:{porta}/config/{estado.lower()}'
+            )
+
+            estados = [ get_states['RJ'], get_states['SP'] ]
+            carrega = lambda cache: vc.State.process_info_multiple_async(
+                contest.year, contest.contest_id, states = estados, cache = cache
+            )
+            try:
+                with vc.VotingMachine.all_vms.escopo():
+                    frio = await carrega(vc.CacheConfig(tmp_path))
+                    n_frio = len(requisicoes)
+                    quente = await carrega(vc.CacheConfig(tmp_path))
+                    n_quente = len(requisicoes)
+                    revalidado = await carrega(vc.CacheConfig(tmp_path, max_age = 0))
+            finally:
+                await runner.cleanup()
+            
+            return frio, quente, revalidado, n_frio, n_quente
+
+        frio, quente, revalidado, n_frio, n_quente = asyncio.run(cenario())
+
+        # um único índice com as seções dos dois estados
+        municipios, zonas, secoes = frio
+        assert set(municipios) == {58017, 71072} and len(zonas) == 2 and len(secoes) == 3
+        assert secoes[(71072, 1, 5)].zone.city.state.abbr == 'SP'
+
+        # cache recente: nenhuma requisição; cache expirado: revalidação condicional (304)
+        assert n_frio == 2 and n_quente == 2
+        assert sorted(requisicoes[2:]) == [('rj', '"rj-1"'), ('sp', '"sp-1"')]
+        for resultado in (quente, revalidado):
+            assert list(resultado[2]) == list(secoes)
+            assert resultado[2][(58017, 116, 1)] == secoes[(58017, 116, 1)]
+
+
+class TestAcompanhamentoResultados:
+
+    def test_acompanhamento(self, get_states, monkeypatch, controlador_local):
+        def payload(votos, hora):
+            return {
+                'dg': '02/10/2022', 'hg': hora, 'pst': '12,50', 'e': '1000', 'c': '800', 'vv': str(sum(votos)), 'vb': '10', 'tvn': '20',
+                'cand': [ 
+                    {'n': str(numero), 'nm': f'CANDIDATO {numero}', 'cc': 'PARTIDO', 'vap': str(v), 'pvap': '50,00', 'e': 'n', 'st': ''} 
+                    for numero, v in zip((22, 13), votos) 
+                ]
+            }
+        
+        feeds = {'rj': payload((100, 90), '18:00:00'), 'sp': payload((200, 210), '18:00:00')}
+        respostas_completas = []
+
+        async def handler_votos(request):
+            estado = request.match_info['estado']
+            if estado not in feeds:
+                return web.Response(status = 404)
+            
+            etag = f'"{estado}-{feeds[estado]["hg"]}"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status = 304)
+            
+            respostas_completas.append(estado)
+            return web.json_response(feeds[estado], headers = {'ETag': etag})
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/votos/{estado}', handler_votos)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            monkeypatch.setattr(
+                vc.State, 'get_url_votos', 
+                lambda self, ano, eleicao, cargo, estado = None: f'http://127.0.0.1:{porta}/votos/{self.abbr.lower()}'
+            )
+            acompanhamento = vc.AcompanhamentoResultados(
+                2022, 546, cargos = ['governador'], 
+                states = [ get_states['RJ'], get_states['SP'], get_states['ZZ'] ], intervalo = 0.05
+            )
+
+            try:
+                async with vc.TSEClient(max_calls = 1000) as client:
+                    inicial = await acompanhamento.atualiza(client)
+                    sem_mudanca = await acompanhamento.atualiza(client)
+
+                    # atualização publicada durante o acompanhamento contínuo
+                    feeds['rj'] = payload((150, 90), '18:05:00')
+                    inicio = vc.time.monotonic()
+                    async for deltas in acompanhamento.acompanha(client):
+                        latencia = vc.time.monotonic() - inicio
+                        break
+            finally:
+                await runner.cleanup()
+            
+            return acompanhamento, inicial, sem_mudanca, deltas, latencia
+
+        acompanhamento, inicial, sem_mudanca, deltas, latencia = asyncio.run(cenario())
+
+        assert len(inicial) == 4 and sem_mudanca == []
+        assert [ (d.estado, d.numero, d.votos_anteriores, d.votos, d.delta) for d in deltas ] == [('RJ', 22, 100, 150, 50)]
+        assert deltas[0].atualizado_em == dt(2022, 10, 2, 18, 5, 0)
+        assert latencia < 1
+        # conteúdo só é enviado (e interpretado) quando muda
+        assert sorted(respostas_completas[:2]) == ['rj', 'sp'] and respostas_completas[2:] == ['rj']
+
+        # feed inexistente desativado
+        assert [ feed.ativo for feed in acompanhamento.feeds ] == [True, True, False]
+
+        snapshot = acompanhamento.snapshot().set_index(['estado', 'numero'])
+        assert snapshot.loc[('RJ', 22), 'votos'] == 150 and snapshot.loc[('SP', 13), 'votos'] == 210
+        assert snapshot.loc[('RJ', 22), 'percentual'] == 50.0
+        assert acompanhamento.resumo().set_index('estado').loc['RJ', 'validos'] == 240
+
+    def test_acompanhamento_latencia_rodada(self, get_states, monkeypatch):
+        cargos = ['presidente', 'governador', 'senador']
+        states = [ state for abbr, state in get_states.items() if abbr != 'ZZ' ]
+        alterados = set()
+
+        async def handler_votos(request):
+            chave = (request.match_info['estado'], request.match_info['cargo'])
+            etag = f'"{chave in alterados}"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status = 304)
+            return web.json_response({'dg': '02/10/2022', 'hg': '18:00:00', 'cand': [{'n': '22', 'vap': str(100 + (chave in alterados))}]}, headers = {'ETag': etag})
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/votos/{estado}/{cargo}', handler_votos)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            monkeypatch.setattr(
+                vc.State, 'get_url_votos', 
+                lambda self, ano, eleicao, cargo, estado = None: f'http://127.0.0.1:{porta}/votos/{self.abbr.lower()}/{cargo}'
+            )
+            # configuração padrão (taxa, intervalos e cliente)
+            acompanhamento = vc.AcompanhamentoResultados(2022, 546, cargos = cargos, states = states)
+
+            latencias = []
+            try:
+                async with vc.TSEClient() as client:
+                    for rodada in range(3):
+                        if rodada == 2:
+                            alterados.add(('rj', 'governador'))
+                        inicio = vc.time.monotonic()
+                        deltas = await acompanhamento.atualiza(client)
+                        latencias.append(vc.time.monotonic() - inicio)
+            finally:
+                await runner.cleanup()
+            
+            return acompanhamento, latencias, deltas
+
+        acompanhamento, latencias, deltas = asyncio.run(cenario())
+
+        # 27 estados x 3 cargos em menos de dois segundos por rodada
+        assert len(acompanhamento.feeds) == 81 and all(feed.requisicoes == 3 for feed in acompanhamento.feeds)
+        assert max(latencias) < 2, latencias
+        assert [ (d.estado, d.cargo, d.votos) for d in deltas ] == [('RJ', 'governador', 101)]
+
+        # feeds alterados recentemente são consultados com mais frequência
+        intervalos = { (feed.state.abbr, feed.cargo): feed.intervalo for feed in acompanhamento.feeds }
+        assert intervalos[('RJ', 'governador')] == vc.POLL_INTERVAL
+        assert intervalos[('SP', 'governador')] == vc.POLL_INTERVAL * 1.5 ** 2
+
+    def test_acompanhamento_conteudo_invalido(self, get_states, monkeypatch, controlador_local):
+        def payload(votos, hora, extra = ()):
+            return {
+                'dg': '02/10/2022', 'hg': hora, 'vv': str(sum(votos)),
+                'cand': [ {'n': str(numero), 'nm': f'CANDIDATO {numero}', 'vap': str(v)} for numero, v in zip((22, 13), votos) ] + list(extra)
+            }
+
+        feeds = {'rj': payload((100, 90), '18:00:00')}
+
+        async def handler_votos(request):
+            etag = f'"{feeds["rj"]["hg"]}"' if isinstance(feeds['rj'], dict) else '"lista"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status = 304)
+            return web.json_response(feeds['rj'], headers = {'ETag': etag})
+
+        async def cenario():
+            app = web.Application()
+            app.router.add_get('/votos/rj', handler_votos)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            porta = site._server.sockets[0].getsockname()[1]
+
+            monkeypatch.setattr(vc.State, 'get_url_votos', lambda self, ano, eleicao, cargo, estado = None: f'http://127.0.0.1:{porta}/votos/rj')
+            acompanhamento = vc.AcompanhamentoResultados(2022, 546, cargos = ['governador'], states = [get_states['RJ']], intervalo = 0.02)
+            feed = acompanhamento.feeds[0]
+
+            try:
+                async with vc.TSEClient(max_calls = 1000) as client:
+                    await acompanhamento.atualiza(client)
+
+                    # candidato sem número válido depois de um candidato válido, e conteúdo que não é um dicionário
+                    feeds['rj'] = payload((150, 90), '18:05:00', extra = [{'n': 'abc', 'vap': '1'}])
+                    assert await acompanhamento.atualiza(client) == []
+                    erros = [feed.erros]
+                    feeds['rj'] = [1, 2, 3]
+                    assert await acompanhamento.atualiza(client) == []
+                    erros.append(feed.erros)
+                    snapshot = acompanhamento.snapshot()
+
+                    # o acompanhamento contínuo segue consultando o feed, e interpreta o conteúdo corrigido
+                    async def corrige():
+                        await asyncio.sleep(0.1)
+                        feeds['rj'] = payload((150, 90), '18:05:00')
+                    
+                    correcao = asyncio.ensure_future(corrige())
+                    async for deltas in acompanhamento.acompanha(client):
+                        break
+                    await correcao
+            finally:
+                await runner.cleanup()
+
+            return acompanhamento, erros, snapshot, deltas
+
+        acompanhamento, erros, snapshot, deltas = asyncio.run(cenario())
+        feed = acompanhamento.feeds[0]
+
+        assert erros == [1, 2] and feed.erros > 2 and feed.error is None and feed.ativo
+        # conteúdos inválidos não alteram a última contagem
+        assert snapshot.set_index('numero')['votos'].to_dict() == {22: 100, 13: 90}
+        assert [ (d.numero, d.votos_anteriores, d.votos) for d in deltas ] == [(22, 100, 150)]
+
+
 class TestPartyFederation:
 
     def test_party(self):
@@ -5,18 +5,37 @@
 # import
 # import
 import os
+import hashlib
+import pickle
+import queue
+import threading
+import time
+import asyncio
+import collections
+import collections.abc
+import concurrent.futures
+import json
+import mmap
+import sqlite3
+import socket
+import socketserver
+import contextlib
+import uuid
+import random
+import weakref
 from datetime import datetime as dt
-from typing import Counter, Optional, List, Dict, ClassVar, Final
-from dataclasses import dataclass, field
+from typing import Counter, Optional, List, Dict, ClassVar, Final, Iterable, AsyncIterator, Iterator
+from urllib.error import URLError
+from dataclasses import dataclass, field, InitVar
 import requests
+import aiohttp
 import numpy as np
 import pandas as pd
 import asn1tools
-from ratelimiter import RateLimiter
 import wget
 import tqdm
 from pathlib import Path
-from multiprocessing.pool import ThreadPool as Pool
+import multiprocessing
 
 #%% 
 # constants
@@ -26,37 +45,2841 @@ ASN1_PATHS = [
     r'class_descriptors/assinatura.asn1' 
 ]
 BU_ROOTDIR = Path(r"../eleicoes/")
+ASN1_CACHE_DIR = BU_ROOTDIR.joinpath('.cache/asn1')
+HASH_INDEX_PATH = BU_ROOTDIR.joinpath('.cache/hash_index.sqlite')
+DESPEJO_DIR = BU_ROOTDIR.joinpath('.cache/despejo')
+CONFIG_CACHE_DIR = BU_ROOTDIR.joinpath('.cache/config')
+ORCAMENTO_PATH = BU_ROOTDIR.joinpath('.cache/orcamento_requisicoes')
+ORCAMENTO_ENV = 'VOTECOUNTER_ORCAMENTO'  # variável de ambiente com o arquivo do orçamento compartilhado (ver configura_orcamento)
+ORCAMENTO_PORTA = 47800
+SEGMENT_MAX_BYTES = 2**30
+BER_CABECALHO_MAX = 16  # bytes lidos do início de um arquivo para obter o tamanho declarado no seu TLV BER externo
 REQ_MAX_CALLS = 10
 REQ_PERIOD = 1
+REQ_RATE_MIN = 1  # limites da taxa adaptativa (req/s), ver ControladorTaxa
+REQ_RATE_MAX = 50
+REQ_LATENCY_TARGET = 2
+REQ_MAX_RETRIES = 4
+REQ_BACKOFF_BASE = 0.5
+REQ_BACKOFF_MAX = 30
+CIRCUIT_MAX_FAILURES = 10
+CIRCUIT_COOLDOWN = 30
+DOWNLOAD_WORKERS = 16
+HTTP_MAX_CONNECTIONS = 100
+HTTP_TIMEOUT = 60
+STALENESS_CONCURRENCY = 100
+DOWNLOAD_MAX_RETRIES = 3
+DECODE_WORKERS = os.cpu_count() or 1
+DECODE_MIN_BATCH = 64
+PIPELINE_RESOLVE_WORKERS = 16
+PIPELINE_QUEUE_SIZE = 64
+PARQUET_LINHAS_POR_GRUPO = 2**17  # linhas de votos por row group, em cada partição
+POLL_INTERVAL = 1  # segundos entre consultas de um mesmo feed de resultados parciais
+POLL_INTERVAL_FACTOR_MAX = 4  # feeds sem alteração são consultados com intervalo crescente, até POLL_INTERVAL_FACTOR_MAX * intervalo
+POLL_MAX_CALLS = 200  # req/s do acompanhamento de resultados parciais (consultas condicionais, em geral respostas 304)
+AUX_CACHE_TTL = 15  # segundos em que as respostas dos JSONs auxiliares são reaproveitadas
+CONFIG_MAX_AGE = 24 * 60 * 60  # segundos em que os JSONs de configuração em cache são usados sem revalidação
+FATOR_MEMORIA_BOLETIM = 10  # memória do boletim decodificado (dicionários) / tamanho do arquivo .bu
+
+#%%
+# orçamento de requisições compartilhado entre processos (e máquinas)
+class OrcamentoRequisicoes:
+    """orçamento global de requisições (GCRA): no máximo `max_calls` requisições a cada `period` segundos,
+    com estado no próprio processo (ver `OrcamentoArquivo` e `OrcamentoRemoto`).
+
+    Args:
+        max_calls (int): requisições por período
+        period (float): período (s)
+        rajada (int): requisições que podem ser feitas de uma vez
+    """
+
+    def __init__(self, max_calls: int = REQ_RATE_MAX, period: float = REQ_PERIOD, rajada: int = 1):
+        self.max_calls = max_calls
+        self.period = period
+        self.rajada = rajada
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def reserva(self) -> float:
+        """reserva uma requisição; retorna a espera (s) até que ela possa ser feita."""
+        with self._lock:
+            self._tat, espera = self._gcra(self._tat, time.time())
+        return espera
+
+    def _gcra(self, tat: float, agora: float) -> tuple[float, float]:
+        # novo horário teórico e espera da requisição reservada
+        intervalo = self.period / self.max_calls
+        tat = max(tat, agora)
+        espera = max(0.0, tat - (self.rajada - 1) * intervalo - agora)
+        return tat + intervalo, espera
+
+class OrcamentoArquivo(OrcamentoRequisicoes):
+    """orçamento compartilhado pelos processos de uma máquina, com estado em um arquivo lido e gravado sob trava.
+
+    Args:
+        caminho (Path): arquivo do orçamento (os processos devem usar também os mesmos `max_calls`, `period` e `rajada`)
+    """
+
+    def __init__(self, 
+        caminho: Path = ORCAMENTO_PATH, 
+        max_calls: int = REQ_RATE_MAX, 
+        period: float = REQ_PERIOD, 
+        rajada: int = 1
+    ):
+        super().__init__(max_calls = max_calls, period = period, rajada = rajada)
+        # caminho absoluto: não muda com o diretório atual do processo
+        self.caminho = Path(caminho).absolute()
+        self._fd = None
+        self._pid = None
+
+    def reserva(self) -> float:
+        with self._lock:
+            fd = self._abre()
+            _trava_arquivo(fd, True)
+            try:
+                estado = os.pread(fd, 8, 0)
+                tat = float(np.frombuffer(estado, dtype = np.float64)[0]) if len(estado) == 8 else 0.0
+                tat, espera = self._gcra(tat, time.time())
+                os.pwrite(fd, np.float64(tat).tobytes(), 0)
+            finally:
+                _trava_arquivo(fd, False)
+        return espera
+
+    def _abre(self) -> int:
+        # um descritor por processo: travas de arquivo não excluem processos que herdaram o mesmo descritor (fork)
+        if self._fd is None or self._pid != os.getpid():
+            self.caminho.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+            self._fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o664)
+            self._pid = os.getpid()
+        return self._fd
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado['_fd'], estado['_pid'], estado['_lock'] = None, None, None
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+def _trava_arquivo(fd: int, travar: bool) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK if travar else msvcrt.LK_UNLCK, 8)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_EX if travar else fcntl.LOCK_UN)
+
+class OrcamentoRemoto(OrcamentoRequisicoes):
+    """orçamento mantido por um `CoordenadorOrcamento` (ex.: várias máquinas com o mesmo IP de saída).
+
+    Args:
+        endereco (tuple): host e porta do coordenador
+        timeout (float): timeout das conexões (s)
+    """
+
+    def __init__(self, endereco: tuple[str, int] = ('127.0.0.1', ORCAMENTO_PORTA), timeout: float = HTTP_TIMEOUT):
+        self.endereco = tuple(endereco)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def reserva(self) -> float:
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = socket.create_connection(self.endereco, timeout = self.timeout)
+            self._local.conexao, self._local.arquivo, self._local.pid = conexao, conexao.makefile('rb'), os.getpid()
+        
+        try:
+            conexao.sendall(b'reserva\n')
+            resposta = self._local.arquivo.readline()
+            if not resposta:
+                raise ConnectionError(f'Conexão encerrada pelo coordenador {self.endereco}')
+        except OSError:
+            # reconecta na próxima reserva
+            self._local.conexao = None
+            raise
+
+        return float(resposta)
+
+    def __getstate__(self):
+        return {'endereco': self.endereco, 'timeout': self.timeout}
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._local = threading.local()
+
+class CoordenadorOrcamento:
+    """servidor TCP que mantém um orçamento de requisições para vários processos ou máquinas (ver `OrcamentoRemoto`).
+
+    >>> with CoordenadorOrcamento(OrcamentoArquivo(), host = '0.0.0.0'):
+    ...     ...
+    >>> configura_orcamento(OrcamentoRemoto(('10.0.0.1', ORCAMENTO_PORTA)))  # nas outras máquinas
+    """
+
+    def __init__(self, 
+        orcamento: Optional[OrcamentoRequisicoes] = None, 
+        host: str = '127.0.0.1', 
+        porta: int = ORCAMENTO_PORTA
+    ):
+        self.orcamento = OrcamentoRequisicoes() if orcamento is None else orcamento
+        coordenador = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for linha in self.rfile:
+                    if linha.strip() != b'reserva':
+                        return
+                    self.wfile.write(f'{coordenador.orcamento.reserva()!r}\n'.encode())
+
+        self.servidor = socketserver.ThreadingTCPServer((host, porta), Handler)
+        self.servidor.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endereco(self) -> tuple[str, int]:
+        return self.servidor.server_address[:2]
+
+    def inicia(self) -> 'CoordenadorOrcamento':
+        """atende em uma thread (ver também `servidor.serve_forever()`)."""
+        self._thread = threading.Thread(target = self.servidor.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def para(self) -> None:
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.inicia()
+
+    def __exit__(self, *exc):
+        self.para()
+
+#%%
+# controle adaptativo das requisições ao TSE
+class CircuitoAberto(ConnectionError):
+    """requisição recusada pelo controlador de requisições: o servidor está fora do ar (circuito aberto)."""
+
+class ControladorTaxa:
+    """controlador adaptativo das requisições ao TSE (taxa, retentativas e circuito), compartilhado por JSONs auxiliares
+    e downloads (`controlador_taxa`).
+
+    Args:
+        taxa_inicial (float): taxa inicial (req/s); cresce `incremento` req/s por segundo sem erros, até `taxa_max`,
+            e é multiplicada por `fator_reducao` (até `taxa_min`) a cada erro 5xx/429, erro de conexão ou resposta lenta
+        latencia_alvo (float): latência (s) acima da qual a resposta conta como lenta
+        max_tentativas (int): tentativas de cada requisição (espera exponencial entre `espera_base` e `espera_max`, ou Retry-After)
+        limite_falhas (int): falhas consecutivas que abrem o circuito (`CircuitoAberto`) por `espera_circuito` segundos
+        orcamento (OrcamentoRequisicoes): orçamento global adicional (ver `configura_orcamento`)
+    """
+
+    def __init__(self,
+        taxa_inicial: float = REQ_MAX_CALLS / REQ_PERIOD,
+        taxa_min: float = REQ_RATE_MIN,
+        taxa_max: float = REQ_RATE_MAX,
+        incremento: float = 1.0,
+        fator_reducao: float = 0.5,
+        latencia_alvo: float = REQ_LATENCY_TARGET,
+        max_tentativas: int = REQ_MAX_RETRIES,
+        espera_base: float = REQ_BACKOFF_BASE,
+        espera_max: float = REQ_BACKOFF_MAX,
+        limite_falhas: int = CIRCUIT_MAX_FAILURES,
+        espera_circuito: float = CIRCUIT_COOLDOWN,
+        orcamento: Optional[OrcamentoRequisicoes] = None
+    ):
+        self.taxa = taxa_inicial
+        self.taxa_min = taxa_min
+        self.taxa_max = taxa_max
+        self.incremento = incremento
+        self.fator_reducao = fator_reducao
+        self.latencia_alvo = latencia_alvo
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.limite_falhas = limite_falhas
+        self.espera_circuito = espera_circuito
+        self.orcamento = orcamento
+
+        self.circuito = 'fechado'
+        self.falhas_consecutivas = 0
+        self.reset_stats()
+
+        self._proximo = 0.0  # instante liberado para a próxima requisição
+        self._ultima_reducao = float('-inf')
+        self._reabre_em = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    def requisita(self, func, *args, max_tentativas: Optional[int] = None, **kwargs):
+        """executa o GET `func(*args, **kwargs)` sob o controle de taxa, com retentativas.
+        Respostas 5xx/429 (`status_code`) e erros de conexão são repetidos; após a última tentativa,
+        a última resposta é retornada (ou a última exceção é levantada).
+        """
+
+        max_tentativas = self._max_tentativas(max_tentativas)
+        for tentativa in range(max_tentativas):
+            espera, teste = self._reserva()
+            time.sleep(espera)
+            inicio = time.monotonic()
+            try:
+                resposta = func(*args, **kwargs)
+            except Exception as e:
+                if not self._registra_excecao(e, teste) or tentativa + 1 == max_tentativas:
+                    raise
+                retry_after = _retry_after(getattr(e, 'headers', None))
+            else:
+                status = getattr(resposta, 'status_code', None)
+                if not self._registra_resposta(status, time.monotonic() - inicio, teste) or tentativa + 1 == max_tentativas:
+                    return resposta
+                retry_after = _retry_after(resposta.headers)
+
+            time.sleep(self.espera_retentativa(tentativa, retry_after))
+
+    async def requisita_async(self, func, *args, max_tentativas: Optional[int] = None, **kwargs):
+        """versão assíncrona de `requisita` (`func` é uma função assíncrona)."""
+
+        max_tentativas = self._max_tentativas(max_tentativas)
+        for tentativa in range(max_tentativas):
+            espera, teste = await self._reserva_async()
+            await asyncio.sleep(espera)
+            inicio = time.monotonic()
+            try:
+                resposta = await func(*args, **kwargs)
+            except Exception as e:
+                if not self._registra_excecao(e, teste) or tentativa + 1 == max_tentativas:
+                    raise
+                retry_after = _retry_after(getattr(e, 'headers', None))
+            else:
+                status = getattr(resposta, 'status_code', None)
+                if not self._registra_resposta(status, time.monotonic() - inicio, teste) or tentativa + 1 == max_tentativas:
+                    return resposta
+                retry_after = _retry_after(resposta.headers)
+
+            await asyncio.sleep(self.espera_retentativa(tentativa, retry_after))
+
+    def espera_retentativa(self, tentativa: int, retry_after: Optional[float] = None) -> float:
+        """espera (s) antes da retentativa: exponencial com jitter, ou a indicada pelo servidor."""
+        with self._lock:
+            self.retries += 1
+        
+        espera = random.uniform(0, min(self.espera_max, self.espera_base * 2 ** tentativa))
+        if retry_after is not None:
+            espera = max(espera, min(self.espera_max, retry_after))
+        return espera
+
+    def registra(self, sucesso: bool, latencia: Optional[float] = None, limitada: bool = False, teste: bool = False) -> None:
+        """registra o resultado de uma requisição (ajusta a taxa e o circuito).
+        Com o circuito meio-aberto, só a requisição de teste (`teste`, ver `_reserva`) fecha ou reabre o circuito;
+        requisições que já estavam em andamento quando o circuito abriu não alteram o circuito.
+        """
+
+        with self._lock:
+            agora = time.monotonic()
+
+            if sucesso:
+                self.falhas_consecutivas = 0
+                if teste and self.circuito == 'meio-aberto':
+                    self.circuito = 'fechado'
+            else:
+                self.errors += 1
+                self.throttled += limitada
+                self.falhas_consecutivas += 1
+                if teste or (self.circuito == 'fechado' and self.falhas_consecutivas >= self.limite_falhas):
+                    self.circuito = 'aberto'
+                    self._reabre_em = agora + self.espera_circuito
+            if teste:
+                self._testando = False
+
+            if sucesso and (latencia is None or latencia <= self.latencia_alvo):
+                # aumento aditivo: `incremento` req/s a cada segundo na taxa atual
+                self.taxa = min(self.taxa_max, self.taxa + self.incremento / self.taxa)
+            elif agora - self._ultima_reducao >= self.latencia_alvo:
+                # redução multiplicativa (uma por janela: falhas simultâneas contam como um único sinal)
+                self.taxa = max(self.taxa_min, self.taxa * self.fator_reducao)
+                self._ultima_reducao = agora
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'rate': self.taxa, 'requests': self.requests, 'errors': self.errors, 'throttled': self.throttled,
+                'retries': self.retries, 'rejected': self.rejected, 'circuit': self.circuito
+            }
+
+    def reset_stats(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _max_tentativas(self, max_tentativas: Optional[int]) -> int:
+        if max_tentativas is None:
+            return self.max_tentativas
+        if max_tentativas < 1:
+            raise ValueError(f'max_tentativas deve ser ao menos 1 ({max_tentativas})')
+        return max_tentativas
+
+    def _reserva(self) -> tuple[float, bool]:
+        # reserva o horário da próxima requisição; retorna a espera até ele (s) 
+        # e se a requisição é a requisição de teste do circuito meio-aberto
+        espera, teste = self._reserva_local()
+        if self.orcamento is not None:
+            espera = max(espera, self.orcamento.reserva())
+        return espera, teste
+
+    async def _reserva_async(self) -> tuple[float, bool]:
+        # versão assíncrona de `_reserva`: a reserva no orçamento global (trava de arquivo ou socket) 
+        # é feita em outra thread, sem bloquear o event loop
+        espera, teste = self._reserva_local()
+        if self.orcamento is not None:
+            espera = max(espera, await asyncio.to_thread(self.orcamento.reserva))
+        return espera, teste
+
+    def _reserva_local(self) -> tuple[float, bool]:
+        with self._lock:
+            agora = time.monotonic()
+
+            if self.circuito != 'fechado':
+                if self.circuito == 'aberto' and agora >= self._reabre_em:
+                    self.circuito = 'meio-aberto'
+                
+                if self.circuito == 'aberto' or self._testando:
+                    self.rejected += 1
+                    raise CircuitoAberto(f'Servidor indisponível: {self.falhas_consecutivas} falhas consecutivas')
+                # requisição de teste
+                self._testando = teste = True
+            else:
+                teste = False
+
+            instante = max(agora, self._proximo)
+            self._proximo = instante + 1 / self.taxa
+            self.requests += 1
+
+        return instante - agora, teste
+
+    def _registra_resposta(self, status: Optional[int], latencia: float, teste: bool = False) -> bool:
+        # registra uma resposta; indica se deve ser repetida
+        transitoria = status is not None and _status_transitorio(status)
+        self.registra(not transitoria, latencia, limitada = status == 429, teste = teste)
+        return transitoria
+
+    def _registra_excecao(self, e: Exception, teste: bool = False) -> bool:
+        # registra uma exceção; indica se deve ser repetida
+        status = getattr(e, 'status', None)
+        if status is None:
+            # urllib.error.HTTPError
+            status = getattr(e, 'code', None)
+        if not isinstance(e, (requests.RequestException, URLError, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, TimeoutError)):
+            # erro local (ex.: gravação do arquivo): não diz nada sobre o servidor, e não altera taxa nem circuito
+            # (apenas libera a requisição de teste do circuito meio-aberto)
+            if teste:
+                with self._lock:
+                    self._testando = False
+            return False
+
+        transitoria = not isinstance(status, int) or _status_transitorio(status)
+        self.registra(not transitoria, limitada = status == 429, teste = teste)
+        return transitoria
+
+def _status_transitorio(status: int) -> bool:
+    return status == 429 or status >= 500
+
+def _retry_after(headers) -> Optional[float]:
+    # espera indicada pelo servidor (apenas em segundos)
+    try:
+        return float(headers['Retry-After'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+controlador_taxa = ControladorTaxa(orcamento = OrcamentoArquivo(os.environ[ORCAMENTO_ENV]) if os.environ.get(ORCAMENTO_ENV) else None)
+
+def configura_orcamento(
+    orcamento: Optional[OrcamentoRequisicoes] = None, 
+    caminho: Optional[Path] = None
+) -> OrcamentoRequisicoes:
+    """ativa um orçamento de requisições compartilhado entre processos no controlador `controlador_taxa`.
+    Também pode ser ativado pela variável de ambiente VOTECOUNTER_ORCAMENTO (arquivo do orçamento), herdada por subprocessos.
+
+    Args:
+        orcamento (OrcamentoRequisicoes): orçamento (default: `OrcamentoArquivo` em `caminho`)
+        caminho (Path): arquivo do orçamento (default: ORCAMENTO_PATH)
+
+    Returns:
+        OrcamentoRequisicoes: orçamento ativado
+    """
+    if orcamento is None:
+        orcamento = OrcamentoArquivo(ORCAMENTO_PATH if caminho is None else caminho)
+
+    controlador_taxa.orcamento = orcamento
+    return orcamento
 
 #%%
 # requests rate limiter
-@RateLimiter(max_calls = REQ_MAX_CALLS, period = REQ_PERIOD)
+# taxa de requisições controlada (`controlador_taxa`) e compartilhada entre JSONs auxiliares (get_rl) e downloads de arquivos
+# sessão http compartilhada (conexões keep-alive reaproveitadas entre requisições)
+http_session = requests.Session()
+http_session.mount('https://', requests.adapters.HTTPAdapter(
+    pool_connections = 4, 
+    pool_maxsize = DOWNLOAD_WORKERS
+))
+
 def get_rl(*args, **kwargs):
-    return requests.get(*args, **kwargs)
+    return controlador_taxa.requisita(http_session.get, *args, **kwargs)
 
 # function to download concurrently
 # https://stackoverflow.com/questions/52000950/python-wget-download-multiple-files-at-once
 def wget_download_async(
     url: str,
     dl_file: Path,
-    vm = None
+    vm = None,
+    max_tentativas: Optional[int] = None
 ) -> None:
-    wget.download(
-        url = url,
-        out = str(dl_file)
-    )
+    # download em arquivo temporário, renomeado só ao final: nunca fica um arquivo pela metade no destino
+    dl_file = Path(dl_file)
+    dl_tmp = dl_file.with_name(dl_file.name + '.part')
+
+    def baixa():
+        if dl_tmp.exists():
+            # o wget não sobrescreve arquivos: descarta restos de uma tentativa anterior
+            dl_tmp.unlink()
+        wget.download(
+            url = url,
+            out = str(dl_tmp)
+        )
+
+    controlador_taxa.requisita(baixa, max_tentativas = max_tentativas)
+    os.replace(dl_tmp, dl_file)
 
     if vm is not None:
-        vm.caminho_bu = dl_file
+        vm.caminho_bu = Path(dl_file)
         vm.stale_data = False
 
+@dataclass
+class DownloadJob:
+    # sem `url` (e `bu_path`), a URL da urna é obtida na própria thread de download, e arquivos já presentes
+    # no armazenamento (`store`) são reaproveitados sem download
+    url: Optional[str] = None
+    bu_path: Optional[Path | str] = None
+    vm: Optional['VotingMachine'] = None
+    store: Optional['BUStore | SegmentStore'] = None
+    attempts: int = 0
+    error: Optional[Exception] = None
+    done: bool = False
+    caminho_dl_root: Optional[Path] = None
+
+def download_jobs(
+    jobs: Iterable[DownloadJob],
+    workers: int = DOWNLOAD_WORKERS,
+    max_retries: int = DOWNLOAD_MAX_RETRIES,
+    progressbar = None
+) -> List[DownloadJob]:
+    """baixa arquivos com uma quantidade fixa de threads, independente da quantidade de downloads.
+    Os trabalhos são consumidos de uma fila limitada (o iterável `jobs` só é consumido à medida que há threads livres),
+    e cada trabalho (inclusive a obtenção da URL, em trabalhos sem `url`) é tentado até `max_retries` vezes
+    (com espera entre as tentativas). 
+    Todos os downloads passam pelo controlador de requisições compartilhado (`controlador_taxa`).
+
+    Args:
+        jobs (Iterable[DownloadJob]): trabalhos de download (pode ser um gerador)
+        workers (int): quantidade de threads de download
+        max_retries (int): quantidade máxima de tentativas por trabalho
+        progressbar (Callable): função que embrulha o iterador de resultados (ex. tqdm)
+
+    Returns:
+        list[DownloadJob]: trabalhos concluídos ou com falha (`done`, `attempts` e `error` preenchidos)
+    """
+
+    if progressbar is None:
+        progressbar = lambda iter: iter
+
+    fila_jobs = queue.Queue(maxsize = 2 * workers)
+    fila_resultados = queue.Queue()
+    fim = object()
+    erros_produtor = []
+
+    def produtor():
+        try:
+            for job in jobs:
+                fila_jobs.put(job)  # bloqueia enquanto a fila estiver cheia
+        except BaseException as e:
+            # erro ao gerar os trabalhos: levantado ao final, depois que os trabalhos já gerados forem concluídos
+            erros_produtor.append(e)
+        finally:
+            for _ in range(workers):
+                fila_jobs.put(fim)
+
+    def consumidor():
+        # o sentinela é sempre enviado: o iterador de resultados nunca fica esperando por uma thread encerrada
+        try:
+            while True:
+                job = fila_jobs.get()
+                if job is fim:
+                    return
+
+                processa(job)
+                fila_resultados.put(job)
+        finally:
+            fila_resultados.put(fim)
+
+    def processa(job: DownloadJob):
+        while not job.done and job.attempts < max_retries:
+            job.attempts += 1
+            try:
+                if job.url is None:
+                    job.url = job.vm.get_info_download_url()
+                    job.bu_path = job.store.caminho(job.vm, job.url, job.caminho_dl_root)
+
+                    # arquivo já presente no armazenamento: não baixa novamente
+                    if job.store.consulta(job.bu_path):
+                        job.vm.caminho_bu = job.store.referencia(job.bu_path)
+                        job.done = True
+                        job.error = None
+                        return
+
+                if job.store is None:
+                    job.bu_path.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+                    wget_download_async(job.url, job.bu_path, job.vm, max_tentativas = 1)
+                else:
+                    ref = job.store.baixa(job.url, job.bu_path, max_tentativas = 1)
+                    if job.vm is not None:
+                        job.vm.caminho_bu = ref
+                        job.vm.stale_data = False
+                job.done = True
+                job.error = None
+            except Exception as e:
+                # qualquer falha (rede, IncompleteRead, armazenamento) fica registrada no trabalho
+                job.error = e
+                if job.attempts < max_retries:
+                    time.sleep(controlador_taxa.espera_retentativa(job.attempts - 1))
+
+    threads = [ threading.Thread(target = produtor, daemon = True) ]
+    threads += [ threading.Thread(target = consumidor, daemon = True) for _ in range(workers) ]
+    for thread in threads:
+        thread.start()
+
+    def resultados():
+        ativos = workers
+        while ativos > 0:
+            job = fila_resultados.get()
+            if job is fim:
+                ativos -= 1
+            else:
+                yield job
+
+    concluidos = list(progressbar(resultados()))
+
+    for thread in threads:
+        thread.join()
+
+    if erros_produtor:
+        raise erros_produtor[0]
+
+    return concluidos
+
 #%%
-# dataclasses
+# cliente assíncrono
+class AsyncRateLimiter:
+    """limitador de requisições para asyncio: no máximo `max_calls` requisições a cada `period` segundos."""
+
+    def __init__(self, max_calls: int = REQ_MAX_CALLS, period: float = REQ_PERIOD):
+        self.max_calls = max_calls
+        self.period = period
+        self.calls = collections.deque()
+        self._lock = None
+
+    async def __aenter__(self):
+        # o lock é criado dentro do event loop que o utiliza
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                while self.calls and self.calls[0] <= agora - self.period:
+                    self.calls.popleft()
+                
+                if len(self.calls) < self.max_calls:
+                    break
+                
+                await asyncio.sleep(self.calls[0] + self.period - agora)
+            
+            self.calls.append(agora)
+        
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class TSEClient:
+    """cliente assíncrono para a API de resultados do TSE, com a taxa definida pelo controlador (default: `controlador_taxa`).
+    Com `max_calls`, tem também um teto fixo de `max_calls` requisições a cada `period` segundos.
+
+    >>> async with TSEClient() as client:
+    ...     jsondata = await client.get_json(url)
+    """
+
+    def __init__(self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_calls: Optional[int] = None,
+        period: float = REQ_PERIOD,
+        timeout: float = HTTP_TIMEOUT,
+        controlador: Optional[ControladorTaxa] = None
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.rate_limiter = contextlib.nullcontext() if max_calls is None else AsyncRateLimiter(max_calls = max_calls, period = period)
+        self.controlador = controlador_taxa if controlador is None else controlador
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = self.max_connections),
+            timeout = aiohttp.ClientTimeout(total = self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        return False
+
+    async def get_json(self, url: str):
+        async def get():
+            async with self.rate_limiter:
+                async with self.session.get(url) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type = None)
+        
+        return await self.controlador.requisita_async(get)
+
+    async def get_bytes(self, url: str) -> bytes:
+        async def get():
+            async with self.rate_limiter:
+                async with self.session.get(url) as response:
+                    response.raise_for_status()
+                    return await response.read()
+        
+        return await self.controlador.requisita_async(get)
+
+    async def get_json_conditional(self, url: str, 
+        etag: Optional[str] = None, 
+        last_modified: Optional[str] = None
+    ) -> tuple[Optional[Dict], Optional[str], Optional[str]]:
+        """requisição condicional (If-None-Match / If-Modified-Since).
+
+        Returns:
+            tuple: JSON (None se o recurso não mudou), ETag e Last-Modified atuais
+        """
+
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        async def get():
+            async with self.rate_limiter:
+                async with self.session.get(url, headers = headers) as response:
+                    if response.status == 304:
+                        return None, etag, last_modified
+                    
+                    response.raise_for_status()
+                    jsondata = await response.json(content_type = None)
+                    
+                    return jsondata, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        
+        return await self.controlador.requisita_async(get)
+
+    async def get_bytes_conditional(self, url: str, 
+        etag: Optional[str] = None, 
+        last_modified: Optional[str] = None,
+        controlador: Optional[ControladorTaxa] = None
+    ) -> tuple[Optional[bytes], Optional[str], Optional[str]]:
+        """versão de `get_json_conditional` que retorna o conteúdo sem interpretá-lo (None se o recurso não mudou).
+        `controlador` substitui o controlador de requisições do cliente nesta requisição.
+        """
+
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        async def get():
+            async with self.rate_limiter:
+                async with self.session.get(url, headers = headers) as response:
+                    if response.status == 304:
+                        return None, etag, last_modified
+                    
+                    response.raise_for_status()
+                    conteudo = await response.read()
+                    
+                    return conteudo, response.headers.get('ETag', etag), response.headers.get('Last-Modified', last_modified)
+        
+        controlador = self.controlador if controlador is None else controlador
+        return await controlador.requisita_async(get)
+
+    async def download(self, url: str, dl_file: Path, 
+        resume: bool = True, 
+        chunk_size: int = 2**16
+    ) -> Path:
+        """baixa `url` em `dl_file`. O download é feito em um arquivo temporário ('.part'), renomeado ao final.
+        Com `resume`, um arquivo temporário de uma tentativa anterior é continuado (HTTP Range), se o servidor permitir.
+        """
+
+        dl_file = Path(dl_file)
+        dl_tmp = dl_file.with_name(dl_file.name + '.part')
+
+        async def baixa():
+            # cada tentativa continua o arquivo temporário deixado pela anterior
+            headers = {}
+            inicio = 0
+            if resume and dl_tmp.exists():
+                inicio = dl_tmp.stat().st_size
+                headers['Range'] = f'bytes={inicio}-'
+
+            async with self.rate_limiter:
+                async with self.session.get(url, headers = headers) as response:
+                    if response.status == 416:
+                        # nada a continuar: o arquivo temporário já estava completo
+                        return
+                    
+                    response.raise_for_status()
+                    if response.status != 206:
+                        # servidor ignorou o Range: recomeça do zero
+                        inicio = 0
+
+                    with open(dl_tmp, 'ab' if inicio > 0 else 'wb') as file:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            file.write(chunk)
+                    
+                    tamanho_esperado = response.content_length
+                    if tamanho_esperado is not None and dl_tmp.stat().st_size != inicio + tamanho_esperado:
+                        raise aiohttp.ClientPayloadError(f'Download incompleto: {url}')
+
+        await self.controlador.requisita_async(baixa)
+        os.replace(dl_tmp, dl_file)
+        
+        return dl_file
+
+
+async def _with_client(client: Optional[TSEClient], func):
+    # executa func(client) com o cliente informado, ou com um cliente temporário
+    if client is not None:
+        return await func(client)
+    
+    async with TSEClient() as client:
+        return await func(client)
+
+#%%
+# coalescência das requisições dos JSONs auxiliares
+class CacheRequisicoes:
+    """camada de coalescência (single-flight) e cache de curta duração das requisições de JSON (`cache_aux`).
+    Chamadas simultâneas para a mesma URL esperam pela mesma requisição, e a resposta é reaproveitada durante `ttl` segundos:
+    o JSON auxiliar de uma seção é obtido uma única vez por ciclo de atualização, mesmo que `check_data_staleness` e
+    `get_url_download_urna` o consultem em seguida. Os chamadores recebem o mesmo objeto JSON (que não deve ser alterado).
+    """
+
+    def __init__(self, ttl: float = AUX_CACHE_TTL):
+        """
+        Args:
+            ttl (float): segundos em que uma resposta é reaproveitada
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._respostas: Dict[str, tuple[float, object]] = {}
+        self._em_andamento: Dict[str, concurrent.futures.Future] = {}
+        self._em_andamento_async: Dict[tuple, asyncio.Future] = {}
+        self._limpeza = 1024
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str):
+        """JSON de `url` (via `get_rl`)."""
+
+        with self._lock:
+            jsondata = self._consulta(url)
+            if jsondata is not None:
+                return jsondata
+            
+            futuro = self._em_andamento.get(url)
+            requisitar = futuro is None
+            if requisitar:
+                futuro = self._em_andamento[url] = concurrent.futures.Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        
+        if not requisitar:
+            # espera pela requisição já em andamento
+            return futuro.result()
+
+        try:
+            jsondata = get_rl(url).json()
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            self._guarda(url, jsondata)
+            futuro.set_result(jsondata)
+            return jsondata
+        finally:
+            with self._lock:
+                del self._em_andamento[url]
+
+    async def get_json_async(self, url: str, client: Optional['TSEClient'] = None):
+        """versão assíncrona de `get_json` (via `TSEClient.get_json`)."""
+
+        chave = (id(asyncio.get_running_loop()), url)
+        with self._lock:
+            jsondata = self._consulta(url)
+            if jsondata is not None:
+                return jsondata
+            
+            tarefa = self._em_andamento_async.get(chave)
+            if tarefa is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+
+        if tarefa is not None:
+            # espera pela requisição já em andamento (que continua para os demais se este chamador for cancelado)
+            return await asyncio.shield(tarefa)
+
+        async def requisita():
+            try:
+                jsondata = await _with_client(client, lambda client: client.get_json(url))
+                self._guarda(url, jsondata)
+                return jsondata
+            finally:
+                with self._lock:
+                    del self._em_andamento_async[chave]
+
+        tarefa = self._em_andamento_async[chave] = asyncio.ensure_future(requisita())
+        return await asyncio.shield(tarefa)
+
+    def invalida(self, url: Optional[str] = None) -> None:
+        """descarta a resposta guardada de `url` (ou todas)."""
+        with self._lock:
+            if url is None:
+                self._respostas.clear()
+            else:
+                self._respostas.pop(url, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'entries': len(self._respostas)}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+    def _consulta(self, url: str):
+        # resposta ainda válida (com o lock adquirido)
+        resposta = self._respostas.get(url)
+        if resposta is None:
+            return None
+        
+        expira, jsondata = resposta
+        if time.monotonic() >= expira:
+            del self._respostas[url]
+            return None
+        
+        self.hits += 1
+        return jsondata
+
+    def _guarda(self, url: str, jsondata) -> None:
+        with self._lock:
+            agora = time.monotonic()
+            self._respostas[url] = (agora + self.ttl, jsondata)
+            
+            # descarta as respostas expiradas
+            if len(self._respostas) > 2 * self._limpeza:
+                self._respostas = { u: r for u, r in self._respostas.items() if r[0] > agora }
+                self._limpeza = max(len(self._respostas), 1024)
+
+cache_aux = CacheRequisicoes()
+
+#%%
+# armazenamento dos arquivos baixados, endereçado pela hash da urna
+class BUStore:
+    """armazenamento dos arquivos das urnas endereçado pela hash da urna: cada arquivo fica em 
+    `{diretório da seção}/{hash_urna}/{nome do arquivo}`. Um arquivo presente nesse caminho é a versão correspondente 
+    à hash (os downloads só são renomeados para o caminho final quando completos), e portanto é reaproveitado 
+    em vez de baixado novamente, desde que o seu tamanho seja o declarado no cabeçalho BER do arquivo 
+    (um arquivo truncado é baixado novamente).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def caminho(vm: 'VotingMachine', url: str, caminho_dl_root: Optional[Path] = None) -> Path:
+        url_path = Path(url)
+        hash_urna = url_path.parent.name
+        return vm.get_info_download_path(caminho_dl_root).joinpath(hash_urna, url_path.name)
+
+    def consulta(self, bu_path: Path) -> bool:
+        """verifica se o arquivo já está completo no armazenamento (e contabiliza hit/miss)."""
+
+        try:
+            with open(bu_path, 'rb') as file:
+                cabecalho = file.read(BER_CABECALHO_MAX)
+                tamanho = os.fstat(file.fileno()).st_size
+        except FileNotFoundError:
+            presente = False
+        else:
+            # o TLV externo do arquivo deve terminar exatamente no fim do arquivo
+            try:
+                presente = _ber_cabecalho(cabecalho, 0)[2] == tamanho
+            except IndexError:
+                presente = False
+        
+        with self._lock:
+            if presente:
+                self.hits += 1
+            else:
+                self.misses += 1
+        
+        return presente
+
+    def referencia(self, bu_path: Path) -> Path:
+        # referência usada para ler o arquivo (VotingMachine.caminho_bu)
+        return bu_path
+
+    def baixa(self, url: str, bu_path: Path, max_tentativas: Optional[int] = None) -> Path:
+        bu_path.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+        wget_download_async(url, bu_path, max_tentativas = max_tentativas)
+        return bu_path
+
+    def obtem(self, vm: 'VotingMachine', url: str, caminho_dl_root: Optional[Path] = None) -> Path:
+        """retorna o caminho local do arquivo, baixando-o apenas se necessário."""
+
+        bu_path = self.caminho(vm, url, caminho_dl_root)
+        if not self.consulta(bu_path):
+            self.baixa(url, bu_path)
+        
+        return bu_path
+
+    async def obtem_async(self, vm: 'VotingMachine', url: str, 
+        client: TSEClient, 
+        caminho_dl_root: Optional[Path] = None
+    ) -> Path:
+        """versão assíncrona de `obtem` (downloads interrompidos são continuados)."""
+
+        bu_path = self.caminho(vm, url, caminho_dl_root)
+        if not self.consulta(bu_path):
+            bu_path.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+            await client.download(url, bu_path)
+        
+        return bu_path
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+@dataclass(frozen = True)
+class SegmentRef:
+    # localização de um arquivo dentro de um segmento
+    segment: Path
+    offset: int
+    length: int
+
+
+class SegmentStore:
+    """armazenamento alternativo ao BUStore: os arquivos são concatenados em poucos arquivos grandes (segmentos), 
+    com um índice (SQLite) de deslocamentos, em vez de um diretório por seção. A leitura é feita por memory mapping.
+    Mantém a mesma interface do BUStore; as referências (VotingMachine.caminho_bu) são `SegmentRef`.
+
+    >>> VotingMachine.bu_store = SegmentStore(BU_ROOTDIR)
+
+    Cada arquivo é gravado ao final do segmento atual e só depois registrado no índice: 
+    uma gravação interrompida deixa apenas bytes órfãos ao final do segmento, nunca uma entrada inválida.
+    As gravações são feitas sob trava de arquivo (flock / msvcrt.locking), de forma que vários processos 
+    podem usar o mesmo diretório.
+    """
+
+    def __init__(self, root: Path = BU_ROOTDIR, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.root = Path(root).absolute().joinpath('segmentos')
+        self.root.mkdir(mode = 0o774, parents = True, exist_ok = True)
+        self.segment_max_bytes = segment_max_bytes
+        
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # a criação do índice (e a mudança para WAL) também é feita sob a trava de arquivo
+        self._fd_trava = os.open(self.root.joinpath('segmentos.lock'), os.O_RDWR | os.O_CREAT, 0o664)
+        _trava_arquivo(self._fd_trava, True)
+        try:
+            self.conn = sqlite3.connect(self.root.joinpath('index.sqlite'), check_same_thread = False, isolation_level = None)
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('PRAGMA synchronous = NORMAL')
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    chave TEXT PRIMARY KEY, segmento INTEGER, offset INTEGER, tamanho INTEGER
+                )
+            """)
+            
+            ultimo = self.conn.execute('SELECT MAX(segmento) FROM blobs').fetchone()[0]
+        finally:
+            _trava_arquivo(self._fd_trava, False)
+        
+        self._segmento_atual = 0 if ultimo is None else ultimo
+
+    def _caminho_segmento(self, segmento: int) -> Path:
+        return self.root.joinpath(f'seg-{segmento:0>5d}.bin')
+
+    @staticmethod
+    def caminho(vm: 'VotingMachine', url: str, caminho_dl_root: Optional[Path] = None) -> str:
+        # chave do arquivo: hash da urna + nome do arquivo (caminho_dl_root não se aplica: segmentos ficam em self.root)
+        url_path = Path(url)
+        return f'{url_path.parent.name}/{url_path.name}'
+
+    def referencia(self, chave: str) -> Optional[SegmentRef]:
+        with self._lock:
+            linha = self.conn.execute('SELECT segmento, offset, tamanho FROM blobs WHERE chave = ?', (chave,)).fetchone()
+        
+        if linha is None:
+            return None
+        
+        segmento, offset, tamanho = linha
+        return SegmentRef(segment = self._caminho_segmento(segmento), offset = offset, length = tamanho)
+
+    def consulta(self, chave: str) -> bool:
+        presente = self.referencia(chave) is not None
+        
+        with self._lock:
+            if presente:
+                self.hits += 1
+            else:
+                self.misses += 1
+        
+        return presente
+
+    def grava(self, chave: str, conteudo: bytes) -> SegmentRef:
+        with self._lock:
+            # deslocamento, gravação e registro sob trava de arquivo: outros processos podem gravar no mesmo segmento
+            _trava_arquivo(self._fd_trava, True)
+            try:
+                # o segmento atual pode ter sido avançado por outro processo
+                ultimo = self.conn.execute('SELECT MAX(segmento) FROM blobs').fetchone()[0]
+                self._segmento_atual = max(self._segmento_atual, ultimo or 0)
+
+                segment = self._caminho_segmento(self._segmento_atual)
+                offset = segment.stat().st_size if segment.exists() else 0
+
+                if offset > 0 and offset + len(conteudo) > self.segment_max_bytes:
+                    self._segmento_atual += 1
+                    segment = self._caminho_segmento(self._segmento_atual)
+                    offset = 0
+                
+                with open(segment, 'ab') as file:
+                    file.write(conteudo)
+                
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)', 
+                    (chave, self._segmento_atual, offset, len(conteudo))
+                )
+            finally:
+                _trava_arquivo(self._fd_trava, False)
+        
+        return SegmentRef(segment = segment, offset = offset, length = len(conteudo))
+
+    def baixa(self, url: str, chave: str, max_tentativas: Optional[int] = None) -> SegmentRef:
+        restapi = controlador_taxa.requisita(http_session.get, url, max_tentativas = max_tentativas)
+        restapi.raise_for_status()
+        return self.grava(chave, restapi.content)
+
+    def obtem(self, vm: 'VotingMachine', url: str, caminho_dl_root: Optional[Path] = None) -> SegmentRef:
+        chave = self.caminho(vm, url)
+        if self.consulta(chave):
+            return self.referencia(chave)
+        
+        return self.baixa(url, chave)
+
+    async def obtem_async(self, vm: 'VotingMachine', url: str, 
+        client: TSEClient, 
+        caminho_dl_root: Optional[Path] = None
+    ) -> SegmentRef:
+        chave = self.caminho(vm, url)
+        if self.consulta(chave):
+            return self.referencia(chave)
+        
+        conteudo = await client.get_bytes(url)
+        # gravação (e espera pela trava) fora do event loop
+        return await asyncio.to_thread(self.grava, chave, conteudo)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+            os.close(self._fd_trava)
+
+
+# segmentos mapeados em memória (um mapeamento por segmento, por processo)
+_segment_mmaps: Dict = {}
+_segment_mmaps_lock = threading.Lock()
+
+def le_segmento(ref: SegmentRef) -> memoryview:
+    """retorna o conteúdo de um arquivo armazenado em segmento, sem cópia (fatia do mapeamento em memória)."""
+
+    fim = ref.offset + ref.length
+    chave = str(ref.segment)
+
+    with _segment_mmaps_lock:
+        mapeamento = _segment_mmaps.get(chave)
+        
+        # segmento cresceu desde o mapeamento: mapeia novamente
+        if mapeamento is None or len(mapeamento) < fim:
+            with open(ref.segment, 'rb') as file:
+                mapeamento = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            _segment_mmaps[chave] = mapeamento
+    
+    return memoryview(mapeamento)[ref.offset:fim]
+
+#%%
+# cache de especificações ASN.1 compiladas
+_asn1_specs: Dict = {}
+_asn1_specs_lock = threading.Lock()
+
+def get_asn1_spec(
+    asn1_paths: List = ASN1_PATHS,
+    codec: str = 'ber',
+    cache_dir: Optional[Path] = ASN1_CACHE_DIR
+):
+    """retorna a especificação ASN.1 compilada para o conjunto de descritores, compilando no máximo uma vez por processo.
+    A especificação compilada também é serializada em disco, indexada pelo hash do conteúdo dos descritores, 
+    de forma que um novo processo apenas a carrega do disco. Qualquer alteração nos descritores invalida o cache.
+
+    Args:
+        asn1_paths (list): caminhos dos descritores ASN.1
+        codec (str): codec do asn1tools ('ber', 'der', ...)
+        cache_dir (Path): diretório do cache em disco (None desabilita o cache em disco)
+
+    Returns:
+        asn1tools.compiler.Specification: especificação compilada
+    """
+
+    paths = tuple(str(Path(asn1_path).resolve()) for asn1_path in asn1_paths)
+    key = (paths, codec)
+
+    # cache em memória
+    spec = _asn1_specs.get(key)
+    if spec is not None:
+        return spec
+
+    with _asn1_specs_lock:
+        spec = _asn1_specs.get(key)
+        if spec is not None:
+            return spec
+
+        # hash do conteúdo dos descritores (e da versão do asn1tools)
+        hasher = hashlib.sha256()
+        hasher.update(f'{asn1tools.__version__}:{codec}'.encode('ascii'))
+        for asn1_path in paths:
+            with open(asn1_path, 'rb') as file:
+                hasher.update(file.read())
+        
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = Path(cache_dir).joinpath(f'asn1spec-{codec}-{hasher.hexdigest()[:32]}.pickle')
+
+            try:
+                with open(cache_file, 'rb') as file:
+                    spec = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                spec = None
+        
+        if spec is None:
+            spec = asn1tools.compile_files(list(paths), codec = codec)
+
+            if cache_file is not None:
+                try:
+                    cache_file.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+                    # escrita atômica: outro processo nunca enxerga um arquivo pela metade
+                    cache_tmp = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+                    with open(cache_tmp, 'wb') as file:
+                        pickle.dump(spec, file, protocol = pickle.HIGHEST_PROTOCOL)
+                    os.replace(cache_tmp, cache_file)
+                except OSError:
+                    # cache em disco é apenas uma otimização
+                    pass
+
+        _asn1_specs[key] = spec
+
+    return spec
+
+#%%
+# leitura BER de baixo nível (sem cópias)
+def _ber_tlv(data, offset: int) -> tuple[int, int, int]:
+    """lê o TLV BER que começa em `offset`.
+
+    Returns:
+        tuple[int, int, int]: tag (primeiro octeto), início e fim do conteúdo
+    """
+
+    tag, offset, fim = _ber_cabecalho(data, offset)
+    if fim > len(data):
+        raise ValueError('TLV ultrapassa o fim dos dados.')
+    
+    return tag, offset, fim
+
+def _ber_cabecalho(data, offset: int) -> tuple[int, int, int]:
+    # tag e comprimento do TLV BER que começa em `offset`, sem verificar se o conteúdo está presente em `data`
+    tag = data[offset]
+    offset += 1
+    if tag & 0x1f == 0x1f:
+        # tag de vários octetos
+        while data[offset] & 0x80:
+            offset += 1
+        offset += 1
+
+    length = data[offset]
+    offset += 1
+    if length & 0x80:
+        n_octetos = length & 0x7f
+        if n_octetos == 0:
+            raise ValueError('Comprimento indefinido não suportado.')
+        length = int.from_bytes(data[offset:offset + n_octetos], 'big')
+        offset += n_octetos
+    
+    return tag, offset, offset + length
+
+def _ber_tlvs(data, inicio: int, fim: int) -> Iterator[tuple[int, int, int, int]]:
+    # TLVs consecutivos entre `inicio` e `fim`: (tag, início do TLV, início do conteúdo, fim)
+    offset = inicio
+    while offset < fim:
+        tag, conteudo_inicio, conteudo_fim = _ber_tlv(data, offset)
+        yield tag, offset, conteudo_inicio, conteudo_fim
+        offset = conteudo_fim
+
+@contextlib.contextmanager
+def abre_bu(bu_path) -> Iterator[memoryview]:
+    """abre um arquivo de boletim de urna (ou referência em segmento) como memoryview, sem copiar o conteúdo."""
+
+    if isinstance(bu_path, SegmentRef):
+        yield le_segmento(bu_path)
+        return
+
+    with open(bu_path, 'rb') as file:
+        try:
+            mapeamento = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            # arquivo vazio não pode ser mapeado
+            yield memoryview(b'')
+            return
+    
+    dados = memoryview(mapeamento)
+    try:
+        yield dados
+    finally:
+        dados.release()
+        try:
+            mapeamento.close()
+        except BufferError:
+            # ainda há fatias do mapeamento em uso (ex.: nos frames do traceback de um erro de decodificação):
+            # o mapeamento é fechado quando elas forem liberadas, e o erro original é mantido
+            pass
+
+#%%
+# decodificação rápida dos totais de votos (layout de bu.asn1)
+# enumerações de bu.asn1
+CARGOS_CONSTITUCIONAIS = {
+    1: 'presidente', 2: 'vicePresidente', 3: 'governador', 4: 'viceGovernador', 5: 'senador',
+    6: 'deputadoFederal', 7: 'deputadoEstadual', 8: 'deputadoDistrital', 
+    9: 'primeiroSuplenteSenador', 10: 'segundoSuplenteSenador', 
+    11: 'prefeito', 12: 'vicePrefeito', 13: 'vereador',
+}
+TIPOS_CARGO = { 1: 'majoritario', 2: 'proporcional', 3: 'consulta' }
+TIPOS_VOTO = { 1: 'nominal', 2: 'branco', 3: 'nulo', 4: 'legenda', 5: 'cargoSemCandidato' }
+
+@dataclass
+class TotaisBU:
+    """totais de votos de um boletim de urna, em arrays planos.
+    Os arrays `stats_*` têm uma posição por resultado de votação (eleição x tipo de cargo);
+    os demais têm uma posição por votável. Códigos de cargo: 1..13 são cargos constitucionais (CARGOS_CONSTITUCIONAIS), 
+    25..99 são consultas livres. `partido` e `codigo` valem -1 quando não há identificação do votável (brancos e nulos).
+    """
+    municipio: int
+    zona: int
+    local: int
+    secao: int
+    stats_id_eleicao: np.ndarray
+    stats_tipo_cargo: np.ndarray
+    stats_eleitores_aptos: np.ndarray
+    stats_comparecimento: np.ndarray
+    id_eleicao: np.ndarray
+    tipo_cargo: np.ndarray
+    cargo: np.ndarray
+    tipo_voto: np.ndarray
+    qtd_votos: np.ndarray
+    partido: np.ndarray
+    codigo: np.ndarray
+
+def _ber_int(data, inicio: int, fim: int) -> int:
+    valor = data[inicio]
+    if valor & 0x80:
+        return int.from_bytes(data[inicio:fim], 'big', signed = True)
+    
+    for i in range(inicio + 1, fim):
+        valor = (valor << 8) | data[i]
+    
+    return valor
+
+def decodifica_totais_bu(bu_encoded) -> TotaisBU:
+    """decodifica apenas identificação da seção e totais de votos de um EntidadeBoletimUrna (BER).
+    Percorre os TLVs diretamente, sem montar dicionários e sem copiar assinaturas e demais campos não utilizados.
+
+    Args:
+        bu_encoded (bytes-like): EntidadeBoletimUrna codificado (conteúdo do envelope)
+
+    Returns:
+        TotaisBU: totais de votos
+    """
+
+    data = bu_encoded
+    tag, inicio, fim = _ber_tlv(data, 0)
+    if tag != 0x30:
+        raise ValueError('EntidadeBoletimUrna não é um SEQUENCE.')
+
+    municipio = zona = local = secao = None
+    stats_id_eleicao, stats_tipo_cargo, stats_aptos, stats_comparecimento = [], [], [], []
+    id_eleicao_l, tipo_cargo_l, cargo_l = [], [], []
+    # (tipo_voto, qtd_votos, partido, codigo) de cada votável, em sequência
+    votaveis = []
+    votaveis_extend = votaveis.extend
+
+    n_sequences = 0
+    for tag, _, a, b in _ber_tlvs(data, inicio, fim):
+        if tag == 0x30:
+            n_sequences += 1
+            # cabecalho, urna, identificacaoSecao
+            if n_sequences != 3:
+                continue
+            
+            for tag_id, _, ia, ib in _ber_tlvs(data, a, b):
+                if tag_id == 0x30:
+                    (_, _, ma, mb), (_, _, za, zb) = _ber_tlvs(data, ia, ib)
+                    municipio, zona = _ber_int(data, ma, mb), _ber_int(data, za, zb)
+                elif local is None:
+                    local = _ber_int(data, ia, ib)
+                else:
+                    secao = _ber_int(data, ia, ib)
+        
+        elif tag == 0xa3:
+            # resultadosVotacaoPorEleicao
+            for _, _, ra, rb in _ber_tlvs(data, a, b):
+                (_, _, ea, eb), (_, _, apa, apb), (_, _, rva, rvb) = _ber_tlvs(data, ra, rb)
+                id_eleicao = _ber_int(data, ea, eb)
+                aptos = _ber_int(data, apa, apb)
+
+                # resultadosVotacao
+                for _, _, va, vb in _ber_tlvs(data, rva, rvb):
+                    (_, _, tca, tcb), (_, _, ca, cb), (_, _, ta, tb) = _ber_tlvs(data, va, vb)
+                    tipo_cargo = _ber_int(data, tca, tcb)
+
+                    stats_id_eleicao.append(id_eleicao)
+                    stats_tipo_cargo.append(tipo_cargo)
+                    stats_aptos.append(aptos)
+                    stats_comparecimento.append(_ber_int(data, ca, cb))
+
+                    # totaisVotosCargo
+                    for _, _, tva, tvb in _ber_tlvs(data, ta, tb):
+                        (_, _, cca, ccb), _, (_, _, vva, vvb) = _ber_tlvs(data, tva, tvb)
+                        cargo = _ber_int(data, cca, ccb)
+
+                        # votosVotaveis: laço mais executado, com a leitura dos TLVs feita em linha
+                        n_votos = len(votaveis)
+                        pos = vva
+                        while pos < vvb:
+                            length = data[pos + 1]
+                            pos += 2
+                            if length & 0x80:
+                                n_octetos = length & 0x7f
+                                length = int.from_bytes(data[pos:pos + n_octetos], 'big')
+                                pos += n_octetos
+                            fim_votavel = pos + length
+
+                            # layout usual: tipoVoto [1] de 1 octeto, quantidadeVotos [2] de 1 ou 2 octetos
+                            # (partido, de 0..99, com 1 octeto; codigo, de 0..99999, com até 3 octetos)
+                            l_qtd = data[pos + 4]
+                            pos_id = pos + 5 + l_qtd
+                            if (data[pos] == 0x81 and data[pos + 1] == 1 and data[pos + 3] == 0x82 and l_qtd <= 2 
+                                and not data[pos + 5] & 0x80 and (data[pos_id] != 0xa3 or data[pos_id + 3] == 1)):
+                                tipo_voto = data[pos + 2]
+                                if l_qtd == 1:
+                                    qtd = data[pos + 5]
+                                else:
+                                    qtd = (data[pos + 5] << 8) | data[pos + 6]
+                                
+                                if data[pos_id] == 0xa3:
+                                    partido = data[pos_id + 4]
+                                    codigo = int.from_bytes(data[pos_id + 7:pos_id + 7 + data[pos_id + 6]], 'big')
+                                else:
+                                    partido = codigo = -1
+                                
+                                # assinatura: ignorada
+                                pos = fim_votavel
+                                
+                                votaveis_extend((tipo_voto, qtd, partido, codigo))
+                                continue
+
+                            tipo_voto = qtd = None
+                            partido = codigo = -1
+                            while pos < fim_votavel:
+                                tag_v = data[pos]
+                                length = data[pos + 1]
+                                pos += 2
+                                if length & 0x80:
+                                    n_octetos = length & 0x7f
+                                    length = int.from_bytes(data[pos:pos + n_octetos], 'big')
+                                    pos += n_octetos
+                                
+                                if tag_v == 0x81:
+                                    tipo_voto = _ber_int(data, pos, pos + length)
+                                elif tag_v == 0x82:
+                                    qtd = _ber_int(data, pos, pos + length)
+                                elif tag_v == 0xa3:
+                                    # identificacaoVotavel: partido e codigo (INTEGERs curtos)
+                                    l_partido = data[pos + 1]
+                                    partido = _ber_int(data, pos + 2, pos + 2 + l_partido)
+                                    pos_codigo = pos + 2 + l_partido
+                                    codigo = _ber_int(data, pos_codigo + 2, pos_codigo + 2 + data[pos_codigo + 1])
+                                # assinatura (0x04): ignorada
+                                
+                                pos += length
+                            
+                            votaveis_extend((tipo_voto, qtd, partido, codigo))
+                        
+                        n_votos = (len(votaveis) - n_votos) // 4
+                        id_eleicao_l.extend([id_eleicao] * n_votos)
+                        tipo_cargo_l.extend([tipo_cargo] * n_votos)
+                        cargo_l.extend([cargo] * n_votos)
+
+    votaveis = np.array(votaveis, dtype = np.int32).reshape(-1, 4)
+
+    return TotaisBU(
+        municipio = municipio,
+        zona = zona,
+        local = local,
+        secao = secao,
+        stats_id_eleicao = np.array(stats_id_eleicao, dtype = np.int32),
+        stats_tipo_cargo = np.array(stats_tipo_cargo, dtype = np.int8),
+        stats_eleitores_aptos = np.array(stats_aptos, dtype = np.int16),
+        stats_comparecimento = np.array(stats_comparecimento, dtype = np.int16),
+        id_eleicao = np.array(id_eleicao_l, dtype = np.int32),
+        tipo_cargo = np.array(tipo_cargo_l, dtype = np.int8),
+        cargo = np.array(cargo_l, dtype = np.int8),
+        tipo_voto = votaveis[:, 0].astype(np.int8),
+        qtd_votos = votaveis[:, 1].astype(np.int16),
+        partido = votaveis[:, 2].astype(np.int8),
+        codigo = votaveis[:, 3].copy(),
+    )
+
+def conteudo_envelope(envelope_encoded) -> memoryview:
+    # fatia (sem cópia) com o conteúdo de um EntidadeEnvelopeGenerico
+    data = memoryview(envelope_encoded)
+    tag, inicio, fim = _ber_tlv(data, 0)
+    if tag != 0x30:
+        raise ValueError('Envelope não é um SEQUENCE.')
+    
+    for tag, _, a, b in _ber_tlvs(data, inicio, fim):
+        if tag == 0x04:
+            return data[a:b]
+    
+    raise ValueError('Envelope sem conteúdo.')
+
+def decodifica_totais_arquivo_bu(bu_path: Path | SegmentRef) -> TotaisBU:
+    """decodifica os totais de votos de um arquivo de boletim de urna (ver `decodifica_totais_bu`)."""
+
+    with abre_bu(bu_path) as envelope_encoded:
+        bu_encoded = conteudo_envelope(envelope_encoded)
+        try:
+            return decodifica_totais_bu(bu_encoded)
+        finally:
+            bu_encoded.release()
+
+#%%
+# decodificação de boletins de urna
+
+# componentes de EntidadeBoletimUrna, na ordem da especificação: 
+# (nome, tag de contexto se OPTIONAL ou IMPLICIT, tipo, SEQUENCE OF)
+COMPONENTES_BU: Final = (
+    ('cabecalho', None, 'CabecalhoEntidade', False),
+    ('fase', None, 'Fase', False),
+    ('urna', None, 'Urna', False),
+    ('identificacaoSecao', None, 'IdentificacaoSecaoEleitoral', False),
+    ('dataHoraEmissao', None, 'DataHoraJE', False),
+    ('dadosSecaoSA', None, 'DadosSecaoSA', False),
+    ('qtdEleitoresLibCodigo', 0x81, 'QtdEleitores', False),
+    ('qtdEleitoresCompBiometrico', 0x82, 'QtdEleitores', False),
+    ('resultadosVotacaoPorEleicao', 0xa3, 'ResultadoVotacaoPorEleicao', True),
+    ('historicoCorrespondencias', 0xa4, 'CorrespondenciaResultado', True),
+    ('historicoVotoImpresso', 0xa5, 'HistoricoVotoImpresso', True),
+    ('chaveAssinaturaVotosVotavel', None, None, False),
+)
+
+# componentes de EntidadeEnvelopeGenerico, na ordem da especificação: 
+# (nome, tag se OPTIONAL, tipo) (`conteudo`, o boletim codificado, não é decodificado)
+COMPONENTES_ENVELOPE: Final = (
+    ('cabecalho', None, 'CabecalhoEntidade'),
+    ('fase', None, 'Fase'),
+    ('urna', 0x30, 'Urna'),
+    ('identificacao', None, 'IdentificacaoUrna'),
+    ('tipoEnvelope', None, 'TipoEnvelope'),
+    ('seguranca', 0x30, 'Seguranca'),
+    ('conteudo', None, None),
+)
+
+@dataclass(frozen = True)
+class ProjecaoBU:
+    """componentes de primeiro nível a decodificar do envelope e do boletim. 
+    `None` decodifica todos os componentes; uma sequência vazia não decodifica nenhum 
+    (sem componentes do boletim, o conteúdo do envelope nem é lido).
+    
+    Ex.: `ProjecaoBU(envelope = (), boletim = ('urna', 'dataHoraEmissao'))` para auditoria das urnas.
+    """
+    envelope: Optional[Iterable[str]] = None
+    boletim: Optional[Iterable[str]] = None
+
+    def __post_init__(self):
+        for nome, validos in (('envelope', [ c[0] for c in COMPONENTES_ENVELOPE[:-1] ]), ('boletim', [ c[0] for c in COMPONENTES_BU ])):
+            componentes = getattr(self, nome)
+            if componentes is None:
+                continue
+            
+            if isinstance(componentes, str):
+                componentes = (componentes,)
+            componentes = frozenset(componentes)
+            
+            desconhecidos = componentes.difference(validos)
+            if desconhecidos:
+                raise ValueError(f'Componentes inexistentes em {nome}: {", ".join(sorted(desconhecidos))}')
+            
+            object.__setattr__(self, nome, componentes)
+
+PROJECAO_TOTAIS: Final = ProjecaoBU(envelope = (), boletim = ('identificacaoSecao', 'resultadosVotacaoPorEleicao'))
+
+def decodifica_bu(
+    bu_path: Path | SegmentRef,
+    asn1_paths: List = ASN1_PATHS,
+    projecao: Optional[ProjecaoBU] = None
+) -> tuple[Dict, Dict]:
+    """decodifica um arquivo de boletim de urna (envelope e boletim).
+
+    Args:
+        bu_path (Path | SegmentRef): caminho do arquivo .bu, ou referência dentro de um segmento
+        asn1_paths (list): caminhos dos descritores ASN.1
+        projecao (ProjecaoBU): componentes a decodificar (default: todos)
+
+    Returns:
+        tuple[dict, dict]: envelope (sem o conteúdo) e boletim de urna decodificados
+    """
+
+    conv = get_asn1_spec(asn1_paths, codec = "ber")
+    if projecao is None:
+        projecao = ProjecaoBU()
+
+    with abre_bu(bu_path) as envelope_encoded:
+        try:
+            envelope_decoded, bu_encoded = _separa_envelope(conv, envelope_encoded, projecao.envelope)
+        except (ValueError, IndexError):
+            # arquivo fora do layout esperado: decodificação completa (o asn1tools informa o erro)
+            envelope_decoded = conv.decode("EntidadeEnvelopeGenerico", envelope_encoded)
+            bu_encoded = envelope_decoded["conteudo"]
+            del envelope_decoded["conteudo"]  # remove o conteúdo para não imprimir como array de bytes
+
+            if projecao.envelope is not None:
+                envelope_decoded = { k: v for k, v in envelope_decoded.items() if k in projecao.envelope }
+
+        if projecao.boletim is None:
+            bu_decoded = conv.decode("EntidadeBoletimUrna", bu_encoded)
+        elif not projecao.boletim:
+            bu_decoded = {}
+        else:
+            try:
+                bu_decoded = _decodifica_componentes_bu(conv, bu_encoded, projecao.boletim)
+            except (ValueError, IndexError):
+                bu_decoded = conv.decode("EntidadeBoletimUrna", bu_encoded)
+                bu_decoded = { k: v for k, v in bu_decoded.items() if k in projecao.boletim }
+        
+        del bu_encoded
+
+    return envelope_decoded, bu_decoded
+
+def _decodifica_componentes_bu(conv, bu_encoded: memoryview, componentes: frozenset) -> Dict:
+    # percorre os componentes do boletim no nível dos TLVs e decodifica apenas os componentes pedidos
+    tag, inicio, fim = _ber_tlv(bu_encoded, 0)
+    if tag != 0x30:
+        raise ValueError('EntidadeBoletimUrna não é um SEQUENCE.')
+    
+    # tipos procurados no módulo do boletim (alguns nomes se repetem em outros módulos, como `Urna`)
+    tipos = conv.modules['ModuloBU']
+
+    bu_decoded = {}
+    esperados = iter(COMPONENTES_BU)
+    for tag, tlv_inicio, conteudo_inicio, conteudo_fim in _ber_tlvs(bu_encoded, inicio, fim):
+        # próximo componente compatível com a tag (componentes OPTIONAL ausentes são pulados)
+        for nome, tag_contexto, tipo, sequence_of in esperados:
+            if tag_contexto is None or tag_contexto == tag:
+                break
+        else:
+            raise ValueError(f'Componente inesperado no boletim (tag {tag:#x}).')
+        
+        if nome not in componentes:
+            continue
+
+        if tipo is None:
+            # OCTET STRING
+            bu_decoded[nome] = bytes(bu_encoded[conteudo_inicio:conteudo_fim])
+        elif sequence_of:
+            bu_decoded[nome] = [
+                tipos[tipo].decode(bu_encoded[a:b])
+                for _, a, _, b in _ber_tlvs(bu_encoded, conteudo_inicio, conteudo_fim)
+            ]
+        elif tag_contexto is not None:
+            # tag IMPLICIT: substituída pela tag universal do tipo (INTEGER)
+            bu_decoded[nome] = tipos[tipo].decode(b'\x02' + bytes(bu_encoded[tlv_inicio + 1:conteudo_fim]))
+        else:
+            bu_decoded[nome] = tipos[tipo].decode(bu_encoded[tlv_inicio:conteudo_fim])
+    
+    return bu_decoded
+
+def _separa_envelope(conv, envelope_encoded: memoryview, componentes: Optional[frozenset] = None) -> tuple[Dict, memoryview]:
+    # percorre os componentes do envelope no nível dos TLVs e decodifica apenas os componentes pedidos (default: todos);
+    # devolve o conteúdo como fatia (sem cópia) dos dados originais
+    tag, inicio, fim = _ber_tlv(envelope_encoded, 0)
+    if tag != 0x30:
+        raise ValueError('Envelope não é um SEQUENCE.')
+    
+    tipos = conv.modules['ModuloBU']
+
+    envelope_decoded = {}
+    bu_encoded = None
+    esperados = iter(COMPONENTES_ENVELOPE)
+    for tag, tlv_inicio, conteudo_inicio, conteudo_fim in _ber_tlvs(envelope_encoded, inicio, fim):
+        # próximo componente compatível com a tag (componentes OPTIONAL ausentes são pulados)
+        for nome, tag_opcional, tipo in esperados:
+            if tag_opcional is None or tag_opcional == tag:
+                break
+        else:
+            raise ValueError(f'Componente inesperado no envelope (tag {tag:#x}).')
+
+        if nome == 'conteudo':
+            if tag != 0x04:
+                raise ValueError(f'Conteúdo do envelope não é um OCTET STRING (tag {tag:#x}).')
+            bu_encoded = envelope_encoded[conteudo_inicio:conteudo_fim]
+        elif componentes is None or nome in componentes:
+            envelope_decoded[nome] = tipos[tipo].decode(envelope_encoded[tlv_inicio:conteudo_fim])
+    
+    if bu_encoded is None:
+        raise ValueError('Envelope sem conteúdo.')
+
+    return envelope_decoded, bu_encoded
+
+# funções executadas nos processos de decodificação
+def _decode_worker_init(asn1_paths: List) -> None:
+    # cada processo compila (ou carrega do cache em disco) a sua especificação uma única vez
+    get_asn1_spec(asn1_paths)
+
+def _decode_worker(args: tuple) -> tuple[int, Dict, Dict]:
+    idx, bu_path, asn1_paths, projecao = args
+    envelope_decoded, bu_decoded = decodifica_bu(bu_path, asn1_paths, projecao)
+    return idx, envelope_decoded, bu_decoded
+
 @dataclass
+class PipelineResult:
+    vm: 'VotingMachine'
+    url: Optional[str] = None
+    bu_path: Optional[Path] = None
+    totalizacao: Optional[pd.DataFrame] = None
+    stats_df: Optional[pd.DataFrame] = None
+    error: Optional[Exception] = None
+
+_FIM = object()  # sentinela de fim de fila
+
+#%%
+# tabulação dos votos em colunas
+# esquema compacto das tabelas: menores larguras seguras pelas faixas de bu.asn1, 
+# inteiros anuláveis para os campos ausentes em brancos e nulos, e categorias para os textos repetidos.
+# (somas e agregações de colunas int16/int32 são feitas em int64 pelo pandas, sem estouro)
+ESQUEMA_TOTALIZACAO: Final = {
+    'tipo_voto': 'category',
+    'qtd_votos': 'int16',       # QtdEleitores 0..9999 (votos de um votável em uma seção)
+    'partido': 'Int8',          # NumeroPartido 0..99
+    'codigo': 'Int32',          # NumeroVotavel 0..99999
+    'cargo': 'category',
+    'tipo_cargo': 'category',
+    'e_valido': 'bool',
+    'id_eleicao': 'int32',      # IDEleicao 0..99999
+    'id_municipio': 'int32',    # CodigoMunicipio 1..99999
+    'zona': 'int16',            # NumeroZona 1..9999
+    'secao': 'int16',           # NumeroSecao 1..9999
+    'dominio': 'category',
+    'dominio_local': 'category',
+}
+ESQUEMA_STATS: Final = {
+    'id_eleicao': 'int32',      # IDEleicao 0..99999
+    'tipo_cargo': 'category',
+    'eleitores_aptos': 'int16', # QtdEleitores 0..9999
+    'comparecimento': 'int16',  # QtdEleitores 0..9999
+    'estado': 'category',
+    'id_municipio': 'int32',    # CodigoMunicipio 1..99999
+    'zona': 'int16',            # NumeroZona 1..9999
+    'secao': 'int16',           # NumeroSecao 1..9999
+}
+
+# colunas categóricas: guardadas como códigos na ordem de aparecimento (valor -> código em `categorias`)
+CATEGORIAS_VOTOS: Final = ('tipo_voto', 'cargo', 'tipo_cargo', 'dominio', 'dominio_local', 'estado')
+
+def colunas_votos_bu(bu: Dict, estado: str) -> tuple[Dict, Dict, Dict]:
+    """extrai as colunas das tabelas de votos e de comparecimento de um boletim decodificado, em arrays NumPy
+    com os tipos de ESQUEMA_TOTALIZACAO e ESQUEMA_STATS. O boletim é percorrido uma única vez; 
+    as colunas categóricas são códigos, e `categorias` mapeia valor -> código.
+
+    Args:
+        bu (dict): boletim de urna decodificado (ao menos `identificacaoSecao` e `resultadosVotacaoPorEleicao`)
+        estado (str): sigla do estado da seção
+
+    Returns:
+        tuple[dict, dict, dict]: colunas de votos, colunas de comparecimento e categorias
+    """
+
+    resultados = bu['resultadosVotacaoPorEleicao']
+    localizacao = bu['identificacaoSecao']
+    municipio = localizacao['municipioZona']['municipio']
+    zona = localizacao['municipioZona']['zona']
+    secao = localizacao['secao']
+
+    # tamanhos das tabelas
+    n_stats = sum(len(resultado['resultadosVotacao']) for resultado in resultados)
+    n_votos = sum(
+        len(resultado_votacao_tipo['votosVotaveis'])
+        for resultado in resultados
+        for resultado_votacao in resultado['resultadosVotacao']
+        for resultado_votacao_tipo in resultado_votacao['totaisVotosCargo']
+    )
+
+    categorias = { nome: {} for nome in CATEGORIAS_VOTOS }
+    tipos_voto, cargos, tipos_cargo = categorias['tipo_voto'], categorias['cargo'], categorias['tipo_cargo']
+    categorias['estado'][estado] = 0
+
+    stats = {
+        'id_eleicao': np.empty(n_stats, dtype = np.int32),
+        'tipo_cargo': np.empty(n_stats, dtype = np.int32),
+        'eleitores_aptos': np.empty(n_stats, dtype = np.int16),
+        'comparecimento': np.empty(n_stats, dtype = np.int16),
+        'estado': np.zeros(n_stats, dtype = np.int32),
+        'id_municipio': np.full(n_stats, municipio, dtype = np.int32),
+        'zona': np.full(n_stats, zona, dtype = np.int16),
+        'secao': np.full(n_stats, secao, dtype = np.int16),
+    }
+
+    id_eleicao = np.empty(n_votos, dtype = np.int32)
+    qtd_votos = np.empty(n_votos, dtype = np.int16)
+    partido = np.zeros(n_votos, dtype = np.int8)
+    codigo = np.zeros(n_votos, dtype = np.int32)
+    sem_identificacao = np.zeros(n_votos, dtype = bool)
+    cod_tipo_voto = np.empty(n_votos, dtype = np.int32)
+    cod_cargo = np.empty(n_votos, dtype = np.int32)
+    cod_tipo_cargo = np.empty(n_votos, dtype = np.int32)
+
+    i = j = 0
+    # para cada eleicao (a eleicao para presidente tem numero diferente da dos outros)
+    for resultado in resultados:
+        id_eleicao_resultado = resultado['idEleicao']
+        eleitores_aptos = resultado['qtdEleitoresAptos']
+
+        # para eleicoes com voto majoritário e proporcional
+        for resultado_votacao in resultado['resultadosVotacao']:
+            cod_tipo_cargo_resultado = tipos_cargo.setdefault(resultado_votacao['tipoCargo'], len(tipos_cargo))
+
+            stats['id_eleicao'][j] = id_eleicao_resultado
+            stats['tipo_cargo'][j] = cod_tipo_cargo_resultado
+            stats['eleitores_aptos'][j] = eleitores_aptos
+            stats['comparecimento'][j] = resultado_votacao['qtdComparecimento']
+            j += 1
+
+            # para cada cargo
+            for resultado_votacao_tipo in resultado_votacao['totaisVotosCargo']:
+                cargo = resultado_votacao_tipo['codigoCargo'][1]
+                votos = resultado_votacao_tipo['votosVotaveis']
+
+                fim = i + len(votos)
+                id_eleicao[i:fim] = id_eleicao_resultado
+                cod_tipo_cargo[i:fim] = cod_tipo_cargo_resultado
+                cod_cargo[i:fim] = cargos.setdefault(cargo, len(cargos))
+
+                for voto in votos:
+                    cod_tipo_voto[i] = tipos_voto.setdefault(voto['tipoVoto'], len(tipos_voto))
+                    qtd_votos[i] = voto['quantidadeVotos']
+
+                    id_votavel = voto.get('identificacaoVotavel')
+                    if id_votavel is None:
+                        sem_identificacao[i] = True
+                    else:
+                        partido[i] = id_votavel['partido']
+                        codigo[i] = id_votavel['codigo']
+                    i += 1
+
+    # dominio do cargo (pais, estado, municipio), calculado uma vez por cargo
+    dominios, dominios_locais = categorias['dominio'], categorias['dominio_local']
+    dominio_cargo, dominio_local_cargo = [], []
+    for cargo in cargos:
+        if cargo == 'presidente':
+            dominio, dominio_local = 'pais', 'br'
+        elif isinstance(cargo, str) and (cargo.startswith('deputado') or cargo == 'senador'):
+            dominio, dominio_local = 'estado', estado
+        else:
+            dominio, dominio_local = 'municipio', str(municipio)
+        dominio_cargo.append(dominios.setdefault(dominio, len(dominios)))
+        dominio_local_cargo.append(dominios_locais.setdefault(dominio_local, len(dominios_locais)))
+
+    votos = {
+        'tipo_voto': cod_tipo_voto,
+        'qtd_votos': qtd_votos,
+        'partido': partido,
+        'codigo': codigo,
+        'sem_identificacao': sem_identificacao,
+        'cargo': cod_cargo,
+        'tipo_cargo': cod_tipo_cargo,
+        'id_eleicao': id_eleicao,
+        'id_municipio': np.full(n_votos, municipio, dtype = np.int32),
+        'zona': np.full(n_votos, zona, dtype = np.int16),
+        'secao': np.full(n_votos, secao, dtype = np.int16),
+        'dominio': np.array(dominio_cargo, dtype = np.int32)[cod_cargo],
+        'dominio_local': np.array(dominio_local_cargo, dtype = np.int32)[cod_cargo],
+    }
+
+    return votos, stats, categorias
+
+def tabelas_votos(votos: Dict, stats: Dict, categorias: Dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """monta as tabelas `totalizacao` e `stats_df` a partir das colunas (ver `colunas_votos_bu`), com uma construção cada,
+    nos tipos de ESQUEMA_TOTALIZACAO e ESQUEMA_STATS.
+
+    Args:
+        votos (dict): colunas de votos
+        stats (dict): colunas de comparecimento
+        categorias (dict): valor -> código de cada coluna categórica
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: `totalizacao` e `stats_df`
+    """
+
+    # votáveis sem identificação (brancos e nulos): partido e código nulos
+    sem_identificacao = votos['sem_identificacao']
+
+    totalizacao = pd.DataFrame({
+        'tipo_voto': _categorias(votos['tipo_voto'], categorias['tipo_voto']),
+        'qtd_votos': votos['qtd_votos'],
+        'partido': pd.arrays.IntegerArray(votos['partido'], sem_identificacao.copy()),
+        'codigo': pd.arrays.IntegerArray(votos['codigo'], sem_identificacao.copy()),
+        'cargo': _categorias(votos['cargo'], categorias['cargo']),
+        'tipo_cargo': _categorias(votos['tipo_cargo'], categorias['tipo_cargo']),
+        'e_valido': _tipo_voto_valido(categorias)[votos['tipo_voto']],
+        'id_eleicao': votos['id_eleicao'],
+        'id_municipio': votos['id_municipio'],
+        'zona': votos['zona'],
+        'secao': votos['secao'],
+        'dominio': _categorias(votos['dominio'], categorias['dominio']),
+        'dominio_local': _categorias(votos['dominio_local'], categorias['dominio_local']),
+    })
+
+    stats_df = pd.DataFrame({
+        'id_eleicao': stats['id_eleicao'],
+        'tipo_cargo': _categorias(stats['tipo_cargo'], categorias['tipo_cargo']),
+        'eleitores_aptos': stats['eleitores_aptos'],
+        'comparecimento': stats['comparecimento'],
+        'estado': _categorias(stats['estado'], categorias['estado']),
+        'id_municipio': stats['id_municipio'],
+        'zona': stats['zona'],
+        'secao': stats['secao'],
+    })
+
+    return totalizacao, stats_df
+
+def _tipo_voto_valido(categorias: Dict) -> np.ndarray:
+    # votos válidos (não brancos nem nulos), por código de tipo de voto
+    return np.array([ tipo_voto not in ('branco', 'nulo') for tipo_voto in categorias['tipo_voto'] ], dtype = bool)
+
+def _categorias(codigos: np.ndarray, categorias: Dict) -> pd.Categorical:
+    # converte códigos na ordem de aparecimento em categorias ordenadas pelo pandas
+    # (que também ordena valores de tipos misturados, ex.: cargos de consultas livres são inteiros)
+    valores = pd.Categorical(list(categorias))
+    return pd.Categorical.from_codes(valores.codes[codigos], categories = valores.categories)
+
+class _ColunasCrescentes:
+    # colunas NumPy cuja capacidade dobra quando necessário (sem concatenar a cada inclusão)
+
+    def __init__(self, colunas: Dict[str, np.ndarray], capacidade: int = 1024):
+        self.n = 0
+        self.colunas = { nome: np.empty(capacidade, dtype = valores.dtype) for nome, valores in colunas.items() }
+
+    def estende(self, colunas: Dict[str, np.ndarray]) -> None:
+        fim = self.n + len(next(iter(colunas.values())))
+
+        capacidade = len(next(iter(self.colunas.values())))
+        if fim > capacidade:
+            while fim > capacidade:
+                capacidade *= 2
+            for nome, valores in self.colunas.items():
+                novo = np.empty(capacidade, dtype = valores.dtype)
+                novo[:self.n] = valores[:self.n]
+                self.colunas[nome] = novo
+
+        for nome, valores in colunas.items():
+            self.colunas[nome][self.n:fim] = valores
+        self.n = fim
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return { nome: valores[:self.n] for nome, valores in self.colunas.items() }
+
+class TabulacaoVotos:
+    """acumula as colunas de votos e de comparecimento de várias seções em buffers únicos
+    (com códigos de categoria unificados entre as seções), e monta as tabelas uma única vez no final.
+    """
+
+    def __init__(self):
+        vazio = {'identificacaoSecao': {'municipioZona': {'municipio': 0, 'zona': 0}, 'secao': 0}, 'resultadosVotacaoPorEleicao': []}
+        votos, stats, _ = colunas_votos_bu(vazio, '')
+
+        self.votos = _ColunasCrescentes(votos)
+        self.stats = _ColunasCrescentes(stats, capacidade = 64)
+        self.categorias = { nome: {} for nome in CATEGORIAS_VOTOS }
+
+    def adiciona(self, votos: Dict, stats: Dict, categorias: Dict) -> None:
+        """inclui as colunas de uma seção (ver `colunas_votos_bu`)."""
+
+        # traduz os códigos de categoria da seção para os códigos globais
+        traducoes = {}
+        for nome, locais in categorias.items():
+            globais = self.categorias[nome]
+            traducoes[nome] = np.array([ globais.setdefault(valor, len(globais)) for valor in locais ], dtype = np.int32)
+
+        for colunas, buffer in ((votos, self.votos), (stats, self.stats)):
+            buffer.estende({
+                nome: traducoes[nome][valores] if nome in traducoes else valores
+                for nome, valores in colunas.items()
+            })
+
+    def tabelas(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """monta `totalizacao` e `stats_df` com todas as seções incluídas."""
+        return tabelas_votos(self.votos.arrays(), self.stats.arrays(), self.categorias)
+
+# função executada nos processos de tabulação
+def _colunas_worker(args: tuple) -> tuple[Dict, Dict, Dict]:
+    bu_path, asn1_paths, estado = args
+    _, bu_decoded = decodifica_bu(bu_path, asn1_paths, PROJECAO_TOTAIS)
+    return colunas_votos_bu(bu_decoded, estado)
+
+#%%
+# exportação em Parquet (dataset particionado)
+def _importa_pyarrow():
+    # dependência opcional: instalada com `pip install votecounter[parquet]`
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError('A exportação em Parquet requer o pacote pyarrow (pip install votecounter[parquet]).') from e
+
+    return pyarrow, pyarrow.parquet, pyarrow.dataset
+
+class ResultadosParquet:
+    """grava as tabelas de votos e de comparecimento de várias seções em datasets Parquet particionados
+    (`raiz/votos` e `raiz/stats`, no estilo hive: `ano=2022/pleito=406/estado=RJ[/cargo=presidente]`),
+    à medida que as seções são processadas. Cada partição acumula linhas até `linhas_por_grupo` e então grava um row group;
+    cada execução grava arquivos novos (`parte-<uuid>.parquet`), acrescentando seções ao dataset existente.
+    Os tipos das colunas seguem ESQUEMA_TOTALIZACAO e ESQUEMA_STATS (ver `le_resultados_parquet`).
+    """
+
+    def __init__(self,
+        raiz: Path,
+        por_cargo: bool = False,
+        linhas_por_grupo: int = PARQUET_LINHAS_POR_GRUPO
+    ):
+        """
+        Args:
+            raiz (Path): diretório raiz dos datasets
+            por_cargo (bool): particiona a tabela de votos também por cargo
+            linhas_por_grupo (int): linhas de votos acumuladas por partição antes de gravar um row group
+        """
+        self.pa, self.pq, _ = _importa_pyarrow()
+        self.raiz = Path(raiz)
+        self.por_cargo = por_cargo
+        self.linhas_por_grupo = linhas_por_grupo
+        self.secoes = 0
+        self._buffers: Dict[tuple, TabulacaoVotos] = {}
+        self._writers: Dict[tuple, object] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def adiciona(self, vm: 'VotingMachine', bu: Optional[Dict] = None, asn1_paths: List = ASN1_PATHS) -> None:
+        """inclui os votos de uma urna (boletim informado, já decodificado na urna, ou decodificado de `caminho_bu`)."""
+
+        if bu is None:
+            # boletim já em memória (sem disparar a decodificação sob demanda)
+            bu = vm._boletim_urna
+        if bu is None:
+            if vm.caminho_bu is None:
+                raise ValueError(f'Caminho para arquivo do boletim da urna é indefinido! ({vm})')
+            _, bu = decodifica_bu(vm.caminho_bu, asn1_paths, PROJECAO_TOTAIS)
+
+        self.adiciona_colunas(vm, *colunas_votos_bu(bu, vm.section.zone.city.state.abbr))
+
+    def adiciona_multiple(self,
+        vms: Optional[list] = None,
+        progressbar: bool = True,
+        **kwargs
+    ) -> None:
+        """inclui os votos de várias urnas, decodificadas em vários processos (argumentos de `VotingMachine.votos_multiple_df`)."""
+
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+
+        colunas = VotingMachine._colunas_multiple(vms, **kwargs)
+        if progressbar:
+            colunas = tqdm.tqdm(colunas, desc = 'Exporting', total = len(vms))
+
+        for vm, colunas_urna in colunas:
+            self.adiciona_colunas(vm, *colunas_urna)
+
+    def adiciona_colunas(self, vm: 'VotingMachine', votos: Dict, stats: Dict, categorias: Dict) -> None:
+        """inclui as colunas de uma urna (ver `colunas_votos_bu`) na partição do seu pleito e estado."""
+
+        secao = vm.section
+        chave = (secao.contest.year, secao.contest.contest_id, secao.zone.city.state.abbr)
+
+        buffer = self._buffers.get(chave)
+        if buffer is None:
+            buffer = self._buffers[chave] = TabulacaoVotos()
+
+        buffer.adiciona(votos, stats, categorias)
+        self.secoes += 1
+
+        if buffer.votos.n >= self.linhas_por_grupo:
+            self._grava(chave)
+
+    def flush(self) -> None:
+        """grava as linhas acumuladas em todas as partições."""
+        for chave in list(self._buffers):
+            self._grava(chave)
+
+    def close(self) -> None:
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+    def _grava(self, chave: tuple) -> None:
+        buffer = self._buffers.pop(chave)
+        votos, stats, categorias = buffer.votos.arrays(), buffer.stats.arrays(), buffer.categorias
+        particao = dict(zip(('ano', 'pleito', 'estado'), chave))
+
+        # colunas de partição ficam no caminho dos arquivos
+        self._escreve('stats', particao, self._tabela(stats, categorias, ESQUEMA_STATS, excluir = ('estado',)))
+
+        if not self.por_cargo:
+            self._escreve('votos', particao, self._tabela(votos, categorias, ESQUEMA_TOTALIZACAO))
+            return
+
+        cargos = list(categorias['cargo'])
+        for cod_cargo in np.unique(votos['cargo']):
+            linhas = votos['cargo'] == cod_cargo
+            self._escreve(
+                'votos',
+                { **particao, 'cargo': cargos[cod_cargo] },
+                self._tabela({ nome: valores[linhas] for nome, valores in votos.items() }, categorias, ESQUEMA_TOTALIZACAO, excluir = ('cargo',))
+            )
+
+    def _tabela(self, colunas: Dict, categorias: Dict, esquema: Dict, excluir: tuple = ()):
+        # tabela Arrow montada diretamente das colunas, com tipos fixos (iguais em todos os row groups)
+        pa = self.pa
+
+        nomes, arrays = [], []
+        for nome, tipo in esquema.items():
+            if nome in excluir:
+                continue
+
+            if tipo == 'category':
+                array = pa.DictionaryArray.from_arrays(
+                    pa.array(colunas[nome], type = pa.int32()),
+                    pa.array([ str(valor) for valor in categorias[nome] ], type = pa.string())
+                )
+            elif nome == 'e_valido':
+                array = pa.array(_tipo_voto_valido(categorias)[colunas['tipo_voto']])
+            elif tipo in ('Int8', 'Int32'):
+                array = pa.array(colunas[nome], mask = colunas['sem_identificacao'])
+            else:
+                array = pa.array(colunas[nome])
+
+            nomes.append(nome)
+            arrays.append(array)
+
+        return pa.Table.from_arrays(arrays, names = nomes)
+
+    def _escreve(self, tabela: str, particao: Dict, dados) -> None:
+        chave = (tabela,) + tuple(particao.items())
+
+        writer = self._writers.get(chave)
+        if writer is None:
+            diretorio = self.raiz.joinpath(tabela, *[ f'{campo}={valor}' for campo, valor in particao.items() ])
+            diretorio.mkdir(parents = True, exist_ok = True)
+            writer = self._writers[chave] = self.pq.ParquetWriter(diretorio / f'parte-{uuid.uuid4().hex}.parquet', dados.schema)
+
+        writer.write_table(dados)
+
+def le_resultados_parquet(
+    raiz: Path,
+    tabela: str = 'votos',
+    filtros: Optional[Dict] = None,
+    colunas: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """lê um dataset gravado por `ResultadosParquet`, apenas com as partições e colunas pedidas.
+
+    Args:
+        raiz (Path): diretório raiz dos datasets
+        tabela (str): 'votos' ou 'stats'
+        filtros (dict): valor (ou lista de valores) de cada coluna, ex.: {'ano': 2022, 'estado': ['RJ', 'SP']}
+            (filtros nas colunas de partição, ano, pleito, estado e cargo, descartam os arquivos das demais partições)
+        colunas (list): colunas a ler (default: todas, incluindo as de partição)
+
+    Returns:
+        pd.DataFrame: tabela com os tipos de ESQUEMA_TOTALIZACAO ou ESQUEMA_STATS
+    """
+
+    if tabela not in ('votos', 'stats'):
+        raise ValueError(f"Tabela inválida: {tabela} (opções: 'votos', 'stats')")
+
+    _, _, ds = _importa_pyarrow()
+    dataset = ds.dataset(Path(raiz) / tabela, format = 'parquet', partitioning = 'hive')
+
+    filtro = None
+    for campo, valores in (filtros or {}).items():
+        if isinstance(valores, (list, tuple, set)):
+            expressao = ds.field(campo).isin(list(valores))
+        else:
+            expressao = ds.field(campo) == valores
+        filtro = expressao if filtro is None else filtro & expressao
+
+    df = dataset.to_table(columns = colunas, filter = filtro).to_pandas()
+
+    # inteiros anuláveis e categorias (inclusive das colunas de partição)
+    esquema = ESQUEMA_TOTALIZACAO if tabela == 'votos' else ESQUEMA_STATS
+    return df.astype({ coluna: tipo for coluna, tipo in esquema.items() if coluna in df.columns })
+
+#%%
+# índice persistente das hashes das urnas
+class HashIndex:
+    """índice persistente (SQLite) com a informação dos JSONs auxiliares de cada seção: 
+    hash da urna, data e hora de atualização, lista de arquivos e validadores HTTP (ETag / Last-Modified).
+    Evita que um novo processo precise consultar novamente o JSON auxiliar de seções que não mudaram.
+
+    >>> VotingMachine.hash_index = HashIndex()
+    >>> VotingMachine.hash_index.carrega()  # preenche as hashes de VotingMachine.all_vms
+    """
+
+    def __init__(self, path: Path = HASH_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread = False, isolation_level = None)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                ano INTEGER, pleito INTEGER, estado TEXT, 
+                municipio INTEGER, zona INTEGER, secao INTEGER,
+                hash TEXT, hash_dt TEXT, arquivos TEXT,
+                etag TEXT, last_modified TEXT, atualizado_em TEXT,
+                PRIMARY KEY (ano, pleito, estado, municipio, zona, secao)
+            )
+        """)
+
+    @staticmethod
+    def _chave(vm: 'VotingMachine') -> tuple:
+        secao = vm.section
+        zona = secao.zone
+        municipio = zona.city
+        return (
+            secao.contest.year, secao.contest.contest_id, municipio.state.abbr.upper(),
+            municipio.id, zona.id, secao.id
+        )
+
+    def registra(self, vm: 'VotingMachine', 
+        hash_urna: str, 
+        hash_dt: dt, 
+        arquivos: Optional[List[str]] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> None:
+        linha = self._chave(vm) + (
+            hash_urna, hash_dt.isoformat(), json.dumps(arquivos or []),
+            etag, last_modified, dt.now().isoformat()
+        )
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', linha)
+
+    def consulta(self, vm: 'VotingMachine') -> Optional[Dict]:
+        with self._lock:
+            linha = self.conn.execute(
+                """SELECT hash, hash_dt, arquivos, etag, last_modified FROM hashes 
+                WHERE ano = ? AND pleito = ? AND estado = ? AND municipio = ? AND zona = ? AND secao = ?""",
+                self._chave(vm)
+            ).fetchone()
+        
+        if linha is None:
+            return None
+        
+        return self._linha_dict(linha)
+
+    @staticmethod
+    def _linha_dict(linha: tuple) -> Dict:
+        hash_urna, hash_dt, arquivos, etag, last_modified = linha
+        return {
+            'hash': hash_urna,
+            'hash_dt': dt.fromisoformat(hash_dt),
+            'arquivos': json.loads(arquivos),
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+
+    def carrega(self, vms: Optional[Iterable] = None) -> int:
+        """preenche hash, data de atualização e validadores HTTP das urnas a partir do índice, em lote.
+
+        Args:
+            vms (Iterable): urnas (default: todas as urnas)
+
+        Returns:
+            int: quantidade de urnas preenchidas
+        """
+
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+        
+        por_chave = { self._chave(vm): vm for vm in vms }
+        pleitos_estados = set(chave[:3] for chave in por_chave)
+
+        carregadas = 0
+        for ano, pleito, estado in pleitos_estados:
+            with self._lock:
+                linhas = self.conn.execute(
+                    """SELECT municipio, zona, secao, hash, hash_dt, arquivos, etag, last_modified FROM hashes 
+                    WHERE ano = ? AND pleito = ? AND estado = ?""",
+                    (ano, pleito, estado)
+                ).fetchall()
+            
+            for linha in linhas:
+                vm = por_chave.get((ano, pleito, estado) + linha[:3])
+                if vm is None:
+                    continue
+                
+                vm._aplica_hash_index(self._linha_dict(linha[3:]))
+                carregadas += 1
+        
+        return carregadas
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+#%%
+# cache dos JSONs de configuração (municípios, zonas e seções de cada estado)
+class CacheConfig:
+    """cache em disco dos JSONs de configuração de cada estado (`-cs.json`), por (ano, pleito, estado),
+    com os validadores HTTP (ETag / Last-Modified) da última resposta.
+    Um JSON obtido (ou revalidado) há menos de `max_age` segundos é usado sem consultar a rede;
+    depois disso é revalidado com uma requisição condicional (resposta 304: o JSON em cache continua válido).
+    Se a revalidação falhar por erro de rede, o JSON em cache é usado.
+    """
+
+    def __init__(self, diretorio: Path = CONFIG_CACHE_DIR, max_age: float = CONFIG_MAX_AGE):
+        """
+        Args:
+            diretorio (Path): diretório do cache
+            max_age (float): segundos em que um JSON em cache é usado sem revalidação
+        """
+        self.diretorio = Path(diretorio)
+        self.max_age = max_age
+
+    def caminho(self, ano: int, pleito: int, estado: str) -> Path:
+        return self.diretorio.joinpath(str(ano), str(pleito), f'{estado.lower()}.json')
+
+    def le(self, ano: int, pleito: int, estado: str) -> Optional[Dict]:
+        """entrada do cache (`jsondata`, `etag`, `last_modified`), ou None."""
+        caminho = self.caminho(ano, pleito, estado)
+        try:
+            with open(caminho, 'r', encoding = 'utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def grava(self, ano: int, pleito: int, estado: str, 
+        jsondata: Dict, 
+        etag: Optional[str] = None, 
+        last_modified: Optional[str] = None
+    ) -> None:
+        caminho = self.caminho(ano, pleito, estado)
+        caminho.parent.mkdir(mode = 0o774, parents = True, exist_ok = True)
+
+        # gravação em arquivo temporário, renomeado ao final
+        caminho_tmp = caminho.with_name(f'{caminho.name}.{uuid.uuid4().hex}.part')
+        with open(caminho_tmp, 'w', encoding = 'utf-8') as file:
+            json.dump({'jsondata': jsondata, 'etag': etag, 'last_modified': last_modified}, file)
+        os.replace(caminho_tmp, caminho)
+
+    def recente(self, ano: int, pleito: int, estado: str) -> bool:
+        """indica se a entrada foi obtida ou revalidada há menos de `max_age` segundos."""
+        try:
+            idade = time.time() - self.caminho(ano, pleito, estado).stat().st_mtime
+        except OSError:
+            return False
+        return idade < self.max_age
+
+    async def obtem_async(self, client: TSEClient, url: str, ano: int, pleito: int, estado: str) -> Dict:
+        """JSON de configuração do estado: do cache, se recente; senão revalidado ou baixado."""
+
+        entrada = self.le(ano, pleito, estado)
+        if entrada is not None and self.recente(ano, pleito, estado):
+            return entrada['jsondata']
+
+        etag = last_modified = None
+        if entrada is not None:
+            etag, last_modified = entrada.get('etag'), entrada.get('last_modified')
+
+        try:
+            jsondata, etag, last_modified = await client.get_json_conditional(url, etag, last_modified)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitoAberto):
+            if entrada is None:
+                raise
+            return entrada['jsondata']
+
+        if jsondata is None:
+            # 304: o JSON em cache continua válido
+            os.utime(self.caminho(ano, pleito, estado))
+            return entrada['jsondata']
+
+        self.grava(ano, pleito, estado, jsondata, etag, last_modified)
+        return jsondata
+
+#%%
+# índice ordenado de zonas e seções, com chaves inteiras
+class IndiceGeografico(collections.abc.Mapping):
+    """índice de zonas ou seções eleitorais, com a chave (município, zona[, seção]) compactada em um único inteiro
+    e guardado em arrays NumPy ordenados: consulta em O(log n) e fatias contíguas por município ou zona.
+    A chave inteira concatena os números com 5 dígitos para o município e 4 para zona e seção
+    (ex.: município 58017, zona 116, seção 1 -> 5801701160001), e portanto corresponde às antigas chaves em texto
+    ('5801701160001'), que continuam aceitas na consulta (ver também `texto` e `como_dict`).
+
+    >>> municipios, zonas, secoes = estado.process_info_mun_zona_secao(ano, pleito)
+    >>> secoes[(58017, 116, 1)] is secoes[5801701160001] is secoes['5801701160001']
+    >>> secoes.faixa(58017)       # seções do município
+    >>> secoes.faixa(58017, 116)  # seções da zona
+    """
+
+    LARGURAS_ZONAS: ClassVar[tuple] = (5, 4)
+    LARGURAS_SECOES: ClassVar[tuple] = (5, 4, 4)
+
+    def __init__(self, chaves: Iterable[int], objetos: Iterable, larguras: tuple = LARGURAS_SECOES, mantidos: Iterable = ()):
+        """
+        Args:
+            chaves (Iterable[int]): chaves inteiras (ver `chave`)
+            objetos (Iterable): zona ou seção de cada chave
+            larguras (tuple): número de dígitos de cada nível da chave
+            mantidos (Iterable): objetos mantidos vivos enquanto o índice existir (ex.: as urnas das seções, ver `RegistroUrnas`)
+        """
+        chaves = np.fromiter(chaves, dtype = np.int64)
+        objetos = list(objetos)
+        if len(objetos) != len(chaves):
+            raise ValueError(f'Número de chaves ({len(chaves)}) e de objetos ({len(objetos)}) diferentes!')
+
+        self.larguras = tuple(larguras)
+        self.mantidos = list(mantidos)
+        self._pesos = tuple(10 ** sum(self.larguras[nivel + 1:]) for nivel in range(len(self.larguras)))
+
+        ordem = np.argsort(chaves, kind = 'stable')
+        self.chaves = chaves[ordem]
+        self.objetos = np.empty(len(objetos), dtype = object)
+        self.objetos[:] = objetos
+        self.objetos = self.objetos[ordem]
+
+        if len(self.chaves) > 1 and not (np.diff(self.chaves) > 0).all():
+            raise ValueError('Chaves repetidas no índice!')
+
+    def chave(self, *ids: int) -> int:
+        """chave inteira de (município, zona[, seção])."""
+        if len(ids) != len(self.larguras):
+            raise KeyError(ids)
+
+        chave = 0
+        for id_, largura, peso in zip(ids, self.larguras, self._pesos):
+            if not 0 <= id_ < 10 ** largura:
+                raise KeyError(ids)
+            chave += int(id_) * peso
+        return chave
+
+    def decompoe(self, chave: int) -> tuple:
+        """(município, zona[, seção]) de uma chave inteira."""
+        return tuple((int(chave) // peso) % (10 ** largura) for largura, peso in zip(self.larguras, self._pesos))
+
+    def texto(self, chave: int) -> str:
+        """chave em texto, no formato antigo (ex.: '5801701160001')."""
+        return f'{int(chave):0>{sum(self.larguras)}d}'
+
+    def faixa(self, *prefixo: int) -> np.ndarray:
+        """zonas ou seções de um município (ou de uma zona), em ordem: fatia contígua, sem percorrer o índice.
+
+        Args:
+            prefixo (int): município [e zona]
+
+        Returns:
+            np.ndarray: objetos da faixa (view do índice)
+        """
+        if not 0 < len(prefixo) <= len(self.larguras):
+            raise ValueError(f'Prefixo inválido: {prefixo}')
+
+        inicio = self.chave(*prefixo, *[0] * (len(self.larguras) - len(prefixo)))
+        fim = inicio + self._pesos[len(prefixo) - 1]
+        i, j = np.searchsorted(self.chaves, [inicio, fim])
+        return self.objetos[i:j]
+
+    def como_dict(self) -> Dict[str, object]:
+        """dicionário com as chaves em texto, no formato antigo."""
+        return { self.texto(chave): obj for chave, obj in zip(self.chaves.tolist(), self.objetos) }
+
+    def _converte(self, chave) -> int:
+        if isinstance(chave, tuple):
+            return self.chave(*chave)
+        if isinstance(chave, str):
+            if len(chave) != sum(self.larguras) or not chave.isdigit():
+                raise KeyError(chave)
+            return int(chave)
+        return int(chave)
+
+    def __getitem__(self, chave):
+        valor = self._converte(chave)
+        i = np.searchsorted(self.chaves, valor)
+        if i == len(self.chaves) or self.chaves[i] != valor:
+            raise KeyError(chave)
+        return self.objetos[i]
+
+    def __contains__(self, chave) -> bool:
+        try:
+            self[chave]
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.chaves.tolist())
+
+    def __len__(self) -> int:
+        return len(self.chaves)
+
+#%%
+# registro das urnas e memória dos boletins decodificados
+class RegistroUrnas:
+    """registro das urnas criadas (`VotingMachine.all_vms`), sem prender as urnas na memória.
+    O registro guarda apenas referências fracas: as urnas continuam registradas enquanto são referenciadas
+    (ex.: pelo índice de seções devolvido por `State.process_info_mun_zona_secao`, que mantém as urnas das seções).
+    Dentro de um escopo explícito, as urnas criadas no bloco são mantidas vivas até o fim do escopo.
+    Processos longos podem processar cada estado dentro de um escopo, e as urnas (com seus boletins)
+    são liberadas ao final do escopo, a menos que sejam referenciadas em outro lugar:
+
+    >>> with VotingMachine.all_vms.escopo():
+    ...     estado.process_info_mun_zona_secao(ano, pleito)
+    ...     VotingMachine.download_multiple_bu(list(VotingMachine.all_vms))
+    """
+
+    def __init__(self):
+        self._refs: Dict[int, weakref.ref] = {}
+        self._escopos: List[list] = []
+
+    def adiciona(self, vm: 'VotingMachine') -> None:
+        chave = id(vm)
+
+        def descarta(ref, chave = chave):
+            if self._refs.get(chave) is ref:
+                del self._refs[chave]
+
+        self._refs[chave] = weakref.ref(vm, descarta)
+        if self._escopos:
+            self._escopos[-1].append(vm)
+
+    @contextlib.contextmanager
+    def escopo(self) -> Iterator['RegistroUrnas']:
+        """escopo de vida das urnas criadas dentro do bloco `with`."""
+        self._escopos.append([])
+        try:
+            yield self
+        finally:
+            self._escopos.pop()
+
+    def libera(self) -> None:
+        """libera as urnas mantidas pelo escopo atual (continuam registradas enquanto referenciadas em outro lugar)."""
+        if self._escopos:
+            self._escopos[-1] = []
+
+    def clear(self) -> None:
+        """remove todas as urnas do registro."""
+        self._refs.clear()
+        self._escopos = [ [] for _ in self._escopos ]
+
+    def __iter__(self) -> Iterator['VotingMachine']:
+        for ref in list(self._refs.values()):
+            vm = ref()
+            if vm is not None:
+                yield vm
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __getitem__(self, idx):
+        return list(self)[idx]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+class MemoriaBoletins:
+    """cache LRU dos boletins decodificados das urnas (`VotingMachine.memoria_boletins`).
+    Quando o tamanho estimado dos boletins em memória ultrapassa `limite_bytes`, ou a quantidade de boletins
+    ultrapassa `limite_entradas`, os boletins usados há mais tempo são despejados: se a urna tem `caminho_bu`, 
+    são decodificados novamente do arquivo no próximo acesso (alterações feitas nos dicionários são perdidas); 
+    caso contrário, são gravados em disco (pickle) e lidos de volta.
+    O tamanho de cada boletim é estimado a partir do tamanho do arquivo codificado (ver FATOR_MEMORIA_BOLETIM);
+    boletins sem arquivo são medidos (pickle) apenas quando há `limite_bytes`.
+
+    Contadores: `hits` (acessos a boletins em memória), `misses` (boletins decodificados ou lidos de volta no acesso,
+    inclusive os de decodificação sob demanda, ver `VotingMachine.processa_bu_sob_demanda`) e `evictions` (despejos).
+    """
+
+    def __init__(self, 
+        limite_bytes: Optional[int] = None, 
+        limite_entradas: Optional[int] = None, 
+        diretorio: Path = DESPEJO_DIR
+    ):
+        """
+        Args:
+            limite_bytes (int): tamanho máximo estimado dos boletins decodificados em memória (default: sem limite)
+            limite_entradas (int): quantidade máxima de boletins decodificados em memória (default: sem limite)
+            diretorio (Path): diretório dos boletins despejados sem arquivo .bu
+        """
+        self.limite_bytes = limite_bytes
+        self.limite_entradas = limite_entradas
+        self.diretorio = Path(diretorio)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._urnas: collections.OrderedDict[int, tuple[weakref.ref, int]] = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def registra(self, vm: 'VotingMachine') -> None:
+        """registra (ou atualiza) o boletim decodificado de uma urna, e despeja outros boletins se necessário."""
+        tamanho = self._tamanho(vm)
+        chave = id(vm)
+
+        with self._lock:
+            self._remove(chave)
+
+            def descarta(ref, chave = chave):
+                with self._lock:
+                    if chave in self._urnas and self._urnas[chave][0] is ref:
+                        self._remove(chave)
+
+            self._urnas[chave] = (weakref.ref(vm, descarta), tamanho)
+            self.bytes += tamanho
+
+            # despeja os boletins usados há mais tempo (nunca o que acabou de ser registrado)
+            while self._excedido() and len(self._urnas) > 1:
+                chave_antiga, (ref, _) = next(iter(self._urnas.items()))
+                self._remove(chave_antiga)
+                vm_antiga = ref()
+                if vm_antiga is not None:
+                    self._despeja(vm_antiga)
+
+    def usa(self, vm: 'VotingMachine') -> None:
+        with self._lock:
+            self.hits += 1
+            if id(vm) in self._urnas:
+                self._urnas.move_to_end(id(vm))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._urnas), 'bytes': self.bytes
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def remove(self, vm: 'VotingMachine') -> None:
+        with self._lock:
+            self._remove(id(vm))
+
+    def __len__(self) -> int:
+        return len(self._urnas)
+
+    def _excedido(self) -> bool:
+        return (
+            (self.limite_bytes is not None and self.bytes > self.limite_bytes) 
+            or (self.limite_entradas is not None and len(self._urnas) > self.limite_entradas)
+        )
+
+    def _remove(self, chave: int) -> None:
+        anterior = self._urnas.pop(chave, None)
+        if anterior is not None:
+            self.bytes -= anterior[1]
+
+    def _despeja(self, vm: 'VotingMachine') -> None:
+        if vm.caminho_bu is not None:
+            despejo = vm.caminho_bu
+        else:
+            self.diretorio.mkdir(parents = True, exist_ok = True)
+            despejo = self.diretorio.joinpath(f'{uuid.uuid4().hex}.pkl')
+            with open(despejo, 'wb') as file:
+                pickle.dump((vm._envelope_urna, vm._boletim_urna), file, protocol = pickle.HIGHEST_PROTOCOL)
+            # remove o arquivo se a urna deixar de existir antes de recarregar o boletim
+            weakref.finalize(vm, despejo.unlink, True)
+
+        vm._envelope_urna = vm._boletim_urna = None
+        vm._boletim_pendente = despejo
+        self.evictions += 1
+
+    def _tamanho(self, vm: 'VotingMachine') -> int:
+        caminho_bu = vm.caminho_bu
+        if isinstance(caminho_bu, SegmentRef):
+            tamanho = caminho_bu.length
+        elif caminho_bu is not None and Path(caminho_bu).exists():
+            tamanho = Path(caminho_bu).stat().st_size
+        elif self.limite_bytes is None:
+            # sem limite de tamanho, não vale serializar o boletim a cada atribuição só para medi-lo
+            tamanho = 0
+        else:
+            tamanho = len(pickle.dumps((vm._envelope_urna, vm._boletim_urna), protocol = pickle.HIGHEST_PROTOCOL))
+
+        return tamanho * FATOR_MEMORIA_BOLETIM
+
+# travas das recarregas de boletins (por urna, distribuídas em um número fixo de travas para não ocupar memória em cada urna)
+_travas_boletins = [ threading.RLock() for _ in range(64) ]
+
+def _recarrega_boletim(vm: 'VotingMachine') -> None:
+    # decodifica um boletim pendente, ou lê de volta um boletim despejado (ver `MemoriaBoletins`);
+    # acessos simultâneos à mesma urna decodificam o boletim uma única vez
+    with _travas_boletins[(id(vm) >> 4) % len(_travas_boletins)]:
+        despejo = vm._boletim_pendente
+        if despejo is None:
+            # recarregado por outra thread
+            return
+
+        if vm.memoria_boletins is not None:
+            with vm.memoria_boletins._lock:
+                vm.memoria_boletins.misses += 1
+
+        if isinstance(despejo, Path) and despejo.suffix == '.pkl':
+            with open(despejo, 'rb') as file:
+                envelope_urna, boletim_urna = pickle.load(file)
+            despejo.unlink(missing_ok = True)
+        else:
+            asn1_paths, projecao = vm._decodificacao or (ASN1_PATHS, None)
+            envelope_urna, boletim_urna = decodifica_bu(despejo, asn1_paths, projecao)
+
+        # mantém o envelope ou o boletim atribuído diretamente enquanto o boletim estava pendente
+        if vm._envelope_urna is None:
+            vm.envelope_urna = envelope_urna
+        if vm._boletim_urna is None:
+            vm.boletim_urna = boletim_urna
+        vm._boletim_pendente = None
+
+class _BoletimDecodificado:
+    # descritor de `VotingMachine.envelope_urna` e `VotingMachine.boletim_urna`:
+    # informa o uso à memória de boletins, e decodifica boletins pendentes ou despejados no primeiro acesso
+
+    def __set_name__(self, owner, name: str):
+        self.atributo = f'_{name}'
+
+    def __get__(self, vm, owner = None):
+        if vm is None:
+            return None
+
+        valor = getattr(vm, self.atributo, None)
+        if valor is None:
+            if getattr(vm, '_boletim_pendente', None) is not None:
+                _recarrega_boletim(vm)
+                valor = getattr(vm, self.atributo)
+        elif vm.memoria_boletins is not None:
+            vm.memoria_boletins.usa(vm)
+
+        return valor
+
+    def __set__(self, vm, valor):
+        if valor is self:
+            # valor default do dataclass
+            valor = None
+
+        setattr(vm, self.atributo, valor)
+        if getattr(vm, '_envelope_urna', None) is not None and getattr(vm, '_boletim_urna', None) is not None:
+            # o boletim pendente só é descartado quando envelope e boletim foram atribuídos
+            vm._boletim_pendente = None
+
+        if vm.memoria_boletins is not None:
+            if getattr(vm, '_envelope_urna', None) is None and getattr(vm, '_boletim_urna', None) is None:
+                vm.memoria_boletins.remove(vm)
+            else:
+                vm.memoria_boletins.registra(vm)
+
+#%%
+# dataclasses
+# tipos geográficos: imutáveis, com __slots__ e hashable (podem ser chaves de dicionários e elementos de conjuntos).
+# `interna` devolve a instância já existente com a mesma identificação (uma única instância por pleito/município/zona),
+# mantida enquanto estiver em uso (as tabelas de internação guardam referências fracas).
+@dataclass(frozen = True, slots = True, weakref_slot = True)
 class Contest:
     year: int
     contest_id: int
+    _internados: ClassVar[weakref.WeakValueDictionary] = weakref.WeakValueDictionary()
+
+    @classmethod
+    def interna(cls, year: int, contest_id: int) -> 'Contest':
+        chave = (year, contest_id)
+        obj = cls._internados.get(chave)
+        if obj is None:
+            obj = cls._internados[chave] = cls(year = year, contest_id = contest_id)
+        return obj
 
 
 @dataclass
@@ -152,33 +2975,126 @@ class State:
         url_pleito_simples = str(pleito)
         url_pleito_p = f'p{url_pleito_simples:0>6s}'
 
-        url_estado = str(estado).lower()
+        url_estado = str(estado).lower()
+
+        url_final = rf'{base}/{url_ano}/arquivo-urna/{url_pleito_simples}/config/{url_estado}/{url_estado}-{url_pleito_p}-cs.json'
+        
+        return url_final
+    
+    def process_info_mun_zona_secao(self, ano: int, pleito: int) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        
+        pleito_obj = Contest.interna(year = ano, contest_id = pleito)
+
+        url = self.get_url_info_mun_zona_secao(
+            ano = pleito_obj.year, 
+            pleito = pleito_obj.contest_id, 
+            estado = self.abbr
+        )
+        restapi = get_rl(url)
+        jsondata = restapi.json()
+
+        return self._processa_json_mun_zona_secao(jsondata, pleito_obj)
+
+    async def process_info_mun_zona_secao_async(self, ano: int, pleito: int, 
+        client: Optional[TSEClient] = None
+    ) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        
+        pleito_obj = Contest.interna(year = ano, contest_id = pleito)
+
+        url = self.get_url_info_mun_zona_secao(
+            ano = pleito_obj.year, 
+            pleito = pleito_obj.contest_id, 
+            estado = self.abbr
+        )
+        jsondata = await _with_client(client, lambda client: client.get_json(url))
+
+        return self._processa_json_mun_zona_secao(jsondata, pleito_obj)
+
+    @classmethod
+    async def process_info_multiple_async(cls, ano: int, pleito: int,
+        states: Optional[Iterable['State']] = None,
+        client: Optional[TSEClient] = None,
+        cache: Optional[CacheConfig] = None
+    ) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        """carrega municípios, zonas e seções de vários estados, com os JSONs de configuração obtidos em paralelo
+        (e guardados em cache em disco, ver `CacheConfig`), e monta um único índice de zonas e de seções.
+
+        Args:
+            ano (int): ano do pleito
+            pleito (int): número do pleito
+            states (Iterable[State]): estados (default: todos os estados criados, `State.states`)
+            client (TSEClient): cliente assíncrono (default: um cliente temporário)
+            cache (CacheConfig): cache dos JSONs de configuração (default: CONFIG_CACHE_DIR)
+
+        Returns:
+            tuple: municípios por código, índice de zonas e índice de seções de todos os estados
+        """
+
+        # um estado por sigla
+        unicos = {}
+        for state in (cls.states if states is None else states):
+            unicos.setdefault(state.abbr, state)
+        states = list(unicos.values())
+
+        if cache is None:
+            cache = CacheConfig()
+
+        pleito_obj = Contest.interna(year = ano, contest_id = pleito)
 
-        url_final = rf'{base}/{url_ano}/arquivo-urna/{url_pleito_simples}/config/{url_estado}/{url_estado}-{url_pleito_p}-cs.json'
-        
-        return url_final
-    
-    def process_info_mun_zona_secao(self, ano: int, pleito: int) -> list[dict]:
-        
-        pleito_obj = Contest(year = ano, contest_id = pleito)
+        async def obtem_todos(client: TSEClient) -> List[Dict]:
+            return await asyncio.gather(*[
+                cache.obtem_async(
+                    client, 
+                    state.get_url_info_mun_zona_secao(ano = ano, pleito = pleito, estado = state.abbr), 
+                    ano, pleito, state.abbr
+                )
+                for state in states
+            ])
 
-        url = self.get_url_info_mun_zona_secao(
-            ano = pleito_obj.year, 
-            pleito = pleito_obj.contest_id, 
-            estado = self.abbr
+        jsons = await _with_client(client, obtem_todos)
+
+        municipios, zonas, secoes, urnas = {}, ([], []), ([], []), []
+        for state, jsondata in zip(states, jsons):
+            state._coleta_mun_zona_secao(jsondata, pleito_obj, municipios, zonas, secoes, urnas)
+
+        return cls._indices_mun_zona_secao(municipios, zonas, secoes, urnas)
+
+    @classmethod
+    def process_info_multiple(cls, ano: int, pleito: int, **kwargs) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        """versão síncrona de `process_info_multiple_async`."""
+        return asyncio.run(cls.process_info_multiple_async(ano, pleito, **kwargs))
+
+    def _processa_json_mun_zona_secao(self, jsondata: Dict, pleito_obj: Contest) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        municipios, zonas, secoes, urnas = {}, ([], []), ([], []), []
+        self._coleta_mun_zona_secao(jsondata, pleito_obj, municipios, zonas, secoes, urnas)
+        return self._indices_mun_zona_secao(municipios, zonas, secoes, urnas)
+
+    @staticmethod
+    def _indices_mun_zona_secao(municipios: Dict, zonas: tuple, secoes: tuple, urnas: list) -> tuple[Dict[int, 'City'], IndiceGeografico, IndiceGeografico]:
+        # municípios por código; zonas e seções em índices com chave inteira (ver IndiceGeografico);
+        # o índice de seções mantém as urnas criadas (o registro `VotingMachine.all_vms` só guarda referências fracas)
+        return (
+            municipios,
+            IndiceGeografico(*zonas, IndiceGeografico.LARGURAS_ZONAS),
+            IndiceGeografico(*secoes, IndiceGeografico.LARGURAS_SECOES, mantidos = urnas)
         )
-        restapi = get_rl(url)
-        jsondata = restapi.json()
 
-        municipios = {}
-        zonas = {}
-        secoes = {}
+    def _coleta_mun_zona_secao(self, jsondata: Dict, pleito_obj: Contest, 
+        municipios: Dict, 
+        zonas: tuple[list, list], 
+        secoes: tuple[list, list],
+        urnas: list
+    ) -> None:
+        # cria municípios, zonas, seções e urnas do JSON de configuração do estado;
+        # acrescenta (chaves, objetos) de zonas e seções, e as urnas, às listas informadas
+
+        chaves_zonas, zonas = zonas
+        chaves_secoes, secoes = secoes
         
-        estado_abbr = jsondata['abr'][0]['cd']
         for municipio in jsondata['abr'][0]['mu']:
             
             id_municipio = int(municipio['cd'])
-            municipio_obj = City(
+            municipio_obj = City.interna(
                 id = id_municipio,
                 name = municipio['nm'],
                 state = self
@@ -189,12 +3105,14 @@ class State:
             for zona in municipio['zon']:
                 
                 zona_id = int(zona['cd'])
-                zona_obj = ElectionZone(
+                zona_obj = ElectionZone.interna(
                     id = zona_id,
                     city = municipio_obj
                 )
 
-                zonas[f'{str(id_municipio):0>5s}{str(zona_id):0>4s}'] = zona_obj
+                chave_zona = id_municipio * 10**4 + zona_id
+                chaves_zonas.append(chave_zona)
+                zonas.append(zona_obj)
 
                 for secao in zona['sec']:
 
@@ -204,21 +3122,28 @@ class State:
                         zone = zona_obj,
                         contest = pleito_obj
                     )
-                    urna_obj = VotingMachine(section = secao_obj)
+                    urnas.append(VotingMachine(section = secao_obj))
 
-                    secoes[f'{str(id_municipio):0>5s}{str(zona_id):0>4s}{str(secao_id):0>4s}'] = secao_obj
-        
-        return municipios, zonas, secoes
+                    chaves_secoes.append(chave_zona * 10**4 + secao_id)
+                    secoes.append(secao_obj)
 
     def __str__(self):
         return f'{self.name} ({self.abbr})'
 
 
-@dataclass
+@dataclass(frozen = True, slots = True, weakref_slot = True)
 class City:
     id: int
     name: str = field(compare = False)
     state: State = field(compare = False)
+    _internados: ClassVar[weakref.WeakValueDictionary] = weakref.WeakValueDictionary()
+
+    @classmethod
+    def interna(cls, id: int, name: str, state: State) -> 'City':
+        obj = cls._internados.get(id)
+        if obj is None:
+            obj = cls._internados[id] = cls(id = id, name = name, state = state)
+        return obj
 
     def __str__(self):
         id_municipio = str(self.id)
@@ -277,10 +3202,19 @@ class VoteCount:
     votes: int
 
 
-@dataclass
+@dataclass(frozen = True, slots = True, weakref_slot = True)
 class ElectionZone:
     id: int
     city: City
+    _internados: ClassVar[weakref.WeakValueDictionary] = weakref.WeakValueDictionary()
+
+    @classmethod
+    def interna(cls, id: int, city: City) -> 'ElectionZone':
+        chave = (city, id)
+        obj = cls._internados.get(chave)
+        if obj is None:
+            obj = cls._internados[chave] = cls(id = id, city = city)
+        return obj
 
     def __str__(self):
         id_municipio = str(self.city.id)
@@ -290,7 +3224,7 @@ class ElectionZone:
         return f'{nome_municipio}, {abbr_estado} (Cód. {id_municipio:0>5s}), zona {zona:0>4s}'
 
 
-@dataclass
+@dataclass(frozen = True, slots = True, weakref_slot = True)
 class ElectionSection:
     id: int
     zone: ElectionZone
@@ -306,92 +3240,538 @@ class ElectionSection:
         ret += f', pleito {self.contest.contest_id} ({self.contest.year})'
 
 
-@dataclass
+# urna: mutável, com __slots__ e hashable pela seção (a seção não deve ser trocada depois que a urna for usada como chave)
+@dataclass(unsafe_hash = True, slots = True, weakref_slot = True)
 class VotingMachine:
     section: ElectionSection
     serial: Optional[str] = field(compare = False, default = None)
-    caminho_bu: Optional[Path] = field(compare = False, default = None)
-    envelope_urna: Optional[Dict] = field(compare = False, default = None)
-    boletim_urna: Optional[Dict] = field(compare = False, default = None)
+    caminho_bu: Optional[Path | SegmentRef] = field(compare = False, default = None)
+    envelope_urna: InitVar[Optional[Dict]] = _BoletimDecodificado()
+    boletim_urna: InitVar[Optional[Dict]] = _BoletimDecodificado()
     stale_data: bool = field(compare = False, default = True)
     hash_urna: Optional[str] = field(compare = False, default = None)
     hash_dt: Optional[dt] = field(compare = False, default = dt(1970,1,1,0,0,0))
-    all_vms: ClassVar[list] = []
-
-    def __post_init__(self):
-        self.__class__.all_vms.append(self)
+    aux_etag: Optional[str] = field(compare = False, default = None)
+    aux_last_modified: Optional[str] = field(compare = False, default = None)
+    # boletins decodificados (acessados por `envelope_urna` e `boletim_urna`, ver `_BoletimDecodificado`)
+    _envelope_urna: Optional[Dict] = field(compare = False, repr = False, init = False, default = None)
+    _boletim_urna: Optional[Dict] = field(compare = False, repr = False, init = False, default = None)
+    _boletim_pendente: Optional[Path | SegmentRef] = field(compare = False, repr = False, init = False, default = None)
+    # descritores ASN.1 e projeção usados ao decodificar novamente boletins pendentes ou despejados (default: todos os componentes)
+    _decodificacao: Optional[tuple[List, Optional[ProjecaoBU]]] = field(compare = False, repr = False, init = False, default = None)
+    all_vms: ClassVar[RegistroUrnas] = RegistroUrnas()
+    memoria_boletins: ClassVar[Optional[MemoriaBoletins]] = MemoriaBoletins()
+    hash_index: ClassVar[Optional[HashIndex]] = None
+    bu_store: ClassVar[BUStore | SegmentStore] = BUStore()
+
+    def __post_init__(self, envelope_urna: Optional[Dict], boletim_urna: Optional[Dict]):
+        self.envelope_urna, self.boletim_urna = envelope_urna, boletim_urna
+        self.__class__.all_vms.adiciona(self)
     
     # https://stackoverflow.com/questions/52000950/python-wget-download-multiple-files-at-once
     @classmethod
     def download_multiple_bu(cls, 
         vms: Optional[list] = None,
         caminho_dl_root: Optional[Path] = None,
-        progressbar: bool = True
-    ):
+        progressbar: bool = True,
+        asn1_paths: List = ASN1_PATHS,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        download_workers: int = DOWNLOAD_WORKERS,
+        max_retries: int = DOWNLOAD_MAX_RETRIES,
+        projecao: Optional[ProjecaoBU] = None,
+        sob_demanda: bool = True
+    ) -> List[DownloadJob]:
+        """baixa os boletins de várias urnas. Por padrão, cada boletim é decodificado apenas no primeiro acesso
+        a `boletim_urna`/`envelope_urna` (ver `processa_bu_sob_demanda`); com `sob_demanda = False`, 
+        todos os boletins são decodificados logo após o download, em vários processos.
+
+        Args:
+            vms (list): urnas (default: todas as urnas)
+            caminho_dl_root (Path): diretório raiz dos downloads
+            progressbar (bool): exibe barras de progresso
+            asn1_paths (list): caminhos dos descritores ASN.1
+            workers (int): quantidade de processos de decodificação
+            chunksize (int): arquivos enviados de uma vez para cada processo de decodificação
+            download_workers (int): quantidade de threads de download
+            max_retries (int): quantidade máxima de tentativas de download por urna
+            projecao (ProjecaoBU): componentes do envelope e do boletim a decodificar (default: todos)
+            sob_demanda (bool): decodifica cada boletim apenas no primeiro acesso
+
+        Returns:
+            list[DownloadJob]: downloads que falharam após todas as tentativas
+        """
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+
         if progressbar:
-            pb_collect = lambda iter: tqdm.tqdm(iter, desc = 'Collecting URLs and creating folder structure')
-            pb_download = lambda iter: tqdm.tqdm(iter, desc = 'Downloading')
-            pb_process = lambda iter: tqdm.tqdm(iter, desc = 'Processing')
+            pb_download = lambda iter: tqdm.tqdm(iter, desc = 'Downloading', total = len(vms))
         else:
-            pb_collect = lambda iter: iter
             pb_download = lambda iter: iter
-            pb_process = lambda iter: iter
+
+        # a URL de cada urna é obtida no próprio trabalho de download (nas threads de download, com retentativas);
+        # falhas são informadas por urna, nos trabalhos devolvidos
+        wget_download_list = (
+            DownloadJob(vm = vm, store = cls.bu_store, caminho_dl_root = caminho_dl_root)
+            for vm in vms
+        )
+
+        jobs = download_jobs(
+            wget_download_list, 
+            workers = download_workers,
+            max_retries = max_retries,
+            progressbar = pb_download
+        )
+        falhas = [ job for job in jobs if not job.done ]
+        vms_falhas = set(id(job.vm) for job in falhas)
+        vms_ok = [ vm for vm in vms if id(vm) not in vms_falhas ]
+
+        if sob_demanda:
+            for vm in vms_ok:
+                vm.processa_bu_sob_demanda(asn1_paths = asn1_paths, projecao = projecao)
+            return falhas
         
-        if vms is None:
-            vms = VotingMachine.all_vms
+        cls.processa_multiple_bu(
+            vms = vms_ok,
+            workers = workers,
+            chunksize = chunksize,
+            progressbar = progressbar,
+            asn1_paths = asn1_paths,
+            projecao = projecao
+        )
+
+        return falhas
 
+    @classmethod
+    def processa_multiple_bu(cls,
+        vms: Optional[list] = None,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        min_batch: int = DECODE_MIN_BATCH,
+        progressbar: bool = True,
+        asn1_paths: List = ASN1_PATHS,
+        projecao: Optional[ProjecaoBU] = None
+    ):
+        """decodifica os boletins de várias urnas já baixadas, em paralelo em vários processos.
+        Lotes menores que `min_batch` (ou `workers = 1`) são decodificados em série no processo atual.
 
-        wget_download_list = []
+        Args:
+            vms (list): urnas a decodificar (default: todas as urnas)
+            workers (int): quantidade de processos (default: DECODE_WORKERS)
+            chunksize (int): quantidade de arquivos enviados de uma vez para cada processo
+            min_batch (int): tamanho mínimo de lote para usar processos
+            progressbar (bool): exibe barra de progresso
+            asn1_paths (list): caminhos dos descritores ASN.1
+            projecao (ProjecaoBU): componentes do envelope e do boletim a decodificar (default: todos)
+        """
 
-        for vm in pb_collect(vms):
-            url_dl = vm.get_info_download_url()
+        if progressbar:
+            pb_process = lambda iter, total: tqdm.tqdm(iter, desc = 'Processing', total = total)
+        else:
+            pb_process = lambda iter, total: iter
 
-            caminho_dl = vm.get_info_download_path(caminho_dl_root)
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
 
-            try:
-                caminho_dl.mkdir(mode = 0o774, parents = True, exist_ok = True)
-            except FileExistsError:
-                pass
+        if workers is None:
+            workers = DECODE_WORKERS
+        
+        # compila (ou carrega do cache) a especificação ASN.1 uma única vez para todo o lote
+        # (e grava o cache em disco antes de os processos iniciarem)
+        get_asn1_spec(asn1_paths)
+
+        if workers <= 1 or len(vms) < min_batch:
+            for vm in pb_process(vms, len(vms)):
+                vm._decodificacao = (asn1_paths, projecao)
+                vm.envelope_urna, vm.boletim_urna = vm.processa_bu(asn1_paths = asn1_paths, projecao = projecao)
+                vm.stale_data = False
             
+            return
 
-            bu_path = caminho_dl.joinpath(Path(Path(url_dl).name))
-            
-            if bu_path.exists():
-                bu_path.unlink()
+        if chunksize is None:
+            chunksize = max(1, min(256, len(vms) // (workers * 4)))
+
+        for vm in vms:
+            if vm.caminho_bu is None:
+                raise ValueError(f'Caminho para arquivo do boletim da urna é indefinido! ({vm})')
+
+        jobs = ( (idx, vm.caminho_bu, asn1_paths, projecao) for idx, vm in enumerate(vms) )
+        
+        with multiprocessing.Pool(
+            processes = workers, 
+            initializer = _decode_worker_init, 
+            initargs = (asn1_paths,)
+        ) as pool:
+            results = pool.imap_unordered(_decode_worker, jobs, chunksize = chunksize)
+
+            for idx, envelope_decoded, bu_decoded in pb_process(results, len(vms)):
+                vm = vms[idx]
+                vm._decodificacao = (asn1_paths, projecao)
+                vm.envelope_urna, vm.boletim_urna = envelope_decoded, bu_decoded
+                vm.stale_data = False
+
+    @classmethod
+    def votos_multiple_df(cls,
+        vms: Optional[list] = None,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        min_batch: int = DECODE_MIN_BATCH,
+        progressbar: bool = True,
+        asn1_paths: List = ASN1_PATHS
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """monta uma única `totalizacao` e um único `stats_df` para várias urnas (ex.: um estado inteiro).
+        As linhas de cada seção são acumuladas em buffers de colunas compartilhados, sem DataFrames intermediários.
+        Urnas com boletim já decodificado são tabuladas no processo atual; as demais são decodificadas 
+        (só os totais de votos, sem guardar o boletim na urna) em vários processos, que devolvem apenas as colunas.
+
+        Args:
+            vms (list): urnas (default: todas as urnas)
+            workers (int): quantidade de processos (default: DECODE_WORKERS)
+            chunksize (int): quantidade de arquivos enviados de uma vez para cada processo
+            min_batch (int): tamanho mínimo de lote para usar processos
+            progressbar (bool): exibe barra de progresso
+            asn1_paths (list): caminhos dos descritores ASN.1
+
+        Returns:
+            tuple[pd.DataFrame, pd.DataFrame]: `totalizacao` e `stats_df` de todas as urnas, na ordem de `vms`
+        """
+
+        if progressbar:
+            pb_process = lambda iter, total: tqdm.tqdm(iter, desc = 'Tabulating', total = total)
+        else:
+            pb_process = lambda iter, total: iter
+
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+
+        tabulacao = TabulacaoVotos()
+        colunas = cls._colunas_multiple(vms, workers, chunksize, min_batch, asn1_paths)
+        for _, colunas_urna in pb_process(colunas, len(vms)):
+            tabulacao.adiciona(*colunas_urna)
+
+        return tabulacao.tabelas()
+
+    @classmethod
+    def _colunas_multiple(cls,
+        vms: list,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        min_batch: int = DECODE_MIN_BATCH,
+        asn1_paths: List = ASN1_PATHS
+    ) -> Iterator[tuple['VotingMachine', tuple]]:
+        # colunas de votos de cada urna (ver `colunas_votos_bu`), na ordem de `vms`
+        if workers is None:
+            workers = DECODE_WORKERS
+
+        # boletins que não estão em memória (inclusive os pendentes de decodificação sob demanda) são lidos dos arquivos;
+        # a decisão é tomada uma única vez: um boletim despejado ou decodificado depois disso não desalinha as colunas
+        precisa_decodificar = [ vm._boletim_urna is None for vm in vms ]
+        jobs = []
+        for vm, decodificar in zip(vms, precisa_decodificar):
+            if decodificar:
+                if vm.caminho_bu is None:
+                    raise ValueError(f'Caminho para arquivo do boletim da urna é indefinido! ({vm})')
+                jobs.append((vm.caminho_bu, asn1_paths, vm.section.zone.city.state.abbr))
+
+        get_asn1_spec(asn1_paths)
+
+        with contextlib.ExitStack() as stack:
+            if workers <= 1 or len(jobs) < min_batch:
+                colunas = map(_colunas_worker, jobs)
+            else:
+                if chunksize is None:
+                    chunksize = max(1, min(256, len(jobs) // (workers * 4)))
+                
+                pool = stack.enter_context(multiprocessing.Pool(
+                    processes = workers, 
+                    initializer = _decode_worker_init, 
+                    initargs = (asn1_paths,)
+                ))
+                # imap (ordenado): as colunas chegam na ordem das urnas
+                colunas = pool.imap(_colunas_worker, jobs, chunksize = chunksize)
+
+            for vm, decodificar in zip(vms, precisa_decodificar):
+                if decodificar:
+                    yield vm, next(colunas)
+                else:
+                    yield vm, colunas_votos_bu(vm.boletim_urna, vm.section.zone.city.state.abbr)
+
+    @classmethod
+    async def pipeline_bu_async(cls,
+        vms: Optional[Iterable] = None,
+        caminho_dl_root: Optional[Path] = None,
+        client: Optional[TSEClient] = None,
+        resolve_workers: int = PIPELINE_RESOLVE_WORKERS,
+        download_workers: int = DOWNLOAD_WORKERS,
+        decode_workers: Optional[int] = None,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        tabula: bool = True,
+        asn1_paths: List = ASN1_PATHS,
+        projecao: Optional[ProjecaoBU] = None
+    ) -> AsyncIterator[PipelineResult]:
+        """processa as urnas em um pipeline: hash → download → decodificação → tabulação.
+        Cada seção atravessa as etapas de forma independente, com filas limitadas entre as etapas, 
+        de forma que rede e CPU trabalham ao mesmo tempo. Os resultados são entregues à medida que ficam prontos.
+        Falhas em uma seção não interrompem o pipeline: são informadas em `PipelineResult.error`.
+
+        Args:
+            vms (Iterable): urnas (default: todas as urnas)
+            caminho_dl_root (Path): diretório raiz dos downloads
+            client (TSEClient): cliente assíncrono (default: cliente temporário)
+            resolve_workers (int): requisições simultâneas de hash (JSON auxiliar)
+            download_workers (int): downloads simultâneos
+            decode_workers (int): processos de decodificação (default: DECODE_WORKERS)
+            queue_size (int): tamanho máximo de cada fila entre etapas
+            tabula (bool): gera também `votos_urna_df` para cada urna 
+                (a projeção deve incluir `identificacaoSecao` e `resultadosVotacaoPorEleicao`)
+            asn1_paths (list): caminhos dos descritores ASN.1
+            projecao (ProjecaoBU): componentes do envelope e do boletim a decodificar (default: todos)
+
+        Yields:
+            PipelineResult: resultado de cada urna, na ordem em que ficam prontos
+        """
+
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+        
+        if decode_workers is None:
+            decode_workers = DECODE_WORKERS
+
+        if client is None:
+            async with TSEClient() as client:
+                async for result in cls.pipeline_bu_async(
+                    vms, caminho_dl_root, client, resolve_workers, download_workers, 
+                    decode_workers, queue_size, tabula, asn1_paths, projecao
+                ):
+                    yield result
+            return
+
+        loop = asyncio.get_running_loop()
+        get_asn1_spec(asn1_paths)
+
+        if decode_workers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers = decode_workers,
+                initializer = _decode_worker_init,
+                initargs = (asn1_paths,)
+            )
+        else:
+            executor = None
+
+        async def resolve(result: PipelineResult):
+            result.url = await result.vm.get_url_download_urna_async(info = 'bu', client = client)
+
+        async def download(result: PipelineResult):
+            result.bu_path = await cls.bu_store.obtem_async(result.vm, result.url, client, caminho_dl_root)
+            result.vm.caminho_bu = result.bu_path
+
+        async def decode(result: PipelineResult):
+            vm = result.vm
+            if executor is not None:
+                _, envelope_decoded, bu_decoded = await loop.run_in_executor(
+                    executor, _decode_worker, (0, result.bu_path, asn1_paths, projecao)
+                )
+            else:
+                envelope_decoded, bu_decoded = await asyncio.to_thread(
+                    decodifica_bu, result.bu_path, asn1_paths, projecao
+                )
+            # como em `processa_multiple_bu`: um boletim descartado pela memória é recarregado com a mesma projeção
+            vm._decodificacao = (asn1_paths, projecao)
+            vm.envelope_urna, vm.boletim_urna = envelope_decoded, bu_decoded
+            vm.stale_data = False
+
+            if tabula:
+                result.totalizacao, result.stats_df = await asyncio.to_thread(vm.votos_urna_df)
+
+        etapas = [ 
+            (resolve, resolve_workers), 
+            (download, download_workers), 
+            (decode, max(1, decode_workers)) 
+        ]
+        filas = [ asyncio.Queue(maxsize = queue_size) for _ in range(len(etapas) + 1) ]
+
+        async def alimenta():
+            for vm in vms:
+                await filas[0].put(PipelineResult(vm = vm))
+            for _ in range(etapas[0][1]):
+                await filas[0].put(_FIM)
+
+        async def etapa(i: int):
+            func, n_workers = etapas[i]
+            fila_in, fila_out = filas[i], filas[i + 1]
+
+            async def worker():
+                while True:
+                    result = await fila_in.get()
+                    if result is _FIM:
+                        return
+                    
+                    if result.error is None:
+                        try:
+                            await func(result)
+                        except Exception as e:
+                            result.error = e
+                    
+                    await fila_out.put(result)
             
-            wget_download_list.append([
-                url_dl,
-                bu_path,
-                vm
-            ])
+            await asyncio.gather(*[ worker() for _ in range(n_workers) ])
+
+            # avisa a etapa seguinte (cada worker seguinte recebe uma sentinela)
+            n_seguinte = etapas[i + 1][1] if i + 1 < len(etapas) else 1
+            for _ in range(n_seguinte):
+                await fila_out.put(_FIM)
 
-        with Pool(processes = len(vms)) as pool:
+        tasks = [ asyncio.create_task(alimenta()) ]
+        tasks += [ asyncio.create_task(etapa(i)) for i in range(len(etapas)) ]
+
+        try:
+            while True:
+                result = await filas[-1].get()
+                if result is _FIM:
+                    break
+                yield result
             
-            jobs = []
-            for url, bu_path, vm in wget_download_list:
-                jobs.append(
-                    pool.apply_async(
-                        func = wget_download_async,
-                        args = (url, str(bu_path), vm,)
-                    )
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if executor is not None:
+                executor.shutdown(wait = False, cancel_futures = True)
+
+    @classmethod
+    def pipeline_bu(cls, 
+        vms: Optional[Iterable] = None, 
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        **kwargs
+    ) -> Iterator[PipelineResult]:
+        """versão síncrona de `pipeline_bu_async`: o pipeline roda em uma thread com o seu próprio event loop."""
+
+        fila = queue.Queue(maxsize = queue_size)
+        parar = threading.Event()
+
+        def entrega(item) -> bool:
+            # entrega item ao consumidor, a menos que ele tenha desistido
+            while not parar.is_set():
+                try:
+                    fila.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        async def executa():
+            pipeline = cls.pipeline_bu_async(vms, queue_size = queue_size, **kwargs)
+            try:
+                async for result in pipeline:
+                    if not entrega(result):
+                        return
+            finally:
+                await pipeline.aclose()
+
+        def thread_pipeline():
+            try:
+                asyncio.run(executa())
+            except BaseException as e:
+                entrega(e)
+            else:
+                entrega(_FIM)
+
+        thread = threading.Thread(target = thread_pipeline, daemon = True)
+        thread.start()
+
+        try:
+            while True:
+                result = fila.get()
+                if result is _FIM:
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+        finally:
+            parar.set()
+            thread.join()
+
+    @classmethod
+    async def check_multiple_staleness_async(cls,
+        vms: Optional[Iterable] = None,
+        client: Optional[TSEClient] = None,
+        concurrency: int = STALENESS_CONCURRENCY,
+        dtfmt: Optional[str] = None
+    ) -> tuple[List['VotingMachine'], Dict['VotingMachine', Exception]]:
+        """verifica, concorrentemente, quais urnas tiveram a hash atualizada no TSE.
+        Usa requisições condicionais (ETag / Last-Modified guardados na urna): JSONs auxiliares que não mudaram 
+        não são baixados novamente. As urnas cuja hash mudou têm `hash_urna`/`hash_dt` atualizados e `stale_data = True`.
+        Falhas na verificação de uma urna não interrompem as demais: são devolvidas separadamente.
+
+        Args:
+            vms (Iterable): urnas (default: todas as urnas)
+            client (TSEClient): cliente assíncrono (default: cliente temporário)
+            concurrency (int): quantidade máxima de requisições simultâneas
+            dtfmt (str): formato de data e hora do JSON auxiliar
+
+        Returns:
+            tuple[list[VotingMachine], dict[VotingMachine, Exception]]: urnas cuja hash mudou, e urnas cuja verificação falhou 
+            (com o erro)
+        """
+
+        if vms is None:
+            vms = list(VotingMachine.all_vms)
+        vms = list(vms)
+
+        semaforo = asyncio.Semaphore(concurrency)
+
+        async def verifica(client: TSEClient, vm: 'VotingMachine') -> bool:
+            async with semaforo:
+                jsondata, etag, last_modified = await client.get_json_conditional(
+                    vm.get_url_info_urna(),
+                    etag = vm.aux_etag,
+                    last_modified = vm.aux_last_modified
                 )
             
-            pool.close()
+            if jsondata is None:
+                return False
+            
+            vm.aux_etag, vm.aux_last_modified = etag, last_modified
+            
+            hash_urna, hash_dt = vm._registra_info_urna(jsondata, dtfmt = dtfmt)
+            
+            if vm.hash_dt is not None and vm.hash_urna == hash_urna and hash_dt <= vm.hash_dt:
+                return False
+            
+            vm.hash_urna, vm.hash_dt = hash_urna, hash_dt
+            vm.stale_data = True
+            return True
 
-            result_list_tqdm = []
-            for job in pb_download(jobs):
-                result_list_tqdm.append(job.get())
-        
-        for vm in pb_process(vms):
-            vm.envelope_urna, vm.boletim_urna = vm.processa_bu()
-            vm.stale_data = False
+        falhas = {}
+
+        async def verifica_com_erro(client: TSEClient, vm: 'VotingMachine') -> bool:
+            try:
+                return await verifica(client, vm)
+            except Exception as e:
+                falhas[vm] = e
+                return False
+
+        async def verifica_todas(client: TSEClient) -> tuple[List['VotingMachine'], Dict['VotingMachine', Exception]]:
+            mudou = await asyncio.gather(*[ verifica_com_erro(client, vm) for vm in vms ])
+            return [ vm for vm, m in zip(vms, mudou) if m ], falhas
+
+        return await _with_client(client, verifica_todas)
+
+    @classmethod
+    def check_multiple_staleness(cls, 
+        vms: Optional[Iterable] = None, 
+        **kwargs
+    ) -> tuple[List['VotingMachine'], Dict['VotingMachine', Exception]]:
+        """versão síncrona de `check_multiple_staleness_async`."""
+        return asyncio.run(cls.check_multiple_staleness_async(vms, **kwargs))
 
     def check_data_staleness(self, 
         bu_path: Optional[Path] = None, 
         dtfmt: Optional[str] = None
     ) -> bool:
        
-        if self.boletim_urna is None:
+        # sem acessar `boletim_urna`: não decodifica um boletim pendente (ver `processa_bu_sob_demanda`)
+        if not self._tem_boletim():
             return True
         
         # data e hora no boletim de urna local
@@ -402,19 +3782,75 @@ class VotingMachine:
 
         # data e hora informados pela API do TSE
         url_info = self.get_url_info_urna()
-        restapi = get_rl(url_info)
-        jsondata = restapi.json()
+        jsondata = cache_aux.get_json(url_info)
 
-        _, dt_hash_remoto = self.get_hash_dtrefresh(
-            hashdict = jsondata['hashes'][0],
-            dtfmt = dtfmt
-        )
+        return self._compara_hash_dt(jsondata, dtfmt)
+
+    async def check_data_staleness_async(self, 
+        dtfmt: Optional[str] = None,
+        client: Optional[TSEClient] = None
+    ) -> bool:
+
+        if not self._tem_boletim() or self.hash_dt is None:
+            return True
+        
+        url_info = self.get_url_info_urna()
+        jsondata = await cache_aux.get_json_async(url_info, client)
+
+        return self._compara_hash_dt(jsondata, dtfmt)
+
+    def _tem_boletim(self) -> bool:
+        # boletim decodificado ou pendente de decodificação
+        return self._boletim_urna is not None or self._boletim_pendente is not None
+
+    def _compara_hash_dt(self, jsondata: Dict, dtfmt: Optional[str] = None) -> bool:
+        # compara data e hora da hash local com a informada pela API do TSE
+        hash_remoto, dt_hash_remoto = self._registra_info_urna(jsondata, dtfmt = dtfmt)
         
-        if dt_hash_remoto > dt_hash_local:
+        if dt_hash_remoto > self.hash_dt:
+            # o próximo download deve usar a hash nova
+            self.hash_urna, self.hash_dt = hash_remoto, dt_hash_remoto
             return True
         else:
             return False
 
+    def _registra_info_urna(self, jsondata: Dict, dtfmt: Optional[str] = None) -> tuple[str, dt]:
+        # lê hash e data de atualização do JSON auxiliar e registra no índice persistente
+        hashdict = jsondata['hashes'][0]
+        hash_urna, hash_dt = self.get_hash_dtrefresh(
+            hashdict = hashdict,
+            dtfmt = dtfmt
+        )
+
+        if self.hash_index is not None:
+            self.hash_index.registra(self, 
+                hash_urna = hash_urna, 
+                hash_dt = hash_dt, 
+                arquivos = hashdict.get('nmarq'),
+                etag = self.aux_etag,
+                last_modified = self.aux_last_modified
+            )
+        
+        return hash_urna, hash_dt
+
+    def _aplica_hash_index(self, info: Dict) -> None:
+        self.hash_urna = info['hash']
+        self.hash_dt = info['hash_dt']
+        self.aux_etag = info['etag']
+        self.aux_last_modified = info['last_modified']
+
+    def _consulta_hash_index(self) -> bool:
+        # preenche a hash a partir do índice persistente, se houver
+        if self.hash_index is None:
+            return False
+        
+        info = self.hash_index.consulta(self)
+        if info is None:
+            return False
+        
+        self._aplica_hash_index(info)
+        return True
+
     def get_url_info_urna(self, 
         ano: Optional[int] = None, pleito: Optional[int] = None, 
         regiao: Optional[str] = None, 
@@ -524,12 +3960,10 @@ class VotingMachine:
         if secao is None:
             secao = self.section.id
         if hash_urna is None:
-            if self.hash_urna is None:
+            if self.hash_urna is None and not self._consulta_hash_index():
                 url_info_urna = self.get_url_info_urna()
-                jsondata = get_rl(url_info_urna).json()
-                hash_urna, hash_dt = self.get_hash_dtrefresh(
-                    hashdict = jsondata['hashes'][0]
-                )
+                jsondata = cache_aux.get_json(url_info_urna)
+                hash_urna, hash_dt = self._registra_info_urna(jsondata)
                 
                 self.hash_urna = hash_urna
                 self.hash_dt = hash_dt
@@ -560,6 +3994,19 @@ class VotingMachine:
         
         return url_final
 
+    async def get_url_download_urna_async(self, info: str, hash_urna: Optional[str] = None,
+        client: Optional[TSEClient] = None,
+        **kwargs
+    ) -> str:
+        """versão assíncrona de `get_url_download_urna`: a hash da urna, se necessária, é obtida pelo cliente assíncrono."""
+
+        if hash_urna is None and self.hash_urna is None and not self._consulta_hash_index():
+            url_info_urna = self.get_url_info_urna()
+            jsondata = await cache_aux.get_json_async(url_info_urna, client)
+            self.hash_urna, self.hash_dt = self._registra_info_urna(jsondata)
+        
+        return self.get_url_download_urna(info = info, hash_urna = hash_urna, **kwargs)
+
     def get_info_download_path(self, caminho_dl_root: Optional[Path] = None):
         secao = self.section
         secao_url = f'{str(secao.id):0>4s}'
@@ -595,162 +4042,110 @@ class VotingMachine:
 
         url_dl = self.get_info_download_url(url_dl = url_dl)
 
-        # caminho download
-        caminho_dl = self.get_info_download_path(caminho_dl_root)
+        # caminho download (arquivo já presente para a mesma hash é reaproveitado)
+        bu_path = self.bu_store.obtem(self, url_dl, caminho_dl_root)
 
-        try:
-            # os.makedirs(
-            #     name = caminho_dl, 
-            #     mode = 0o774,
-            #     exist_ok = True
-            # )
-            caminho_dl.mkdir(mode = 0o774, parents = True, exist_ok = True)
-        except FileExistsError:
-            pass
-        
+        return bu_path
 
-        bu_path = caminho_dl.joinpath(Path(Path(url_dl).name))
-        
-        if bu_path.exists():
-            bu_path.unlink()
-        
-        wget.download(
-            url = url_dl, 
-            out = str(caminho_dl)
-        )
+    async def download_bu_async(self, 
+        url_dl: Optional[str] = None,
+        caminho_dl_root: Optional[Path] = None,
+        client: Optional[TSEClient] = None
+    ) -> Path:
+        """versão assíncrona de `download_bu`."""
 
-        return bu_path
+        async def download(client: TSEClient) -> Path:
+            if url_dl is None:
+                url = await self.get_url_download_urna_async(info = 'bu', client = client)
+            else:
+                url = url_dl
+            
+            return await self.bu_store.obtem_async(self, url, client, caminho_dl_root)
+
+        return await _with_client(client, download)
 
     def processa_bu(self,
         bu_path: Optional[Path] = None, 
-        asn1_paths: List = ASN1_PATHS
+        asn1_paths: List = ASN1_PATHS,
+        projecao: Optional[ProjecaoBU] = None
     ):
+        """decodifica o boletim da urna (ver `decodifica_bu`).
+
+        Args:
+            bu_path (Path): caminho do arquivo .bu (default: `caminho_bu`)
+            asn1_paths (list): caminhos dos descritores ASN.1
+            projecao (ProjecaoBU): componentes do envelope e do boletim a decodificar (default: todos)
+
+        Returns:
+            tuple[dict, dict]: envelope (sem o conteúdo) e boletim de urna decodificados
+        """
+        if bu_path is None:
+            if self.caminho_bu is None:
+                raise ValueError('Caminho para arquivo do boletim da urna é indefinido!')
+            bu_path = self.caminho_bu
+
+        return decodifica_bu(bu_path, asn1_paths, projecao)
+
+    def processa_totais_bu(self, bu_path: Optional[Path | SegmentRef] = None) -> TotaisBU:
+        """decodifica apenas a identificação e os totais de votos do boletim (ver `decodifica_totais_bu`)."""
+
         if bu_path is None:
             if self.caminho_bu is None:
                 raise ValueError('Caminho para arquivo do boletim da urna é indefinido!')
             bu_path = self.caminho_bu
 
-        conv = asn1tools.compile_files(asn1_paths, codec="ber")
-        with open(bu_path, "rb") as file:
-            envelope_encoded = bytearray(file.read())
-        envelope_decoded = conv.decode("EntidadeEnvelopeGenerico", envelope_encoded)
-        bu_encoded = envelope_decoded["conteudo"]
-        del envelope_decoded["conteudo"]  # remove o conteúdo para não imprimir como array de bytes
-        bu_decoded = conv.decode("EntidadeBoletimUrna", bu_encoded)
+        return decodifica_totais_arquivo_bu(bu_path)
+
+    def processa_bu_sob_demanda(self, 
+        bu_path: Optional[Path | SegmentRef] = None,
+        asn1_paths: List = ASN1_PATHS,
+        projecao: Optional[ProjecaoBU] = None
+    ) -> None:
+        """descarta o boletim decodificado em memória; o boletim passa a ser decodificado de `bu_path` 
+        no primeiro acesso a `boletim_urna` ou `envelope_urna` (e fica sujeito aos limites de `memoria_boletins`).
+
+        Args:
+            bu_path (Path | SegmentRef): arquivo do boletim (default: `caminho_bu`)
+            asn1_paths (list): caminhos dos descritores ASN.1
+            projecao (ProjecaoBU): componentes do envelope e do boletim a decodificar (default: todos)
+        """
+        if bu_path is None:
+            if self.caminho_bu is None:
+                raise ValueError('Caminho para arquivo do boletim da urna é indefinido!')
+            bu_path = self.caminho_bu
 
-        return envelope_decoded, bu_decoded
+        self.envelope_urna = self.boletim_urna = None
+        self._boletim_pendente = bu_path
+        self._decodificacao = (asn1_paths, projecao)
+        self.stale_data = False
 
-    def check_download_process_bu(self, bu_path_root: Optional[Path] = None):
+    def check_download_process_bu(self, bu_path_root: Optional[Path] = None, sob_demanda: bool = True):
         self.stale_data = self.check_data_staleness()
         if self.stale_data:
             self.caminho_bu = self.download_bu(caminho_dl_root = bu_path_root)
-            self.envelope_urna, self.boletim_urna = self.processa_bu(self.caminho_bu)
+            if sob_demanda:
+                self.processa_bu_sob_demanda()
+            else:
+                self.envelope_urna, self.boletim_urna = self.processa_bu(self.caminho_bu)
         
         self.stale_data = False
 
-    def votos_urna_df(self, bu: Optional[Dict] = None) -> pd.DataFrame:
+    def votos_urna_df(self, bu: Optional[Dict] = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """monta as tabelas de votos por votável (`totalizacao`) e de comparecimento por eleição e tipo de cargo (`stats_df`).
+        O boletim é percorrido uma única vez, preenchendo arrays tipados pré-alocados 
+        (códigos de categoria para `tipo_voto`, `cargo`, `tipo_cargo` e `dominio`), e cada tabela é montada de uma só vez.
+
+        Args:
+            bu (dict): boletim de urna decodificado (default: `boletim_urna`)
+
+        Returns:
+            tuple[pd.DataFrame, pd.DataFrame]: `totalizacao` e `stats_df`
+        """
         
         if bu is None:
             bu = self.boletim_urna
 
-        votosdfs = []
-
-        identificacao = bu
-        resultados = bu['resultadosVotacaoPorEleicao']
-
-        eleicao_stats_dfs = []
-
-        # para cada eleicao (a eleicao para presidente tem numero diferente da dos outros)
-        for resultado in resultados:
-            id_eleicao = resultado['idEleicao']
-            eleitores_aptos = resultado['qtdEleitoresAptos']
-
-            resultados_votacao = resultado['resultadosVotacao']
-
-            # para eleicoes com voto majoritário e proporcional
-            for resultado_votacao in resultados_votacao:
-                tipo_cargo = resultado_votacao['tipoCargo']
-                eleitores_compareceram = resultado_votacao['qtdComparecimento']
-
-                eleicao_stats_df = pd.DataFrame(
-                    [ [ id_eleicao, tipo_cargo, eleitores_aptos, eleitores_compareceram ] ],
-                    columns = ['id_eleicao', 'tipo_cargo', 'eleitores_aptos', 'comparecimento']
-                )
-
-                eleicao_stats_dfs.append(eleicao_stats_df)
-
-                resultados_votacao_tipo = resultado_votacao['totaisVotosCargo']
-
-                # para cada cargo
-                for resultado_votacao_tipo in resultados_votacao_tipo:
-                    cargo = resultado_votacao_tipo['codigoCargo'][1]
-
-                    votos = resultado_votacao_tipo['votosVotaveis']
-
-                    id_votos = [ voto['identificacaoVotavel'] if 'identificacaoVotavel' in voto else {'partido': pd.NA, 'codigo': pd.NA} for voto in votos ]
-
-                    id_votos_df = pd.DataFrame(id_votos)
-                    votosdf = pd.DataFrame(votos)
-                    votosdf.drop(['assinatura', 'identificacaoVotavel'], inplace = True, axis = 'columns')
-                    votosdf = pd.concat([votosdf, id_votos_df], axis = 'columns') 
-
-                    # identificacao do voto
-                    votosdf['cargo'] = cargo
-                    votosdf['tipo_cargo'] = tipo_cargo
-                    votosdf['e_valido'] = ~votosdf['tipoVoto'].isin(['branco', 'nulo'])
-                    votosdf['id_eleicao'] = id_eleicao
-                    
-                    votosdfs.append(votosdf)
-        
-        # totalizacao das estatisticas
-        stats_df = pd.concat(eleicao_stats_dfs)
-
-        # totalizacao dos votos
-        totalizacao = pd.concat(votosdfs)
-
-        # dados de urna
-        localizacao = identificacao['identificacaoSecao']
-
-        stats_df['estado'] = self.section.zone.city.state.abbr
-        stats_df['id_municipio'] = localizacao['municipioZona']['municipio']
-        stats_df['zona'] = localizacao['municipioZona']['zona']
-        stats_df['secao'] = localizacao['secao']
-
-        totalizacao['id_municipio'] = localizacao['municipioZona']['municipio']
-        totalizacao['zona'] = localizacao['municipioZona']['zona']
-        totalizacao['secao'] = localizacao['secao']
-
-        # dominio do cargo (pais, estado, municipio)
-        # valores default
-        totalizacao['dominio'] = 'municipio'
-        totalizacao['dominio_local'] = totalizacao['id_municipio'].astype(str)
-        # mascaras para filtragem
-        mask_pais = totalizacao['cargo'] == 'presidente'
-        mask_estado = totalizacao['cargo'].str.startswith('deputado') | (totalizacao['cargo'] == 'senador')
-        # aplicacao da filtragem
-        totalizacao.loc[mask_pais, 'dominio'] = 'pais'
-        totalizacao.loc[mask_pais, 'dominio_local'] = 'br'
-        totalizacao.loc[mask_estado, 'dominio'] = 'estado'
-        totalizacao.loc[mask_estado, 'dominio_local'] = self.section.zone.city.state.abbr
-
-        # tipagem
-        totalizacao['tipoVoto'] = totalizacao['tipoVoto'].astype('category')
-        totalizacao['partido'] = totalizacao['partido'].astype(pd.Int8Dtype())
-        #totalizacao['codigo'] = pd.to_numeric(totalizacao['codigo']).astype(pd.Int16Dtype())
-        totalizacao['cargo'] = totalizacao['cargo'].astype('category')
-        totalizacao['tipo_cargo'] = totalizacao['tipo_cargo'].astype('category')
-        # totalizacao['id_municipio'] = totalizacao['id_municipio'].astype(pd.Int16Dtype())
-        # totalizacao['zona'] = totalizacao['zona'].astype(pd.Int16Dtype())
-        # totalizacao['secao'] = totalizacao['secao'].astype(pd.Int16Dtype())
-        totalizacao['dominio'] = totalizacao['dominio'].astype('category')
-        
-        # renomear colunas
-        totalizacao.rename({
-            'tipoVoto': 'tipo_voto',
-            'quantidadeVotos': 'qtd_votos'
-        }, axis = 'columns', inplace = True)
-
-        return totalizacao.reset_index(drop = True), stats_df
+        return tabelas_votos(*colunas_votos_bu(bu, self.section.zone.city.state.abbr))
 
     def __str__(self):
         if self.serial is not None:
@@ -773,6 +4168,242 @@ def total_votes(candidates: List[Candidate]):
     counter = Counter(candidates)
     return counter
 
+#%%
+# acompanhamento dos resultados parciais (dados-simplificados)
+@dataclass
+class FeedResultados:
+    state: State
+    cargo: str
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[bytes] = None  # hash do último conteúdo processado
+    ativo: bool = True
+    atualizado_em: Optional[dt] = None  # data e hora de geração informadas pelo TSE
+    intervalo: float = POLL_INTERVAL  # segundos até a próxima consulta (menor para feeds alterados recentemente)
+    requisicoes: int = 0
+    alteracoes: int = 0
+    erros: int = 0
+    error: Optional[Exception] = None
+
+@dataclass
+class DeltaVotos:
+    estado: str
+    cargo: str
+    numero: int
+    nome: str
+    votos_anteriores: int
+    votos: int
+    atualizado_em: Optional[dt] = None
+
+    @property
+    def delta(self) -> int:
+        return self.votos - self.votos_anteriores
+
+class AcompanhamentoResultados:
+    """acompanha os resultados parciais (`State.get_url_votos`) de vários estados e cargos com requisições condicionais,
+    mantendo a última contagem de cada candidato (`snapshot`) e emitindo as variações (`DeltaVotos`).
+
+    >>> acompanhamento = AcompanhamentoResultados(2022, 546, cargos = ['governador', 'senador'])
+    >>> async for deltas in acompanhamento.acompanha():
+    ...     print(acompanhamento.snapshot())
+    """
+
+    def __init__(self, ano: int, eleicao: int, 
+        cargos: Iterable[str],
+        states: Optional[Iterable[State]] = None,
+        intervalo: float = POLL_INTERVAL,
+        intervalo_max: Optional[float] = None,
+        controlador: Optional[ControladorTaxa] = None
+    ):
+        """
+        Args:
+            ano (int): ano da eleição
+            eleicao (int): número da eleição
+            cargos (Iterable[str]): cargos acompanhados (ver `State.get_url_votos`)
+            states (Iterable[State]): estados (default: todos os estados criados, `State.states`, um por sigla)
+            intervalo (float): segundos entre consultas de um feed alterado recentemente
+            intervalo_max (float): segundos entre consultas de um feed sem alterações (default: POLL_INTERVAL_FACTOR_MAX * intervalo)
+            controlador (ControladorTaxa): controlador das requisições (default: até POLL_MAX_CALLS req/s)
+        """
+        self.ano = ano
+        self.eleicao = eleicao
+        self.intervalo = intervalo
+        self.intervalo_max = POLL_INTERVAL_FACTOR_MAX * intervalo if intervalo_max is None else intervalo_max
+        self.controlador = ControladorTaxa(taxa_inicial = POLL_MAX_CALLS, taxa_max = POLL_MAX_CALLS) if controlador is None else controlador
+
+        unicos = {}
+        for state in (State.states if states is None else states):
+            unicos.setdefault(state.abbr, state)
+
+        self.feeds = [
+            FeedResultados(
+                state = state, cargo = cargo, url = state.get_url_votos(ano = ano, eleicao = eleicao, cargo = cargo), intervalo = intervalo
+            )
+            for state in unicos.values()
+            for cargo in cargos
+        ]
+        # (estado, cargo) -> número do candidato -> registro
+        self._candidatos: Dict[tuple, Dict[int, Dict]] = {}
+        self._resumos: Dict[tuple, Dict] = {}
+
+    async def atualiza(self, client: Optional[TSEClient] = None) -> List[DeltaVotos]:
+        """consulta todos os feeds ativos uma vez, em paralelo (primeiro os alterados recentemente); retorna as variações."""
+
+        async def atualiza_todos(client: TSEClient) -> List[DeltaVotos]:
+            feeds = sorted(( feed for feed in self.feeds if feed.ativo ), key = lambda feed: feed.intervalo)
+            deltas = await asyncio.gather(*[ self._consulta_feed(client, feed) for feed in feeds ])
+            return [ delta for deltas_feed in deltas for delta in deltas_feed ]
+
+        return await _with_client(client, atualiza_todos)
+
+    async def acompanha(self, client: Optional[TSEClient] = None) -> AsyncIterator[List[DeltaVotos]]:
+        """consulta os feeds continuamente (cada feed em sua própria tarefa);
+        entrega as variações de cada feed assim que são detectadas.
+
+        Yields:
+            list[DeltaVotos]: variações de um feed
+        """
+
+        if client is None:
+            async with TSEClient() as client:
+                async for deltas in self.acompanha(client):
+                    yield deltas
+            return
+
+        fila = asyncio.Queue()
+
+        async def acompanha_feed(feed: FeedResultados):
+            while feed.ativo:
+                inicio = time.monotonic()
+                deltas = await self._consulta_feed(client, feed)
+                if deltas:
+                    await fila.put(deltas)
+                await asyncio.sleep(max(0.0, feed.intervalo - (time.monotonic() - inicio)))
+
+        tarefas = [ asyncio.ensure_future(acompanha_feed(feed)) for feed in self.feeds if feed.ativo ]
+        try:
+            while not all(tarefa.done() for tarefa in tarefas) or not fila.empty():
+                try:
+                    yield await asyncio.wait_for(fila.get(), timeout = self.intervalo)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions = True)
+
+    def snapshot(self) -> pd.DataFrame:
+        """última contagem de votos de cada candidato, de todos os feeds."""
+        linhas = [ registro for candidatos in self._candidatos.values() for registro in candidatos.values() ]
+        colunas = ['estado', 'cargo', 'numero', 'nome', 'coligacao', 'votos', 'percentual', 'eleito', 'situacao', 'atualizado_em']
+        return pd.DataFrame(linhas, columns = colunas)
+
+    def resumo(self) -> pd.DataFrame:
+        """totais de cada feed (seções totalizadas, comparecimento, votos válidos, brancos e nulos)."""
+        colunas = ['estado', 'cargo', 'secoes_totalizadas', 'eleitores', 'comparecimento', 'validos', 'brancos', 'nulos', 'atualizado_em']
+        return pd.DataFrame(list(self._resumos.values()), columns = colunas)
+
+    async def _consulta_feed(self, client: TSEClient, feed: FeedResultados) -> List[DeltaVotos]:
+        feed.requisicoes += 1
+        try:
+            conteudo, etag, last_modified = await client.get_bytes_conditional(
+                feed.url, feed.etag, feed.last_modified, controlador = self.controlador
+            )
+        except aiohttp.ClientResponseError as e:
+            feed.erros += 1
+            feed.error = e
+            if e.status == 404:
+                feed.ativo = False
+            return []
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitoAberto) as e:
+            feed.erros += 1
+            feed.error = e
+            return []
+
+        if conteudo is None:
+            # 304: sem alteração
+            feed.intervalo = min(self.intervalo_max, feed.intervalo * 1.5)
+            return []
+
+        # conteúdo igual ao já processado (servidor sem validadores HTTP): não é interpretado
+        digest = hashlib.blake2b(conteudo, digest_size = 16).digest()
+        if digest == feed.digest:
+            feed.etag, feed.last_modified = etag, last_modified
+            feed.intervalo = min(self.intervalo_max, feed.intervalo * 1.5)
+            return []
+        
+        try:
+            deltas = self._processa_feed(feed, json.loads(conteudo))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            # JSON inválido ou fora do formato esperado: o conteúdo é interpretado novamente na próxima consulta
+            feed.erros += 1
+            feed.error = e
+            return []
+
+        feed.etag, feed.last_modified, feed.digest = etag, last_modified, digest
+        feed.intervalo = self.intervalo
+        feed.alteracoes += 1
+        feed.error = None
+        return deltas
+
+    def _processa_feed(self, feed: FeedResultados, jsondata: Dict) -> List[DeltaVotos]:
+        # interpreta todo o conteúdo antes de alterar o estado do acompanhamento 
+        # (um conteúdo inválido não deixa `snapshot` e `resumo` atualizados pela metade)
+        estado, cargo = feed.state.abbr, feed.cargo
+        atualizado_em = _data_hora_tse(jsondata.get('dg'), jsondata.get('hg'))
+
+        resumo = {
+            'estado': estado, 'cargo': cargo,
+            'secoes_totalizadas': _numero_tse(jsondata.get('pst'), float),
+            'eleitores': _numero_tse(jsondata.get('e')),
+            'comparecimento': _numero_tse(jsondata.get('c')),
+            'validos': _numero_tse(jsondata.get('vv')),
+            'brancos': _numero_tse(jsondata.get('vb')),
+            'nulos': _numero_tse(jsondata.get('tvn')),
+            'atualizado_em': atualizado_em,
+        }
+
+        candidatos_anteriores = self._candidatos.get((estado, cargo), {})
+        candidatos = dict(candidatos_anteriores)
+        deltas = []
+        for cand in jsondata.get('cand', []):
+            numero = int(cand['n'])
+            votos = _numero_tse(cand.get('vap'))
+            anterior = candidatos_anteriores.get(numero)
+            votos_anteriores = 0 if anterior is None else anterior['votos']
+
+            candidatos[numero] = {
+                'estado': estado, 'cargo': cargo, 'numero': numero, 
+                'nome': cand.get('nm'), 'coligacao': cand.get('cc'),
+                'votos': votos, 'percentual': _numero_tse(cand.get('pvap'), float),
+                'eleito': cand.get('e') == 's', 'situacao': cand.get('st'),
+                'atualizado_em': atualizado_em,
+            }
+
+            if anterior is None or votos != votos_anteriores:
+                deltas.append(DeltaVotos(
+                    estado = estado, cargo = cargo, numero = numero, nome = cand.get('nm'),
+                    votos_anteriores = votos_anteriores, votos = votos, atualizado_em = atualizado_em
+                ))
+
+        feed.atualizado_em = atualizado_em
+        self._resumos[(estado, cargo)] = resumo
+        self._candidatos[(estado, cargo)] = candidatos
+        return deltas
+
+def _numero_tse(valor: Optional[str], tipo = int):
+    # números dos JSONs do TSE: texto, com vírgula decimal ('58,67'), ou vazio
+    if valor is None or valor == '':
+        return tipo(0)
+    return tipo(str(valor).replace(',', '.'))
+
+def _data_hora_tse(data: Optional[str], hora: Optional[str]) -> Optional[dt]:
+    try:
+        return dt.strptime(f'{data} {hora}', '%d/%m/%Y %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
 #%% 
 # main
 if __name__ == "__main__":